@@ -64,9 +64,15 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialisation du système (avec cache pour performance)
-@st.cache_resource
-def init_systeme():
+def _mtime(chemin):
+    """Date de modification d'un fichier (0 s'il n'existe pas), pour les clés de cache"""
+    return os.path.getmtime(chemin) if os.path.exists(chemin) else 0
+
+TRAITEMENTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traitements.json')
+
+# Initialisation du système (avec cache pour performance, reconstruit si les traitements ont changé sur disque)
+@st.cache_resource(max_entries=1)
+def init_systeme(mtime_traitements=0):
     return SystemeDecision()
 
 # Fonction pour sauvegarder le stade d'une parcelle
@@ -123,7 +129,7 @@ with st.sidebar:
     st.markdown("---")
 
     try:
-        systeme = init_systeme()
+        systeme = init_systeme(_mtime(TRAITEMENTS_FILE))
         systeme.config.load_config()
         st.success(f"✅ {len(systeme.config.parcelles)} parcelles configurées")
         st.success(f"✅ {systeme.config.surface_totale:.1f} ha total")
@@ -138,7 +144,7 @@ with st.sidebar:
 
 # Main content
 try:
-    systeme = init_systeme()
+    systeme = init_systeme(_mtime(TRAITEMENTS_FILE))
 
     col_date, col_refresh = st.columns([3, 1])
     with col_date:
@@ -164,11 +170,9 @@ try:
         }
 
         # Analyser toutes les parcelles une seule fois pour obtenir les GDD
-        analyses_parcelles = {}
         with st.spinner("Calcul des Risques et GDD (DJC)..."):
-            for parcelle in systeme.config.parcelles:
-                # On lance l'analyse complète (nécessaire pour les alertes)
-                analyses_parcelles[parcelle['nom']] = systeme.analyser_parcelle(parcelle['nom'], utiliser_ipi=afficher_ipi, debug=False)
+            # On lance l'analyse complète (nécessaire pour les alertes)
+            analyses_parcelles = systeme.analyser_toutes_parcelles(utiliser_ipi=afficher_ipi, debug=False)
 
         cols_stades = st.columns(len(systeme.config.parcelles))
 
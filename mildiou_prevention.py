@@ -12,20 +12,79 @@ Version finale complète avec :
 
 import json
 import csv
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+import contextlib
+import importlib.util
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, date
+from functools import lru_cache, partial
+from typing import Dict, List, Tuple, Optional, TextIO, Union
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import sys
+import time
 
-# Bibliothèques optionnelles pour graphiques
-try:
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    GRAPHIQUES_DISPONIBLES = True
-except ImportError:
-    GRAPHIQUES_DISPONIBLES = False
-    # print("⚠️  matplotlib non installé - Graphiques désactivés")
-    # print("   Pour activer : pip install matplotlib")
+# Bibliothèques optionnelles pour graphiques (import différé au premier graphique)
+GRAPHIQUES_DISPONIBLES = importlib.util.find_spec('matplotlib') is not None
+# print("⚠️  matplotlib non installé - Graphiques désactivés")
+# print("   Pour activer : pip install matplotlib")
+plt = None
+mdates = None
+
+
+def _charger_matplotlib() -> bool:
+    """Importe matplotlib au premier graphique (backend Agg : sortie fichier, sans interface)"""
+    global plt, mdates
+    if plt is None:
+        try:
+            import matplotlib
+            if 'matplotlib.pyplot' not in sys.modules:
+                matplotlib.use('Agg')
+            import matplotlib.pyplot as _plt
+            import matplotlib.dates as _mdates
+        except ImportError:
+            return False
+        plt, mdates = _plt, _mdates
+    return True
+
+# Répertoire du module : les fichiers de données sont toujours cherchés à côté du script
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Sérialisation JSON des fichiers de données (json standard)
+def _json_numpy(obj):
+    """Scalaires / tableaux NumPy issus des calculs vectorisés → types Python"""
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return obj.tolist()
+    raise TypeError(f"Type non sérialisable : {type(obj).__name__}")
+
+
+def _dumps_json(obj) -> bytes:
+    return json.dumps(obj, indent=2, ensure_ascii=False, default=_json_numpy).encode('utf-8')
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(date_str: str) -> date:
+    """Convertit une date ISO 'AAAA-MM-JJ' en objet date (mis en cache, évite strptime)"""
+    return date.fromisoformat(date_str)
+
+
+# Seuils des barèmes de risque (recherche par np.searchsorted, sans cascade de if)
+_PLUIE_SEUILS = np.array([2, 5, 10], dtype=np.float64)
+_PLUIE_SCORES = np.array([0, 1, 3, 5], dtype=np.float64)
+_TEMP_SEUILS_BAS = np.array([10, 15, 20], dtype=np.float64)    # bornes basses incluses
+_TEMP_SEUILS_HAUTS = np.array([25, 28, 30], dtype=np.float64)  # bornes hautes incluses
+_TEMP_SCORES = np.array([0, 1, 2, 4], dtype=np.float64)
+_IPI_SEUILS = np.array([30, 60], dtype=np.float64)
+_IPI_NIVEAUX = ('FAIBLE', 'MOYEN', 'FORT')
+_HUMECT_PLUIE_SEUILS = np.array([2, 5], dtype=np.float64)          # pluie (mm), bornes basses incluses
+_HUMECT_PLUIE_FACTEURS = np.array([0.0, 0.8, 1.2], dtype=np.float64)  # heures d'humectation par mm
+_HUMECT_HUMID_SEUILS = np.array([80, 90], dtype=np.float64)        # humidité (%), bornes strictes
+_HUMECT_HUMID_FACTEURS = np.array([1.0, 1.1, 1.3], dtype=np.float64)
 
 
 class ConfigVignoble:
@@ -55,8 +114,7 @@ class ConfigVignoble:
 
     def __init__(self, config_file: str = 'config_vignoble.json'):
         # Toujours chercher le fichier dans le répertoire du script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        self.config_file = os.path.join(script_dir, config_file)
+        self.config_file = os.path.join(_SCRIPT_DIR, config_file)
         self.load_config()
 
     def load_config(self):
@@ -73,6 +131,7 @@ class ConfigVignoble:
                 self.parcelles = config['parcelles']
                 self.parametres = config.get('parametres', {}) # Charger les paramètres (pour RFU)
                 self.surface_totale = sum(p['surface_ha'] for p in self.parcelles)
+                self._indexer_parcelles()
                 print(f"✅ Configuration chargée depuis : {self.config_file}")
         except FileNotFoundError:
             print(f"⚠️ Fichier de configuration non trouvé : {self.config_file}")
@@ -106,14 +165,28 @@ class ConfigVignoble:
                 "t_base_gdd": 10.0
             }
         }
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
+        with open(self.config_file, 'wb') as f:
+            f.write(_dumps_json(config))
 
         self.latitude = config['latitude']
         self.longitude = config['longitude']
         self.parcelles = config['parcelles']
         self.parametres = config['parametres']
         self.surface_totale = sum(p['surface_ha'] for p in self.parcelles)
+        self._indexer_parcelles()
+
+    def _indexer_parcelles(self):
+        """
+        Précalcule, à chaque chargement, l'accès par nom aux parcelles (et le tuple des noms, pour
+        les listes de sélection) et la sensibilité moyenne de leurs cépages (hors fichier JSON). Le coefficient de stade n'est pas figé ici :
+        le stade change en cours de session.
+        """
+        self.parcelles_par_nom = {p['nom']: p for p in self.parcelles}
+        self.noms_parcelles = tuple(self.parcelles_par_nom)
+        self.sensibilites_moy = {
+            p['nom']: sum(self.SENSIBILITES_CEPAGES.get(c, 5) for c in p['cepages']) / len(p['cepages'])
+            for p in self.parcelles
+        }
 
     def sauvegarder_config(self):
         """Sauvegarde la configuration actuelle dans le fichier JSON"""
@@ -131,8 +204,8 @@ class ConfigVignoble:
         except FileNotFoundError:
             pass
 
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(config_a_sauver, f, indent=2, ensure_ascii=False)
+        with open(self.config_file, 'wb') as f:
+            f.write(_dumps_json(config_a_sauver))
 
     def update_parcelle_stade_et_date(self, nom_parcelle: str, nouveau_stade: str, date_debourrement: Optional[str] = None) -> bool:
         """
@@ -142,33 +215,44 @@ class ConfigVignoble:
              print(f"⚠️ Stade '{nouveau_stade}' inconnu. Mise à jour annulée.")
              return False
 
-        for parcelle in self.parcelles:
-            if parcelle['nom'] == nom_parcelle:
-                parcelle['stade_actuel'] = nouveau_stade
-                if nouveau_stade == 'debourrement' and date_debourrement:
-                    parcelle['date_debourrement'] = date_debourrement
-                    print(f"✅ Date de débourrement (biofix GDD) enregistrée pour '{parcelle['nom']}' : {date_debourrement}")
-                elif nouveau_stade == 'repos':
-                    parcelle['date_debourrement'] = None
-                self.sauvegarder_config()
-                return True
+        parcelle = self.parcelles_par_nom.get(nom_parcelle)
+        if parcelle is None:
+            print(f"❌ Parcelle '{nom_parcelle}' non trouvée.")
+            return False
 
-        print(f"❌ Parcelle '{nom_parcelle}' non trouvée.")
-        return False
+        parcelle['stade_actuel'] = nouveau_stade
+        if nouveau_stade == 'debourrement' and date_debourrement:
+            parcelle['date_debourrement'] = date_debourrement
+            print(f"✅ Date de débourrement (biofix GDD) enregistrée pour '{parcelle['nom']}' : {date_debourrement}")
+        elif nouveau_stade == 'repos':
+            parcelle['date_debourrement'] = None
+        self.sauvegarder_config()
+        return True
 
 
 class MeteoAPI:
     """Gestion des données météorologiques via Open-Meteo (gratuit)"""
 
+    CACHE_TTL_S = 3600  # Durée de validité du cache (secondes)
+    VARIABLES_JOUR = 'temperature_2m_max,temperature_2m_min,precipitation_sum,relative_humidity_2m_mean,et0_fao_evapotranspiration'
+    # Cache partagé entre instances : {clé: (horodatage, données formatées, ETag)}
+    _cache: Dict[tuple, Tuple[float, Dict, Optional[str]]] = {}
+
     def __init__(self, latitude: float, longitude: float):
         self.latitude = latitude
         self.longitude = longitude
         self.base_url = "https://api.open-meteo.com/v1/forecast"
+        # Session persistante : connexions TCP/TLS réutilisées et relances automatiques
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4,
+                              max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]))
+        self._session.mount('https://', adapter)
 
-    def get_meteo_data(self, days_past: int = 14, days_future: int = 7) -> Dict:
+    def get_meteo_data(self, days_past: int = 14, days_future: int = 7, forcer: bool = False) -> Dict:
         """
         Récupère les données météo passées (max 90j) et futures.
         Demande l'ETP Penman-Monteith (et0_fao_evapotranspiration).
+        forcer : ignore la durée de validité du cache (la requête reste conditionnelle via l'ETag).
         """
 
         if days_past > 90:
@@ -179,23 +263,45 @@ class MeteoAPI:
         params = {
             'latitude': self.latitude,
             'longitude': self.longitude,
-            'daily': 'temperature_2m_max,temperature_2m_min,precipitation_sum,relative_humidity_2m_mean,et0_fao_evapotranspiration',
+            'daily': self.VARIABLES_JOUR,
             'timezone': 'Europe/Paris',
             'past_days': days_past_api,
             'forecast_days': days_future
         }
 
+        cle = (self.latitude, self.longitude, days_past_api, days_future, datetime.now().date().isoformat())
+        entree = self._cache.get(cle)
+        if entree and not forcer and time.monotonic() - entree[0] < self.CACHE_TTL_S:
+            return entree[1]
+
+        headers = {'If-None-Match': entree[2]} if entree and entree[2] else {}
+
         try:
-            response = requests.get(self.base_url, params=params, timeout=10)
+            response = self._session.get(self.base_url, params=params, headers=headers, timeout=10)
+            if response.status_code == 304 and entree:
+                # Données inchangées côté serveur : on prolonge le cache
+                self._mettre_en_cache(cle, (time.monotonic(), entree[1], entree[2]))
+                return entree[1]
             response.raise_for_status()
             data = response.json()
 
-            return self._format_meteo_data(data)
+            formatted = self._format_meteo_data(data)
+            if formatted:
+                self._mettre_en_cache(cle, (time.monotonic(), formatted, response.headers.get('ETag')))
+            return formatted
 
         except requests.RequestException as e:
             print(f"❌ Erreur lors de la récupération des données météo: {e}")
             return {}
 
+    @classmethod
+    def _mettre_en_cache(cls, cle: tuple, entree: Tuple[float, Dict, Optional[str]]):
+        """Enregistre une réponse et purge celles des jours précédents (clé terminée par la date) :
+        le cache partagé ne grandit pas d'un jour à l'autre dans un processus de longue durée"""
+        for ancienne in [c for c in list(cls._cache) if c[-1] != cle[-1]]:
+            cls._cache.pop(ancienne, None)
+        cls._cache[cle] = entree
+
     def _format_meteo_data(self, raw_data: Dict) -> Dict:
         """Formate les données brutes de l'API"""
         daily = raw_data.get('daily', {})
@@ -226,8 +332,89 @@ class MeteoAPI:
         return formatted
 
 
+class MeteoSeries:
+    """
+    Vue en colonnes (struct-of-arrays) de l'historique météo {date: {...}}.
+    Dates triées + un tableau NumPy float64 par variable (NaN si donnée absente) :
+    en float32, 3.4 + 8.6 mm ne vaut plus exactement 12 et les seuils de lessivage basculent.
+    """
+    DTYPE = np.float64
+    DECIMALES_SOMME = 6  # Arrondi des différences de sommes préfixes (bruit d'arrondi, pas les décimales des mesures)
+    CHAMPS = ('temp_moy', 'temp_max', 'temp_min', 'precipitation', 'humidite', 'etp', 'gdd_jour')
+
+    def __init__(self, meteo: Dict[str, Dict]):
+        self.dates: List[str] = sorted(meteo)
+        self.index: Dict[str, int] = {d: i for i, d in enumerate(self.dates)}
+        for champ in self.CHAMPS:
+            valeurs = [(meteo[d] or {}).get(champ) for d in self.dates]
+            setattr(self, champ, np.array([np.nan if v is None else v for v in valeurs], dtype=self.DTYPE))
+        self._cumuls: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def cumul(self, champ: str) -> np.ndarray:
+        """Sommes préfixes (cumul[i] = somme des i premiers jours), calculées une fois par variable"""
+        if champ not in self._cumuls:
+            valeurs = np.nan_to_num(getattr(self, champ), nan=0.0)
+            self._cumuls[champ] = np.concatenate(([0.0], np.cumsum(valeurs, dtype=np.float64)))
+        return self._cumuls[champ]
+
+    def somme_indices(self, champ: str, debut, fin):
+        """Somme des jours [debut, fin[ (indices scalaires ou tableaux) par différence des sommes préfixes,
+        arrondie pour que 3.4 + 8.6 reste égal à 12 quel que soit le cumul qui précède"""
+        cumul = self.cumul(champ)
+        return np.round(cumul[fin] - cumul[debut], self.DECIMALES_SOMME)
+
+    def somme(self, champ: str, date_debut: str, date_fin: str) -> float:
+        """Somme d'une variable entre deux dates incluses (données manquantes ignorées), en O(log N)"""
+        return float(self.somme_indices(champ, bisect_left(self.dates, date_debut), bisect_right(self.dates, date_fin)))
+
+
 class ModeleSimple:
     """Modèle simplifié basé sur la règle des 3-10 améliorée"""
+    @staticmethod
+    def calculer_risque_lot(pluie_totale, temp_moy, humid_moy, stade_coef, sensibilite_cepage) -> np.ndarray:
+        """
+        Score de risque vectorisé (scalaires ou tableaux NumPy, diffusés entre eux).
+        Permet de rejouer une campagne entière (jours × parcelles) en un seul appel.
+        """
+        pluie = np.asarray(pluie_totale, dtype=np.float64)
+        temp = np.asarray(temp_moy, dtype=np.float64)
+        humid = np.asarray(humid_moy, dtype=np.float64)
+        score_base = _PLUIE_SCORES[np.searchsorted(_PLUIE_SEUILS, pluie, side='right')]
+        # Fenêtre de température : rang le plus faible entre la borne basse franchie et la borne haute
+        rang_bas = np.searchsorted(_TEMP_SEUILS_BAS, temp, side='right')
+        rang_haut = len(_TEMP_SEUILS_HAUTS) - np.searchsorted(_TEMP_SEUILS_HAUTS, temp, side='left')
+        score_base = score_base + _TEMP_SCORES[np.minimum(rang_bas, rang_haut)]
+        score_base = score_base + (humid > 85)
+        score_final = score_base * np.asarray(stade_coef, dtype=np.float64) * (np.asarray(sensibilite_cepage, dtype=np.float64) / 5)
+        return np.minimum(10.0, score_final)
+
+    @staticmethod
+    def calculer_risque_glissant(pluie: np.ndarray, temp_moy: np.ndarray, humidite: np.ndarray,
+                                 stade_coef: float, sensibilite_cepage: float, fenetre: int = 3) -> np.ndarray:
+        """
+        Score de risque sur fenêtres glissantes de `fenetre` jours calendaires consécutifs
+        (NaN = jour ou donnée absent). Le résultat i correspond à la fenêtre finissant au jour i + fenetre - 1.
+        Même règle que calculer_risque_infection, appliquée à toutes les fenêtres d'un coup.
+        """
+        p = sliding_window_view(np.asarray(pluie, dtype=np.float64), fenetre)
+        t = sliding_window_view(np.asarray(temp_moy, dtype=np.float64), fenetre)
+        h = sliding_window_view(np.asarray(humidite, dtype=np.float64), fenetre)
+        pluie_totale = np.nansum(p, axis=1)
+        t_ok = ~np.isnan(t)
+        humides = (p > 1) & t_ok
+        nb_humides = humides.sum(axis=1)
+        # Température moyenne des jours pluvieux (> 1 mm) s'il y en a, sinon de tous les jours
+        masque_t = np.where(nb_humides[:, None] > 0, humides, t_ok)
+        nb_t = masque_t.sum(axis=1)
+        temp = np.where(masque_t, t, 0.0).sum(axis=1) / np.maximum(nb_t, 1)
+        nb_h = (~np.isnan(h)).sum(axis=1)
+        humid = np.nansum(h, axis=1) / np.maximum(nb_h, 1)
+        scores = ModeleSimple.calculer_risque_lot(pluie_totale, temp, humid, stade_coef, sensibilite_cepage)
+        return np.where((nb_t > 0) & (nb_h > 0), scores, 0.0)
+
     @staticmethod
     def calculer_risque_infection(meteo_48h: List[Dict], stade_coef: float,
                                    sensibilite_cepage: float) -> Tuple[float, str]:
@@ -241,19 +428,10 @@ class ModeleSimple:
             temp_moy = sum(m['temp_moy'] for m in jours_humides) / len(jours_humides)
         else:
             temp_moy = sum(temp_moy_list) / len(temp_moy_list)
-        score_base = 0
-        if pluie_totale >= 10: score_base += 5
-        elif pluie_totale >= 5: score_base += 3
-        elif pluie_totale >= 2: score_base += 1
-        if 20 <= temp_moy <= 25: score_base += 4
-        elif 15 <= temp_moy <= 28: score_base += 2
-        elif 10 <= temp_moy <= 30: score_base += 1
         humid_moy_list = [m.get('humidite') for m in meteo_48h if m and m.get('humidite') is not None]
         if not humid_moy_list: return 0.0, "FAIBLE"
         humid_moy = sum(humid_moy_list) / len(humid_moy_list)
-        if humid_moy > 85: score_base += 1
-        score_final = score_base * stade_coef * (sensibilite_cepage / 5)
-        score_final = min(10, score_final)
+        score_final = float(ModeleSimple.calculer_risque_lot(pluie_totale, temp_moy, humid_moy, stade_coef, sensibilite_cepage))
         if score_final >= 7: niveau = "FORT"
         elif score_final >= 4: niveau = "MOYEN"
         else: niveau = "FAIBLE"
@@ -303,10 +481,8 @@ class ModeleIPI:
     def estimer_duree_humectation(precipitation: float, humidite: float) -> float:
         if precipitation is None or humidite is None: return 0
         if precipitation < 2: return 0
-        if precipitation < 5: duree_base = precipitation * 0.8
-        else: duree_base = precipitation * 1.2
-        if humidite > 90: duree_base *= 1.3
-        elif humidite > 80: duree_base *= 1.1
+        duree_base = precipitation * float(_HUMECT_PLUIE_FACTEURS[np.searchsorted(_HUMECT_PLUIE_SEUILS, precipitation, side='right')])
+        duree_base *= float(_HUMECT_HUMID_FACTEURS[np.searchsorted(_HUMECT_HUMID_SEUILS, humidite, side='left')])
         return min(duree_base, 24)
 
 
@@ -371,7 +547,7 @@ class ModeleBilanHydrique:
         dates_historique = sorted(meteo_historique.keys())
 
         for date_str in dates_historique:
-            date_meteo = datetime.strptime(date_str, '%Y-%m-%d').date()
+            date_meteo = _parse_date(date_str)
 
             # Ne calculer que pour la saison de croissance
             if date_meteo >= date_debut and date_meteo <= aujourdhui:
@@ -428,9 +604,50 @@ class GestionTraitements:
         'floraison': 1.0, 'nouaison': 0.8, 'fermeture_grappe': 0.5, 'veraison': 0.2, 'maturation': 0.1
     }
     def __init__(self, fichier_historique: str = 'traitements.json'):
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        self.fichier = os.path.join(script_dir, fichier_historique)
+        self.fichier = os.path.join(_SCRIPT_DIR, fichier_historique)
         self.historique = self.charger_historique()
+        self._index_parcelles = self._construire_index()
+        self._df = pd.DataFrame([self._ligne_colonnes(t)[:-1] for t in self.historique['traitements']], columns=self.COLONNES[:-1])
+        self._df['jour'] = pd.to_datetime(self._df['date'], format='%Y-%m-%d', errors='coerce', cache=True)  # un seul parsing vectorisé
+    def _construire_index(self) -> Dict[str, Tuple[List[str], List[Dict]]]:
+        """Index {parcelle: (dates triées, traitements)} pour la recherche par bisect"""
+        index: Dict[str, Tuple[List[str], List[Dict]]] = {}
+        for t in sorted(self.historique['traitements'], key=lambda x: x['date']):
+            dates, recs = index.setdefault(t['parcelle'], ([], []))
+            dates.append(t['date'])
+            recs.append(t)
+        return index
+    COLONNES = ['date', 'parcelle', 'dose', 'dose_ref', 'produit', 'jour']  # 'jour' : date typée pour les filtres
+    @staticmethod
+    def _ligne_colonnes(t: Dict) -> list:
+        """Ligne de la vue colonnes (date, parcelle, dose, dose_ref, produit, jour) d'un traitement"""
+        return [t['date'], t['parcelle'], t.get('dose_kg_ha', 0), t['caracteristiques'].get('dose_reference_kg_ha', 1.0), t['caracteristiques']['nom'], pd.Timestamp(t['date'])]
+    def _indexer_traitement(self, traitement: Dict):
+        self._df.loc[len(self._df)] = self._ligne_colonnes(traitement)
+        dates, recs = self._index_parcelles.setdefault(traitement['parcelle'], ([], []))
+        i = bisect_right(dates, traitement['date'])
+        dates.insert(i, traitement['date'])
+        recs.insert(i, traitement)
+    def traitements_periode(self, date_debut: str, date_fin: str, parcelle: Optional[str] = None) -> List[Dict]:
+        """Traitements entre deux dates incluses, d'une parcelle ou de toutes, triés par date (via l'index)"""
+        parcelles = [parcelle] if parcelle is not None else list(self._index_parcelles)
+        tranches = []
+        for nom in parcelles:
+            dates, recs = self._index_parcelles.get(nom, ([], []))
+            tranches.append(recs[bisect_left(dates, date_debut):bisect_right(dates, date_fin)])
+        if len(tranches) == 1:
+            return tranches[0]
+        # Tranches déjà triées : fusion au lieu d'un tri complet
+        return list(heapq.merge(*tranches, key=lambda t: t['date']))
+    def dates_traitements(self, parcelle: str) -> List[str]:
+        """Dates triées des traitements d'une parcelle (ne pas modifier la liste retournée)"""
+        return self._index_parcelles.get(parcelle, ([], []))[0]
+    def _series_meteo(self, meteo_periode: Union[Dict, MeteoSeries]) -> MeteoSeries:
+        """Vue MeteoSeries de la météo : passer une MeteoSeries évite de reconstruire la vue à chaque appel
+        (un dictionnaire est converti à chaque fois, ses valeurs pouvant changer en place)"""
+        if isinstance(meteo_periode, MeteoSeries):
+            return meteo_periode
+        return MeteoSeries(meteo_periode)
     def charger_historique(self) -> Dict:
         try:
             with open(self.fichier, 'r', encoding='utf-8') as f:
@@ -438,8 +655,8 @@ class GestionTraitements:
         except FileNotFoundError:
             return {'traitements': []}
     def sauvegarder_historique(self):
-        with open(self.fichier, 'w', encoding='utf-8') as f:
-            json.dump(self.historique, f, indent=2, ensure_ascii=False)
+        with open(self.fichier, 'wb') as f:
+            f.write(_dumps_json(self.historique))
     def ajouter_traitement(self, parcelle: str, date: str, produit: str, dose_kg_ha: Optional[float] = None):
         produit_key = produit.lower().replace(' ', '_')
         if produit_key not in self.FONGICIDES:
@@ -451,18 +668,16 @@ class GestionTraitements:
             dose_kg_ha = caracteristiques['dose_reference_kg_ha']
         traitement = {'parcelle': parcelle, 'date': date, 'produit': produit_key, 'dose_kg_ha': dose_kg_ha, 'caracteristiques': caracteristiques}
         self.historique['traitements'].append(traitement)
+        self._indexer_traitement(traitement)
         self.sauvegarder_historique()
         print(f"✅ Traitement '{caracteristiques['nom']}' ajouté pour '{parcelle}' le {date}")
-    def calculer_protection_actuelle(self, parcelle: str, date_actuelle: str, meteo_periode: Dict, stade_actuel: str) -> Tuple[float, Dict, str]:
-        traitements_parcelle = [t for t in self.historique['traitements'] if t['parcelle'] == parcelle]
-        if not traitements_parcelle:
+    def calculer_protection_actuelle(self, parcelle: str, date_actuelle: str, meteo_periode: Union[Dict, MeteoSeries], stade_actuel: str) -> Tuple[float, Dict, str]:
+        dates, recs = self._index_parcelles.get(parcelle, ([], []))
+        idx = bisect_right(dates, date_actuelle) - 1
+        if idx < 0:
             return 0.0, {}, "Aucun traitement"
-        dernier_traitement = max(traitements_parcelle, key=lambda x: x['date'])
-        date_trait = datetime.strptime(dernier_traitement['date'], '%Y-%m-%d')
-        date_act = datetime.strptime(date_actuelle, '%Y-%m-%d')
-        jours_ecoules = (date_act - date_trait).days
-        if jours_ecoules < 0:
-            return 10.0, dernier_traitement, "Traitement futur"
+        dernier_traitement = recs[idx]
+        jours_ecoules = (_parse_date(date_actuelle) - _parse_date(dernier_traitement['date'])).days
         carac = dernier_traitement['caracteristiques']
         persistance = carac.get('persistance_jours', 7)
         seuil_lessivage = carac.get('lessivage_seuil_mm', 25)
@@ -476,36 +691,70 @@ class GestionTraitements:
             if protection_pousse < protection:
                 protection = protection_pousse
                 facteur_limitant = "Pousse (dilution)"
-        pluie_depuis_traitement = sum(
-            meteo_periode.get(date, {}).get('precipitation', 0)
-            for date in meteo_periode
-            if date >= dernier_traitement['date'] and date <= date_actuelle
+        pluie_depuis_traitement = self._series_meteo(meteo_periode).somme(
+            'precipitation', dernier_traitement['date'], date_actuelle
         )
         if pluie_depuis_traitement > seuil_lessivage:
             protection = 0
             facteur_limitant = f"Lessivage ({pluie_depuis_traitement:.1f}mm)"
         return round(protection, 1), dernier_traitement, facteur_limitant
+    def calculer_protection_lot(self, parcelle: str, dates_analyse: List[str], meteo_periode: Union[Dict, MeteoSeries], stade_actuel: str) -> np.ndarray:
+        """Scores de protection (non arrondis) pour une liste de dates, même règle que calculer_protection_actuelle"""
+        dates_trait, recs = self._index_parcelles.get(parcelle, ([], []))
+        protection = np.zeros(len(dates_analyse))
+        if not dates_trait or not dates_analyse:
+            return protection
+        idx = np.searchsorted(np.array(dates_trait), np.array(dates_analyse), side='right') - 1
+        ok = idx >= 0
+        if not ok.any():
+            return protection
+        idx = idx[ok]
+        d_analyse = np.array(dates_analyse)[ok]
+        d_trait = np.array(dates_trait)[idx]
+        jours = (d_analyse.astype('datetime64[D]') - d_trait.astype('datetime64[D]')).astype(np.int64)
+        carac = [recs[i]['caracteristiques'] for i in idx]
+        persistance = np.array([c.get('persistance_jours', 7) for c in carac], dtype=np.float64)
+        seuil = np.array([c.get('lessivage_seuil_mm', 25) for c in carac], dtype=np.float64)
+        dilution = np.array([c.get('type', 'contact') in ['contact', 'penetrant'] for c in carac])
+        prot = np.maximum(0, 10 - (jours / persistance * 10))
+        coef_pousse = self.COEF_POUSSE.get(stade_actuel, 1.0)
+        prot = np.where(dilution, np.minimum(prot, np.maximum(0, 10 - (jours * coef_pousse))), prot)
+        series = self._series_meteo(meteo_periode)
+        dates_meteo = np.array(series.dates)
+        pluie = series.somme_indices('precipitation', np.searchsorted(dates_meteo, d_trait, side='left'),
+                                     np.searchsorted(dates_meteo, d_analyse, side='right'))
+        protection[ok] = np.where(pluie > seuil, 0.0, prot)
+        return protection
+    def colonnes_periode(self, date_debut: str, date_fin: str) -> pd.DataFrame:
+        """Vue colonnes (COLONNES) des traitements entre deux dates incluses"""
+        # Comparaison sur dates typées (une saisie invalide donne NaT, donc une période vide)
+        return self._df[self._df['jour'].between(pd.to_datetime(date_debut, errors='coerce'), pd.to_datetime(date_fin, errors='coerce'))]
     def calculer_ift_periode(self, date_debut: str, date_fin: str, surface_totale: float) -> Dict:
-        traitements_periode = [t for t in self.historique['traitements'] if date_debut <= t['date'] <= date_fin]
-        if not traitements_periode:
+        periode = self.colonnes_periode(date_debut, date_fin)
+        if periode.empty:
             return {'ift_total': 0.0, 'nb_traitements': 0, 'details': []}
-        ift_details = []
-        ift_total = 0.0
-        for t in traitements_periode:
-            dose_appliquee = t.get('dose_kg_ha', 0)
-            dose_reference = t['caracteristiques'].get('dose_reference_kg_ha', 1.0)
-            ift_traitement = dose_appliquee / dose_reference
-            ift_total += ift_traitement
-            ift_details.append({'date': t['date'], 'parcelle': t['parcelle'], 'produit': t['caracteristiques']['nom'], 'ift': round(ift_traitement, 2)})
-        return {'ift_total': round(ift_total, 2), 'nb_traitements': len(traitements_periode), 'details': ift_details, 'periode': f"{date_debut} à {date_fin}"}
+        ift = periode['dose'] / periode['dose_ref']
+        ift_details = [{'date': d, 'parcelle': p, 'produit': prod, 'ift': round(i, 2)}
+                       for d, p, prod, i in zip(periode['date'], periode['parcelle'], periode['produit'], ift.tolist())]
+        return {'ift_total': round(float(ift.sum()), 2), 'nb_traitements': len(periode), 'details': ift_details, 'periode': f"{date_debut} à {date_fin}"}
 
 
 class GestionHistoriqueAlertes:
     """Gestion de l'historique des alertes et analyses"""
     def __init__(self, fichier='historique_alertes.json'):
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        self.fichier = os.path.join(script_dir, fichier)
+        self.fichier = os.path.join(_SCRIPT_DIR, fichier)
         self.historique = self.charger_historique()
+        self._dirty = False
+        self._bulk = 0
+        self._construire_index()
+    def _construire_index(self):
+        """Index mémoire : année → campagne et (année, date, parcelle) → position de l'analyse"""
+        self._campagnes = {}
+        self._positions = {}
+        for c in self.historique['campagnes']:
+            self._campagnes.setdefault(c['annee'], c)
+            for i, a in enumerate(c['analyses']):
+                self._positions.setdefault((c['annee'], a['date'], a['parcelle']), i)
     def charger_historique(self):
         try:
             with open(self.fichier, 'r', encoding='utf-8') as f:
@@ -515,21 +764,34 @@ class GestionHistoriqueAlertes:
     def creer_structure_defaut(self):
         return {'campagnes': []}
     def sauvegarder(self):
-        with open(self.fichier, 'w', encoding='utf-8') as f:
-            json.dump(self.historique, f, indent=2, ensure_ascii=False)
+        if self._bulk > 0:
+            self._dirty = True
+            return
+        with open(self.fichier, 'wb') as f:
+            f.write(_dumps_json(self.historique))
+    @contextlib.contextmanager
+    def bulk(self):
+        """Diffère l'écriture disque jusqu'à la sortie du bloc : ajouter_analyse y devient O(1) amorti"""
+        self._bulk += 1
+        try:
+            yield self
+        finally:
+            self._bulk -= 1
+            if not self._bulk and self._dirty:
+                self._dirty = False
+                self.sauvegarder()
     def get_campagne(self, annee):
-        for c in self.historique['campagnes']:
-            if c['annee'] == annee: return c
-        return None
+        return self._campagnes.get(annee)
     def creer_campagne(self, annee):
         campagne = {'annee': annee, 'analyses': []}
         self.historique['campagnes'].append(campagne)
+        self._campagnes[annee] = campagne
         return campagne
 
     # --- MODIFIÉ : Pour inclure Oïdium, GDD et Bilan Hydrique ---
     def ajouter_analyse(self, analyse_complete):
         date_analyse = analyse_complete['date_analyse']
-        annee = datetime.strptime(date_analyse, '%Y-%m-%d').year
+        annee = _parse_date(date_analyse).year
         campagne = self.get_campagne(annee)
         if not campagne:
             campagne = self.creer_campagne(annee)
@@ -572,12 +834,12 @@ class GestionHistoriqueAlertes:
                 'pluie_3j': analyse_complete['previsions_3j']['pluie_totale']
             }
         }
-        analyses_existantes = [a for a in campagne['analyses']
-                               if a['date'] == date_analyse and a['parcelle'] == analyse_complete['parcelle']]
-        if analyses_existantes:
-            idx = campagne['analyses'].index(analyses_existantes[0])
+        cle = (annee, date_analyse, analyse_complete['parcelle'])
+        idx = self._positions.get(cle)
+        if idx is not None:
             campagne['analyses'][idx] = analyse_simplifiee
         else:
+            self._positions[cle] = len(campagne['analyses'])
             campagne['analyses'].append(analyse_simplifiee)
         self.sauvegarder()
 
@@ -602,22 +864,18 @@ class GestionHistoriqueAlertes:
         campagne = self.get_campagne(annee)
         if not campagne or not campagne['analyses']: return None
         analyses = campagne['analyses']
-        parcelles_stats = {}
-        for analyse in analyses:
-            parcelle = analyse['parcelle']
-            if parcelle not in parcelles_stats:
-                parcelles_stats[parcelle] = {'nb_analyses': 0, 'alertes_haute': 0, 'alertes_moyenne': 0, 'risque_moyen': 0, 'protection_moyenne': 0}
-            stats = parcelles_stats[parcelle]
-            stats['nb_analyses'] += 1
-            stats['risque_moyen'] += analyse['risque_mildiou']['score']
-            stats['protection_moyenne'] += analyse['protection']['score']
-            if analyse['decision']['urgence'] == 'haute': stats['alertes_haute'] += 1
-            elif analyse['decision']['urgence'] == 'moyenne': stats['alertes_moyenne'] += 1
-        for stats in parcelles_stats.values():
-            if stats['nb_analyses'] > 0:
-                stats['risque_moyen'] = round(stats['risque_moyen'] / stats['nb_analyses'], 2)
-                stats['protection_moyenne'] = round(stats['protection_moyenne'] / stats['nb_analyses'], 2)
-        return {'annee': annee, 'nb_analyses_total': len(analyses), 'parcelles': parcelles_stats, 'periode': {'debut': min(a['date'] for a in analyses), 'fin': max(a['date'] for a in analyses)}}
+        df = pd.json_normalize(analyses)
+        df['haute'] = df['decision.urgence'] == 'haute'
+        df['moyenne'] = df['decision.urgence'] == 'moyenne'
+        stats = df.groupby('parcelle', sort=False).agg(
+            nb_analyses=('date', 'size'),
+            alertes_haute=('haute', 'sum'),
+            alertes_moyenne=('moyenne', 'sum'),
+            risque_moyen=('risque_mildiou.score', 'mean'),
+            protection_moyenne=('protection.score', 'mean')
+        ).round(2)
+        parcelles_stats = stats.to_dict(orient='index')
+        return {'annee': annee, 'nb_analyses_total': len(analyses), 'parcelles': parcelles_stats, 'periode': {'debut': df['date'].min(), 'fin': df['date'].max()}}
 
 
 class SystemeDecision:
@@ -630,6 +888,8 @@ class SystemeDecision:
     SEUIL_DECISION_MOYENNE = 2  # /10
 
     METEO_HISTORIQUE_FILE = 'meteo_historique.json' # Fichier de persistance GDD/ETP
+    JOURNAL_ANALYSES_FILE = 'historique_analyses.ndjson' # Journal des analyses (ajout seul, 1 ligne JSON par analyse)
+    JOURNAL_TAILLE_MAX = 5 * 1024 * 1024  # Au-delà (octets), seule la moitié la plus récente du journal est conservée
     GDD_STADE_MAP = {
         180: 'debourrement', 300: 'pousse_10cm', 500: 'pre_floraison',
         600: 'floraison', 750: 'nouaison', 900: 'fermeture_grappe',
@@ -645,18 +905,27 @@ class SystemeDecision:
         self.modele_oidium = ModeleOidium()
         self.modele_bilan_hydrique = ModeleBilanHydrique() # <-- AJOUTÉ
         self.historique_analyses = []
+        self._journal = None  # Ouvert à la première analyse
         self.historique_alertes = GestionHistoriqueAlertes()
 
         self.meteo_historique: Dict[str, Dict] = self._charger_meteo_historique()
         # On lance une mise à jour de l'historique météo au démarrage
         self._mettre_a_jour_historique_meteo()
+        self.meteo_series = MeteoSeries(self.meteo_historique)
+        self._meteo_df_cache: Tuple[int, Optional[pd.DataFrame]] = (0, None)
+
+    def actualiser_meteo(self):
+        """Recharge la météo depuis l'API et reconstruit les vues dérivées de l'historique
+        (les valeurs mises à jour en place, prévisions remplacées par les observations, gardent la même taille)."""
+        self._mettre_a_jour_historique_meteo(forcer=True)
+        self._meteo_df_cache = (0, None)
+        self.meteo_series = MeteoSeries(self.meteo_historique)
 
 
     # --- NOUVELLES FONCTIONS DE PERSISTANCE MÉTÉO ---
     def _charger_meteo_historique(self) -> Dict[str, Dict]:
         """Charge l'historique MÉTÉO jour par jour depuis un fichier JSON."""
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        fichier = os.path.join(script_dir, self.METEO_HISTORIQUE_FILE)
+        fichier = os.path.join(_SCRIPT_DIR, self.METEO_HISTORIQUE_FILE)
         try:
             if os.path.exists(fichier):
                 with open(fichier, 'r') as f:
@@ -671,8 +940,7 @@ class SystemeDecision:
 
     def _sauvegarder_meteo_historique(self):
         """Sauvegarde l'historique MÉTÉO jour par jour dans un fichier JSON."""
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        fichier = os.path.join(script_dir, self.METEO_HISTORIQUE_FILE)
+        fichier = os.path.join(_SCRIPT_DIR, self.METEO_HISTORIQUE_FILE)
         try:
             aujourdhui = datetime.now().date()
             data_a_sauver = {}
@@ -680,7 +948,7 @@ class SystemeDecision:
             dates_triees = sorted(self.meteo_historique.keys())
 
             for date_str in dates_triees:
-                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+                date_obj = _parse_date(date_str)
                 # On garde les 366 derniers jours OU si la date est dans l'année en cours
                 if (aujourdhui - date_obj).days <= 366 or date_obj.year == aujourdhui.year:
                     data_a_sauver[date_str] = self.meteo_historique[date_str]
@@ -690,14 +958,14 @@ class SystemeDecision:
         except Exception as e:
             print(f"⚠️ Erreur lors de la sauvegarde GDD: {e}")
 
-    def _mettre_a_jour_historique_meteo(self) -> Dict:
+    def _mettre_a_jour_historique_meteo(self, forcer: bool = False) -> Dict:
         """
         Appelle l'API (90j) et fusionne les données avec l'historique persistant.
         Calcule et stocke le GDD journalier et l'ETP.
         Retourne l'historique complet pour l'analyse.
         """
         # 1. Appeler l'API pour les 90 derniers jours + 7 jours futurs
-        meteo_data_recent = self.meteo.get_meteo_data(days_past=90, days_future=7)
+        meteo_data_recent = self.meteo.get_meteo_data(days_past=90, days_future=7, forcer=forcer)
 
         if not meteo_data_recent:
             print("❌ Échec de la mise à jour de l'historique météo. Utilisation des données en cache.")
@@ -708,7 +976,7 @@ class SystemeDecision:
 
         # 2. Mettre à jour l'historique persistant
         for date_str, data in meteo_data_recent.items():
-            date_meteo = datetime.strptime(date_str, '%Y-%m-%d').date()
+            date_meteo = _parse_date(date_str)
 
             if data is None: continue
 
@@ -766,7 +1034,7 @@ class SystemeDecision:
             dates_historique = sorted(meteo_historique.keys())
 
             for date_str in dates_historique:
-                date_meteo = datetime.strptime(date_str, '%Y-%m-%d').date()
+                date_meteo = _parse_date(date_str)
                 if date_meteo >= date_debut_gdd and date_meteo <= aujourdhui:
                     gdd_sum += meteo_historique.get(date_str, {}).get('gdd_jour', 0.0)
 
@@ -790,6 +1058,28 @@ class SystemeDecision:
             return 0, 'repos', None, None, 'Erreur'
 
     # --- FONCTION PREDICTION GDD (Lit l'historique) ---
+    def meteo_dataframe(self) -> pd.DataFrame:
+        """
+        Historique météo en DataFrame float64 indexé par DatetimeIndex (trié), construit une fois
+        et reconstruit seulement si l'historique change de taille. Les valeurs absentes sont NaN.
+        """
+        taille, df = self._meteo_df_cache
+        if df is None or taille != len(self.meteo_historique):
+            df = pd.DataFrame.from_dict(self.meteo_historique, orient='index')
+            df = df.reindex(columns=list(MeteoSeries.CHAMPS)).apply(pd.to_numeric, errors='coerce').astype(np.float64)
+            df.index = pd.to_datetime(df.index)
+            df = df.sort_index()
+            self._meteo_df_cache = (len(self.meteo_historique), df)
+        return df
+
+    def _dates_futures(self, meteo: Dict, date_actuelle: str, nb: int) -> List[str]:
+        """Les `nb` premières dates strictement postérieures à date_actuelle, sans trier tout l'historique"""
+        if meteo is self.meteo_historique and len(self.meteo_series) == len(meteo):
+            # Dates déjà triées dans la vue colonnes : simple bisect
+            debut = bisect_right(self.meteo_series.dates, date_actuelle)
+            return self.meteo_series.dates[debut:debut + nb]
+        return heapq.nsmallest(nb, (d for d in meteo if d > date_actuelle))
+
     def _predire_stade_futur(self, meteo_historique: Dict, date_actuelle: str, gdd_actuel: int,
                              prochain_stade_gdd: Optional[int], prochain_stade_nom: Optional[str], stade_manuel: str) -> Tuple[str, int]:
 
@@ -805,7 +1095,7 @@ class SystemeDecision:
         gdd_futur_cumul = 0
         jours_pour_atteindre = -1
 
-        dates_futures = sorted([d for d in meteo_historique.keys() if d > date_actuelle])[:7]
+        dates_futures = self._dates_futures(meteo_historique, date_actuelle, 7)
         T_base = self.config.parametres.get('t_base_gdd', 10.0)
 
         for i, date in enumerate(dates_futures):
@@ -824,9 +1114,13 @@ class SystemeDecision:
 
 
     def analyser_parcelle(self, nom_parcelle: str, utiliser_ipi: bool = False,
-                         debug: bool = False) -> Dict:
-        """Analyse complète d'une parcelle"""
-        parcelle = next((p for p in self.config.parcelles if p['nom'] == nom_parcelle), None)
+                         debug: bool = False, date_actuelle: Optional[str] = None,
+                         sortie_debug: Optional[TextIO] = None) -> Dict:
+        """Analyse complète d'une parcelle (date_actuelle 'AAAA-MM-JJ' : aujourd'hui par défaut).
+        sortie_debug : flux recevant la trace debug (l'active) au lieu de la sortie standard"""
+        debug = debug or sortie_debug is not None
+        trace = partial(print, file=sortie_debug)  # file=None : sortie standard
+        parcelle = self.config.parcelles_par_nom.get(nom_parcelle)
         if not parcelle:
             return {'erreur': f"Parcelle '{nom_parcelle}' non trouvée"}
 
@@ -835,13 +1129,14 @@ class SystemeDecision:
         if not meteo_historique_complet:
              return {'erreur': "Historique météo vide. Impossible de lancer l'analyse."}
 
-        date_actuelle = datetime.now().strftime('%Y-%m-%d')
+        if date_actuelle is None:
+            date_actuelle = datetime.now().strftime('%Y-%m-%d')
+        jour_analyse = _parse_date(date_actuelle)
 
-        dates_48h = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(2, -1, -1)]
+        dates_48h = [(jour_analyse - timedelta(days=i)).isoformat() for i in range(2, -1, -1)]
         meteo_48h = [meteo_historique_complet.get(d, {}) for d in dates_48h]
 
-        sensibilites = [self.config.SENSIBILITES_CEPAGES.get(c, 5) for c in parcelle['cepages']]
-        sensibilite_moy = sum(sensibilites) / len(sensibilites)
+        sensibilite_moy = self.config.sensibilites_moy[nom_parcelle]
 
         stade_manuel = parcelle['stade_actuel']
         stade_coef = self.config.COEF_STADES.get(stade_manuel, 1.0)
@@ -852,15 +1147,15 @@ class SystemeDecision:
         )
 
         if debug:
-            print(f"\n🔍 MODE DEBUG - STADE MANUEL UTILISÉ : {stade_manuel} (Coef: {stade_coef})")
-            print("\n🔍 MODE DEBUG - CALCUL RISQUE SIMPLE (MILDIOU)")
-            print(f"Pluie 48h: {sum(m.get('precipitation', 0) for m in meteo_48h if m):.1f}mm")
+            trace(f"\n🔍 MODE DEBUG - STADE MANUEL UTILISÉ : {stade_manuel} (Coef: {stade_coef})")
+            trace("\n🔍 MODE DEBUG - CALCUL RISQUE SIMPLE (MILDIOU)")
+            trace(f"Pluie 48h: {sum(m.get('precipitation', 0) for m in meteo_48h if m):.1f}mm")
             temp_moy_list = [m.get('temp_moy') for m in meteo_48h if m and m.get('temp_moy') is not None]
             temp_moy_48h = sum(temp_moy_list)/len(temp_moy_list) if temp_moy_list else 0
-            print(f"Temp moyenne 48h: {temp_moy_48h:.1f}°C")
-            print(f"Coef stade: {stade_coef}")
-            print(f"Sensibilité cépages: {sensibilite_moy:.1f}")
-            print(f"→ Score: {risque_simple}/10 ({niveau_simple})")
+            trace(f"Temp moyenne 48h: {temp_moy_48h:.1f}°C")
+            trace(f"Coef stade: {stade_coef}")
+            trace(f"Sensibilité cépages: {sensibilite_moy:.1f}")
+            trace(f"→ Score: {risque_simple}/10 ({niveau_simple})")
 
         # MODÈLE IPI
         ipi_value = None
@@ -871,17 +1166,15 @@ class SystemeDecision:
                 duree_humect = self.modele_ipi.estimer_duree_humectation(jour_max_pluie.get('precipitation'), jour_max_pluie.get('humidite'))
                 if duree_humect > 0:
                     ipi_value = self.modele_ipi.calculer_ipi(jour_max_pluie, duree_humect)
-                    if ipi_value >= 60: ipi_risque = "FORT"
-                    elif ipi_value >= 30: ipi_risque = "MOYEN"
-                    else: ipi_risque = "FAIBLE"
+                    ipi_risque = _IPI_NIVEAUX[np.searchsorted(_IPI_SEUILS, ipi_value, side='right')]
 
                     if debug:
-                        print("\n🔍 MODE DEBUG - CALCUL IPI")
-                        print(f"Jour max pluie: {jour_max_pluie.get('precipitation'):.1f}mm")
-                        print(f"Température: {jour_max_pluie.get('temp_moy'):.1f}°C")
-                        print(f"Humidité: {jour_max_pluie.get('humidite', 0):.0f}%")
-                        print(f"Durée humectation: {duree_humect:.1f}h")
-                        print(f"→ IPI: {ipi_value}/100 ({ipi_risque})")
+                        trace("\n🔍 MODE DEBUG - CALCUL IPI")
+                        trace(f"Jour max pluie: {jour_max_pluie.get('precipitation'):.1f}mm")
+                        trace(f"Température: {jour_max_pluie.get('temp_moy'):.1f}°C")
+                        trace(f"Humidité: {jour_max_pluie.get('humidite', 0):.0f}%")
+                        trace(f"Durée humectation: {duree_humect:.1f}h")
+                        trace(f"→ IPI: {ipi_value}/100 ({ipi_risque})")
                 else: ipi_value = 0; ipi_risque = "FAIBLE (Humect. Nulle)"
             else: ipi_value = 0; ipi_risque = "FAIBLE (Pluie Insuff.)"
         elif utiliser_ipi:
@@ -889,22 +1182,22 @@ class SystemeDecision:
              ipi_risque = "NUL (Repos végétatif)"
 
         # MODÈLE OÏDIUM
-        dates_7j = [(datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(6, -1, -1)]
+        dates_7j = [(jour_analyse - timedelta(days=i)).isoformat() for i in range(6, -1, -1)]
         meteo_7j = [meteo_historique_complet.get(d, {}) for d in dates_7j]
         risque_oidium, niveau_oidium = self.modele_oidium.calculer_risque_infection(
             meteo_7j, stade_coef
         )
 
         if debug:
-            print("\n🔍 MODE DEBUG - CALCUL OÏDIUM (7 jours)")
-            print(f"Coef stade (manuel) appliqué: {stade_coef}")
-            print("-" * 50)
-            print("Date       | T°Max | Humidité | Pluie | Score Jour")
-            print("-" * 50)
+            trace("\n🔍 MODE DEBUG - CALCUL OÏDIUM (7 jours)")
+            trace(f"Coef stade (manuel) appliqué: {stade_coef}")
+            trace("-" * 50)
+            trace("Date       | T°Max | Humidité | Pluie | Score Jour")
+            trace("-" * 50)
             score_total_debug = 0; jours_comptes_debug = 0
             for i, jour_meteo in enumerate(meteo_7j):
                 date_str = dates_7j[i]
-                if not jour_meteo: print(f"{date_str} | Données N/A"); continue
+                if not jour_meteo: trace(f"{date_str} | Données N/A"); continue
                 jours_comptes_debug += 1
                 temp_max = jour_meteo.get('temp_max', 0); humid = jour_meteo.get('humidite', 0); pluie = jour_meteo.get('precipitation', 0)
                 daily_score_debug = 0
@@ -913,13 +1206,13 @@ class SystemeDecision:
                 elif temp_max is not None and humid is not None and 15 <= temp_max <= 30 and humid >= 50: daily_score_debug = 1
                 if pluie is not None and pluie >= 5: daily_score_debug -= 1
                 daily_score_debug = max(daily_score_debug, -2); score_total_debug += daily_score_debug
-                print(f"{date_str} | {temp_max:>5.1f}C | {humid:>6.0f}% | {pluie:>5.1f}mm | {daily_score_debug:>4}")
-            print("-" * 50); print(f"Score total brut: {score_total_debug}")
+                trace(f"{date_str} | {temp_max:>5.1f}C | {humid:>6.0f}% | {pluie:>5.1f}mm | {daily_score_debug:>4}")
+            trace("-" * 50); trace(f"Score total brut: {score_total_debug}")
             max_score_possible_debug = jours_comptes_debug * 3
             if max_score_possible_debug > 0:
                 score_norm_debug = (score_total_debug / max_score_possible_debug) * 10
-                print(f"Score normalisé (sur 10): {max(0, score_norm_debug):.1f}")
-            print(f"→ Score Oïdium Final (avec stade): {risque_oidium}/10 ({niveau_oidium})")
+                trace(f"Score normalisé (sur 10): {max(0, score_norm_debug):.1f}")
+            trace(f"→ Score Oïdium Final (avec stade): {risque_oidium}/10 ({niveau_oidium})")
 
         # ======================================================================
         # --- BLOC : CALCUL GDD (DJC) (Utilise la persistance) ---
@@ -933,12 +1226,12 @@ class SystemeDecision:
         )
 
         if debug:
-            print("\n🔍 MODE DEBUG - CALCUL GDD (DJC)")
-            print(f"Date début GDD : {mode_calcul}")
-            print(f"GDD Cumulés (Base 10°C) : {gdd_actuel}")
-            print(f"Stade Estimé (GDD) : {stade_estime}")
-            print(f"Prochain stade : {prochain_stade_nom} (à {prochain_stade_gdd} GDD)")
-            print(f"Alerte Prévision : {alerte_stade}")
+            trace("\n🔍 MODE DEBUG - CALCUL GDD (DJC)")
+            trace(f"Date début GDD : {mode_calcul}")
+            trace(f"GDD Cumulés (Base 10°C) : {gdd_actuel}")
+            trace(f"Stade Estimé (GDD) : {stade_estime}")
+            trace(f"Prochain stade : {prochain_stade_nom} (à {prochain_stade_gdd} GDD)")
+            trace(f"Alerte Prévision : {alerte_stade}")
         # ======================================================================
 
         # ======================================================================
@@ -950,22 +1243,22 @@ class SystemeDecision:
         )
 
         if debug:
-            print("\n🔍 MODE DEBUG - BILAN HYDRIQUE")
-            print(f"RFU Max configurée : {rfu_max_mm} mm")
-            print(f"RFU Actuelle : {bilan_hydrique['rfu_mm']} mm ({bilan_hydrique['rfu_pct']} %)")
-            print(f"Niveau de stress : {bilan_hydrique['niveau']}")
+            trace("\n🔍 MODE DEBUG - BILAN HYDRIQUE")
+            trace(f"RFU Max configurée : {rfu_max_mm} mm")
+            trace(f"RFU Actuelle : {bilan_hydrique['rfu_mm']} mm ({bilan_hydrique['rfu_pct']} %)")
+            trace(f"Niveau de stress : {bilan_hydrique['niveau']}")
         # ======================================================================
 
         # PROTECTION ACTUELLE
         protection, dernier_trait, facteur_limitant = self.traitements.calculer_protection_actuelle(
-            nom_parcelle, date_actuelle, self.meteo_historique, stade_manuel
+            nom_parcelle, date_actuelle, self.meteo_series, stade_manuel
         )
 
         if debug:
-            print("\n🔍 MODE DEBUG - PROTECTION")
-            print(f"Stade: {parcelle['stade_actuel']}")
-            print(f"Coef pousse: {self.traitements.COEF_POUSSE.get(parcelle['stade_actuel'], 1.0)}")
-            print(f"→ Protection: {protection}/10 (Limité par: {facteur_limitant})")
+            trace("\n🔍 MODE DEBUG - PROTECTION")
+            trace(f"Stade: {parcelle['stade_actuel']}")
+            trace(f"Coef pousse: {self.traitements.COEF_POUSSE.get(parcelle['stade_actuel'], 1.0)}")
+            trace(f"→ Protection: {protection}/10 (Limité par: {facteur_limitant})")
 
         # DÉCISION
         score_decision = risque_simple - protection
@@ -984,8 +1277,10 @@ class SystemeDecision:
         elif niveau_oidium == "MOYEN": alerte_oidium = "🔸 Risque Oïdium MOYEN - Surveillance"
 
         # PRÉVISIONS
-        dates_futures = sorted([d for d in self.meteo_historique.keys() if d > date_actuelle])[:3]
-        pluie_prevue = sum(self.meteo_historique.get(d, {}).get('precipitation', 0) for d in dates_futures)
+        dates_futures = self._dates_futures(self.meteo_historique, date_actuelle, 3)
+        pluies_futures = ((self.meteo_historique.get(d) or {}).get('precipitation') for d in dates_futures)
+        pluie_prevue = float(np.nansum(np.fromiter((np.nan if p is None else p for p in pluies_futures),
+                                                   dtype=np.float64, count=len(dates_futures))))
         alerte_preventive = ""
         if pluie_prevue > self.SEUIL_ALERTE_PLUIE and protection < self.SEUIL_PROTECTION_FAIBLE:
             alerte_preventive = f"⚠️  Pluie de {pluie_prevue:.1f}mm prévue - Traitement préventif Mildiou recommandé"
@@ -1033,7 +1328,9 @@ class SystemeDecision:
         }
 
         # Stocker pour historique
-        self.historique_analyses.append({'date': date_actuelle, 'parcelle': nom_parcelle, 'risque': risque_simple, 'protection': protection, 'decision_score': score_decision})
+        ligne_analyse = {'date': date_actuelle, 'parcelle': nom_parcelle, 'risque': risque_simple, 'protection': protection, 'decision_score': score_decision}
+        self.historique_analyses.append(ligne_analyse)
+        self._journaliser_analyse(ligne_analyse)
         try:
             self.historique_alertes.ajouter_analyse(analyse)
         except Exception as e:
@@ -1041,107 +1338,113 @@ class SystemeDecision:
 
         return analyse
 
+    def analyser_toutes_parcelles(self, utiliser_ipi: bool = False, debug: bool = False) -> Dict[str, Dict]:
+        """Analyse toutes les parcelles avec une seule écriture de l'historique des alertes"""
+        date_actuelle = datetime.now().strftime('%Y-%m-%d')  # Même date pour toutes les parcelles
+        with self.historique_alertes.bulk():
+            return {
+                p['nom']: self.analyser_parcelle(p['nom'], utiliser_ipi=utiliser_ipi, debug=debug, date_actuelle=date_actuelle)
+                for p in self.config.parcelles
+            }
+
     def afficher_rapport(self, analyse: Dict):
-        """Affiche un rapport formaté de l'analyse"""
-        print("\n" + "="*60)
-        print(f"   ANALYSE MILDIOU, OÏDIUM & HYDRIQUE - {analyse['parcelle']}")
-        print("="*60)
-        print(f"Date: {analyse['date_analyse']}")
-        print(f"Cépages: {', '.join(analyse['cepages'])}")
-        print(f"Stade phénologique (Manuel): {analyse['stade']}")
+        """Affiche un rapport formaté de l'analyse (construit en mémoire, écrit en une fois)"""
+        lignes = []
+        lignes.append("\n" + "="*60)
+        lignes.append(f"   ANALYSE MILDIOU, OÏDIUM & HYDRIQUE - {analyse['parcelle']}")
+        lignes.append("="*60)
+        lignes.append(f"Date: {analyse['date_analyse']}")
+        lignes.append(f"Cépages: {', '.join(analyse['cepages'])}")
+        lignes.append(f"Stade phénologique (Manuel): {analyse['stade']}")
 
         gdd_info = analyse.get('gdd', {})
-        print(f"GDD Cumulés (base 10°C) : {gdd_info.get('cumul', 0):.0f} GDD")
-        print(f"   └── Mode de calcul : {gdd_info.get('mode_calcul', 'N/A')}")
-        print(f"Stade estimé (GDD) : {gdd_info.get('stade_estime', 'N/A')}")
+        lignes.append(f"GDD Cumulés (base 10°C) : {gdd_info.get('cumul', 0):.0f} GDD")
+        lignes.append(f"   └── Mode de calcul : {gdd_info.get('mode_calcul', 'N/A')}")
+        lignes.append(f"Stade estimé (GDD) : {gdd_info.get('stade_estime', 'N/A')}")
         if gdd_info.get('alerte_stade'):
-             print(f"   └── {gdd_info.get('alerte_stade')}")
+             lignes.append(f"   └── {gdd_info.get('alerte_stade')}")
 
-        print("-"*60)
+        lignes.append("-"*60)
         meteo = analyse['meteo_actuelle']
-        print(f"\n🌡️  MÉTÉO ACTUELLE")
-        print(f"   Température: {meteo.get('temp_min', 'N/A')}°C - {meteo.get('temp_max', 'N/A')}°C")
-        print(f"   Précipitations: {meteo.get('precipitation', 0):.1f} mm")
-        print(f"   Humidité: {meteo.get('humidite', 'N/A'):.0f}%")
-        print(f"   ETP (Évap.) : {meteo.get('etp', 'N/A'):.1f} mm") # Ajout ETP
+        lignes.append(f"\n🌡️  MÉTÉO ACTUELLE")
+        lignes.append(f"   Température: {meteo.get('temp_min', 'N/A')}°C - {meteo.get('temp_max', 'N/A')}°C")
+        lignes.append(f"   Précipitations: {meteo.get('precipitation', 0):.1f} mm")
+        lignes.append(f"   Humidité: {meteo.get('humidite', 'N/A'):.0f}%")
+        lignes.append(f"   ETP (Évap.) : {meteo.get('etp', 'N/A'):.1f} mm") # Ajout ETP
 
         risque_m = analyse['risque_infection']
-        print(f"\n🦠 RISQUE MILDIOU: {risque_m['niveau']}")
-        print(f"   Score modèle simple: {risque_m['score']}/10")
+        lignes.append(f"\n🦠 RISQUE MILDIOU: {risque_m['niveau']}")
+        lignes.append(f"   Score modèle simple: {risque_m['score']}/10")
         if risque_m['ipi'] is not None:
-            print(f"   IPI: {risque_m['ipi']}/100 ({risque_m['ipi_niveau']})")
+            lignes.append(f"   IPI: {risque_m['ipi']}/100 ({risque_m['ipi_niveau']})")
 
         risque_o = analyse.get('risque_oidium', {})
-        print(f"\n🍄 RISQUE OÏDIUM: {risque_o.get('niveau', 'N/A')}")
-        print(f"   Score modèle Oïdium: {risque_o.get('score', 0)}/10")
+        lignes.append(f"\n🍄 RISQUE OÏDIUM: {risque_o.get('niveau', 'N/A')}")
+        lignes.append(f"   Score modèle Oïdium: {risque_o.get('score', 0)}/10")
 
         bilan_h = analyse.get('bilan_hydrique', {})
-        print(f"\n💧 BILAN HYDRIQUE: {bilan_h.get('niveau', 'N/A')}")
-        print(f"   Réserve Utile (RFU) : {bilan_h.get('rfu_pct', 0)}% ({bilan_h.get('rfu_mm', 0)} / {bilan_h.get('rfu_max_mm', 0)} mm)")
+        lignes.append(f"\n💧 BILAN HYDRIQUE: {bilan_h.get('niveau', 'N/A')}")
+        lignes.append(f"   Réserve Utile (RFU) : {bilan_h.get('rfu_pct', 0)}% ({bilan_h.get('rfu_mm', 0)} / {bilan_h.get('rfu_max_mm', 0)} mm)")
 
         prot = analyse['protection_actuelle']
-        print(f"\n🛡️  PROTECTION ACTUELLE: {prot['score']}/10")
+        lignes.append(f"\n🛡️  PROTECTION ACTUELLE: {prot['score']}/10")
         if prot['dernier_traitement']:
             dt = prot['dernier_traitement']
-            print(f"   Dernier traitement: {dt['date']}")
-            print(f"   Produit: {dt['caracteristiques'].get('nom', 'N/A')}")
-            print(f"   Facteur limitant: {prot['facteur_limitant']}")
+            lignes.append(f"   Dernier traitement: {dt['date']}")
+            lignes.append(f"   Produit: {dt['caracteristiques'].get('nom', 'N/A')}")
+            lignes.append(f"   Facteur limitant: {prot['facteur_limitant']}")
         else:
-            print("   Aucun traitement enregistré.")
+            lignes.append("   Aucun traitement enregistré.")
 
         dec = analyse['decision']
-        print(f"\n{'='*60}")
-        print(f"➜  DÉCISION: {dec['action']}")
-        print(f"   Score décision (Mildiou): {dec['score']}/10")
+        lignes.append(f"\n{'='*60}")
+        lignes.append(f"➜  DÉCISION: {dec['action']}")
+        lignes.append(f"   Score décision (Mildiou): {dec['score']}/10")
         if dec['alerte_preventive']:
-            print(f"\n   {dec['alerte_preventive']}")
+            lignes.append(f"\n   {dec['alerte_preventive']}")
         if dec['alerte_oidium']:
-            print(f"   {dec['alerte_oidium']}")
+            lignes.append(f"   {dec['alerte_oidium']}")
         if bilan_h.get('niveau') == "STRESS FORT":
-             print(f"   💧 ALERTE STRESS HYDRIQUE FORT ({bilan_h.get('rfu_pct')}%)")
-        print("="*60)
+             lignes.append(f"   💧 ALERTE STRESS HYDRIQUE FORT ({bilan_h.get('rfu_pct')}%)")
+        lignes.append("="*60)
         prev = analyse['previsions_3j']
-        print(f"\n📅 PRÉVISIONS 3 JOURS")
-        print(f"   Cumul pluie prévu: {prev['pluie_totale']} mm")
-        print()
+        lignes.append(f"\n📅 PRÉVISIONS 3 JOURS")
+        lignes.append(f"   Cumul pluie prévu: {prev['pluie_totale']} mm")
+        lignes.append("")
+        sys.stdout.write("\n".join(lignes) + "\n")
 
     def generer_graphique_evolution(self, parcelle: str, nb_jours: int = 30,
                                    fichier_sortie: str = 'evolution_risque.png'):
-        if not GRAPHIQUES_DISPONIBLES:
+        if not GRAPHIQUES_DISPONIBLES or not _charger_matplotlib():
             print("⚠️  matplotlib non installé. Graphiques non disponibles.")
             return
 
-        meteo_dict_daily = self.meteo_historique
+        meteo_df = self.meteo_dataframe()
 
-        dates, risques, protections = [], [], []
-        date_fin = datetime.now()
+        date_fin = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
 
-        parcelle_obj = next((p for p in self.config.parcelles if p['nom'] == parcelle), None)
+        parcelle_obj = self.config.parcelles_par_nom.get(parcelle)
         if not parcelle_obj:
             print(f"❌ Parcelle {parcelle} non trouvée pour graphique.")
             return
 
-        for i in range(nb_jours, -1, -1):
-            date_dt = date_fin - timedelta(days=i)
-            date = date_dt.strftime('%Y-%m-%d')
-
-            if date not in meteo_dict_daily:
-                continue
-
-            dates.append(date_dt)
-
-            meteo_48h = []
-            for j in range(3):
-                d = (date_dt - timedelta(days=2-j)).strftime('%Y-%m-%d')
-                if d in meteo_dict_daily: meteo_48h.append(meteo_dict_daily.get(d, {}))
-
-            sensibilites = [self.config.SENSIBILITES_CEPAGES.get(c, 5) for c in parcelle_obj['cepages']]
-            sensibilite_moy = sum(sensibilites) / len(sensibilites)
-            stade_coef = self.config.COEF_STADES.get(parcelle_obj['stade_actuel'], 1.0)
-            risque, _ = self.modele_simple.calculer_risque_infection(meteo_48h, stade_coef, sensibilite_moy)
-            protection, _, _ = self.traitements.calculer_protection_actuelle(parcelle, date, meteo_dict_daily, parcelle_obj['stade_actuel'])
-            risques.append(risque)
-            protections.append(protection)
+        # Jours calendaires de J-(nb_jours+2) à J (2 jours de plus pour la fenêtre 48h du premier point)
+        jours_dt = [date_fin - timedelta(days=i) for i in range(nb_jours + 2, -1, -1)]
+        jours = [d.strftime('%Y-%m-%d') for d in jours_dt]
+        index_jours = pd.DatetimeIndex(jours)
+        fenetre = meteo_df.reindex(index_jours)
+        colonnes = {champ: fenetre[champ].to_numpy() for champ in ('precipitation', 'temp_moy', 'humidite')}
+        jour_present = index_jours.isin(meteo_df.index)
+        sensibilite_moy = self.config.sensibilites_moy[parcelle]
+        stade_coef = self.config.COEF_STADES.get(parcelle_obj['stade_actuel'], 1.0)
+        risques_fenetres = self.modele_simple.calculer_risque_glissant(
+            colonnes['precipitation'], colonnes['temp_moy'], colonnes['humidite'], stade_coef, sensibilite_moy)
+
+        presents = [i for i in range(2, len(jours)) if jour_present[i]]
+        dates = [jours_dt[i] for i in presents]
+        risques = [round(float(risques_fenetres[i - 2]), 1) for i in presents]
+        protections = [round(float(p), 1) for p in self.traitements.calculer_protection_lot(
+            parcelle, [jours[i] for i in presents], self.meteo_series, parcelle_obj['stade_actuel'])]
 
         if not dates:
             print("❌ Aucune donnée à tracer pour le graphique (vérifiez l'historique météo).")
@@ -1162,12 +1465,48 @@ class SystemeDecision:
         plt.savefig(fichier_sortie, dpi=150)
         print(f"✅ Graphique sauvegardé : {fichier_sortie}"); plt.close()
 
+    def _journaliser_analyse(self, ligne: Dict):
+        """Ajoute une analyse au journal NDJSON (ouvert une seule fois, tronqué dès qu'il dépasse la limite)"""
+        if self._journal is False:
+            return
+        try:
+            chemin = os.path.join(_SCRIPT_DIR, self.JOURNAL_ANALYSES_FILE)
+            if self._journal is None:
+                self._journal = open(chemin, 'a', encoding='utf-8', buffering=1 << 16)
+            self._journal.write(json.dumps(ligne, ensure_ascii=False, default=str) + '\n')
+            self._journal.flush()
+            # Taille vérifiée à chaque ajout : le système reste en cache des heures et journalise à chaque rerun
+            if self._journal.tell() > self.JOURNAL_TAILLE_MAX:
+                self._tronquer_journal(chemin)
+        except OSError as e:
+            print(f"⚠️  Journal des analyses indisponible : {e}")
+            self._journal = False  # Ne plus réessayer pendant la session
+
+    def _tronquer_journal(self, chemin: str):
+        """Garde les lignes les plus récentes (environ la moitié de JOURNAL_TAILLE_MAX) si le journal dépasse la limite.
+        Réécriture sur place : les descripteurs ouverts en ajout (autres instances) continuent d'écrire en fin de fichier."""
+        if not os.path.exists(chemin) or os.path.getsize(chemin) <= self.JOURNAL_TAILLE_MAX:
+            return
+        with open(chemin, 'r+b') as f:
+            f.seek(-(self.JOURNAL_TAILLE_MAX // 2), os.SEEK_END)
+            f.readline()  # Première ligne probablement coupée
+            recentes = f.read()
+            f.seek(0)
+            f.write(recentes)
+            f.truncate()
+
     def exporter_analyses_csv(self, fichier: str = 'historique_analyses.csv'):
+        journal = os.path.join(_SCRIPT_DIR, self.JOURNAL_ANALYSES_FILE)
+        if os.path.exists(journal) and os.path.getsize(journal) > 0:
+            # Conversion du journal complet (toutes sessions) en une passe colonnes
+            pd.read_json(journal, lines=True, dtype=False).to_csv(fichier, index=False)
+            print(f"✅ Historique exporté : {fichier}"); return
         if not self.historique_analyses:
             print("⚠️  Aucune analyse à exporter"); return
-        with open(fichier, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=['date', 'parcelle', 'risque', 'protection', 'decision_score'])
-            writer.writeheader(); writer.writerows(self.historique_analyses)
+        with open(fichier, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+            writer = csv.writer(f)
+            writer.writerow(['date', 'parcelle', 'risque', 'protection', 'decision_score'])
+            writer.writerows((a['date'], a['parcelle'], a['risque'], a['protection'], a['decision_score']) for a in self.historique_analyses)
         print(f"✅ Historique exporté : {fichier}")
 
     def generer_synthese_annuelle(self, annee: int, fichier_sortie: str = None):
@@ -1176,28 +1515,30 @@ class SystemeDecision:
         ift = self.traitements.calculer_ift_periode(date_debut, date_fin, self.config.surface_totale)
         stats_parcelles = {}
         for parcelle in self.config.parcelles:
-            traitements_parcelle = [t for t in self.traitements.historique['traitements'] if t['parcelle'] == parcelle['nom'] and date_debut <= t['date'] <= date_fin]
-            stats_parcelles[parcelle['nom']] = {'nb_traitements': len(traitements_parcelle), 'surface_ha': parcelle['surface_ha'], 'cepages': parcelle['cepages']}
+            dates_trait = self.traitements.dates_traitements(parcelle['nom'])
+            nb_traitements = bisect_right(dates_trait, date_fin) - bisect_left(dates_trait, date_debut)
+            stats_parcelles[parcelle['nom']] = {'nb_traitements': nb_traitements, 'surface_ha': parcelle['surface_ha'], 'cepages': parcelle['cepages']}
+        morceaux = []
+        morceaux.append("="*70 + "\n"); morceaux.append(f"   SYNTHÈSE ANNUELLE MILDIOU - {annee}\n"); morceaux.append(f"   {self.config.config_file.replace('.json', '').upper()}\n"); morceaux.append("="*70 + "\n\n")
+        morceaux.append(f"📊 DONNÉES GÉNÉRALES\n"); morceaux.append(f"   Surface totale : {self.config.surface_totale} ha\n"); morceaux.append(f"   Nombre de parcelles : {len(self.config.parcelles)}\n"); morceaux.append(f"   Période d'analyse : {date_debut} au {date_fin}\n\n")
+        morceaux.append(f"💊 BILAN TRAITEMENTS\n"); morceaux.append(f"   Nombre total de traitements : {ift['nb_traitements']}\n"); morceaux.append(f"   IFT total : {ift['ift_total']}\n"); morceaux.append(f"   IFT moyen par hectare : {ift['ift_total']/self.config.surface_totale:.2f}\n\n")
+        morceaux.append(f"📋 DÉTAIL PAR PARCELLE\n"); morceaux.append("-"*70 + "\n")
+        for nom, stats in stats_parcelles.items():
+            morceaux.append(f"\n🍇 {nom}\n"); morceaux.append(f"   Surface : {stats['surface_ha']} ha\n"); morceaux.append(f"   Cépages : {', '.join(stats['cepages'])}\n"); morceaux.append(f"   Traitements : {stats['nb_traitements']}\n"); ift_parcelle = stats['nb_traitements']; morceaux.append(f"   IFT estimé : {ift_parcelle}\n")
+        morceaux.append("\n" + "-"*70 + "\n"); morceaux.append(f"📅 HISTORIQUE DES TRAITEMENTS\n"); morceaux.append("-"*70 + "\n")
+        for detail in ift['details']:
+            morceaux.append(f"\n{detail['date']} - {detail['parcelle']}\n"); morceaux.append(f"   Produit : {detail['produit']}\n"); morceaux.append(f"   IFT : {detail['ift']}\n")
+        morceaux.append("\n" + "="*70 + "\n"); morceaux.append(f"💡 RECOMMANDATIONS\n"); morceaux.append("="*70 + "\n")
+        if ift['ift_total'] > 15:
+            morceaux.append("⚠️  IFT élevé : Envisager des stratégies de réduction\n"); morceaux.append("   - Optimiser le positionnement des traitements\n"); morceaux.append("   - Privilégier les produits longue rémanence\n"); morceaux.append("   - Évaluer les cépages résistants\n")
+        elif ift['ift_total'] < 8:
+            morceaux.append("✅ IFT maîtrisé : Bonne gestion phytosanitaire\n")
+        else: morceaux.append("✓  IFT dans la moyenne nationale\n")
+        morceaux.append("\n" + "="*70 + "\n"); morceaux.append(f"Rapport généré le {datetime.now().strftime('%d/%m/%Y à %H:%M')}\n"); morceaux.append("="*70 + "\n")
         with open(fichier_sortie, 'w', encoding='utf-8') as f:
-            f.write("="*70 + "\n"); f.write(f"   SYNTHÈSE ANNUELLE MILDIOU - {annee}\n"); f.write(f"   {self.config.config_file.replace('.json', '').upper()}\n"); f.write("="*70 + "\n\n")
-            f.write(f"📊 DONNÉES GÉNÉRALES\n"); f.write(f"   Surface totale : {self.config.surface_totale} ha\n"); f.write(f"   Nombre de parcelles : {len(self.config.parcelles)}\n"); f.write(f"   Période d'analyse : {date_debut} au {date_fin}\n\n")
-            f.write(f"💊 BILAN TRAITEMENTS\n"); f.write(f"   Nombre total de traitements : {ift['nb_traitements']}\n"); f.write(f"   IFT total : {ift['ift_total']}\n"); f.write(f"   IFT moyen par hectare : {ift['ift_total']/self.config.surface_totale:.2f}\n\n")
-            f.write(f"📋 DÉTAIL PAR PARCELLE\n"); f.write("-"*70 + "\n")
-            for nom, stats in stats_parcelles.items():
-                f.write(f"\n🍇 {nom}\n"); f.write(f"   Surface : {stats['surface_ha']} ha\n"); f.write(f"   Cépages : {', '.join(stats['cepages'])}\n"); f.write(f"   Traitements : {stats['nb_traitements']}\n"); ift_parcelle = stats['nb_traitements']; f.write(f"   IFT estimé : {ift_parcelle}\n")
-            f.write("\n" + "-"*70 + "\n"); f.write(f"📅 HISTORIQUE DES TRAITEMENTS\n"); f.write("-"*70 + "\n")
-            for detail in ift['details']:
-                f.write(f"\n{detail['date']} - {detail['parcelle']}\n"); f.write(f"   Produit : {detail['produit']}\n"); f.write(f"   IFT : {detail['ift']}\n")
-            f.write("\n" + "="*70 + "\n"); f.write(f"💡 RECOMMANDATIONS\n"); f.write("="*70 + "\n")
-            if ift['ift_total'] > 15:
-                f.write("⚠️  IFT élevé : Envisager des stratégies de réduction\n"); f.write("   - Optimiser le positionnement des traitements\n"); f.write("   - Privilégier les produits longue rémanence\n"); f.write("   - Évaluer les cépages résistants\n")
-            elif ift['ift_total'] < 8:
-                f.write("✅ IFT maîtrisé : Bonne gestion phytosanitaire\n")
-            else: f.write("✓  IFT dans la moyenne nationale\n")
-            f.write("\n" + "="*70 + "\n"); f.write(f"Rapport généré le {datetime.now().strftime('%d/%m/%Y à %H:%M')}\n"); f.write("="*70 + "\n")
+            f.write(''.join(morceaux))
         print(f"✅ Synthèse annuelle générée : {fichier_sortie}")
-        with open(fichier_sortie, 'r', encoding='utf-8') as f:
-            print("\n" + f.read())
+        print("\n" + ''.join(morceaux))
 
 # --- NOUVELLE FONCTION MENU (pour le Biofix) ---
 def menu_maj_stade_et_date(systeme):
@@ -1251,102 +1592,135 @@ def menu_maj_stade_et_date(systeme):
     systeme.config.update_parcelle_stade_et_date(parcelle_choisie, nouveau_stade, date_debourrement)
 
 # --- PROGRAMME PRINCIPAL (MENU MODIFIÉ) ---
+MENU_TEXTE = "\n".join([
+    "\n" + "="*70, "🍇 SYSTÈME DE PRÉVISION MILDIOU & OÏDIUM - MENU PRINCIPAL", "="*70,
+    "\n1️⃣  Analyser toutes les parcelles",
+    "2️⃣  Analyser une parcelle spécifique",
+    "3️⃣  Enregistrer un traitement",
+    "4️⃣  Générer graphique d'évolution",
+    "5️⃣  Mettre à jour stade / Date Débourrement (Biofix)",
+    "6️⃣  Calculer IFT d'une période",
+    "7️⃣  Générer synthèse annuelle",
+    "8️⃣  Liste des fongicides disponibles",
+    "9️⃣  Quitter",
+])
+
+
+def _menu_analyser_tout(systeme):
+    """Option 1 : analyse de toutes les parcelles"""
+    print("\n" + "="*70); print("📊 ANALYSE DE TOUTES LES PARCELLES"); print("="*70)
+    for analyse in systeme.analyser_toutes_parcelles(utiliser_ipi=True).values():
+        if 'erreur' not in analyse: systeme.afficher_rapport(analyse)
+        else: print(f"❌ {analyse['erreur']}")
+
+
+def _menu_analyser_parcelle(systeme):
+    """Option 2 : analyse détaillée d'une parcelle"""
+    print("\n📍 Parcelles disponibles :")
+    for i, p in enumerate(systeme.config.parcelles, 1): print(f"   {i}. {p['nom']}")
+    try:
+        idx = int(input("\n➜ Numéro de la parcelle : ")) - 1
+        parcelle = systeme.config.parcelles[idx]
+        debug = input("Mode debug ? (o/n) : ").lower() == 'o'
+        analyse = systeme.analyser_parcelle(parcelle['nom'], utiliser_ipi=True, debug=debug)
+        if 'erreur' not in analyse: systeme.afficher_rapport(analyse)
+        else: print(f"❌ {analyse['erreur']}")
+    except (ValueError, IndexError): print("❌ Choix invalide")
+
+
+def _menu_enregistrer_traitement(systeme):
+    """Option 3 : saisie d'un traitement"""
+    print("\n💊 ENREGISTREMENT D'UN TRAITEMENT"); print("-"*70); print("\nParcelles disponibles :")
+    for i, p in enumerate(systeme.config.parcelles, 1): print(f"   {i}. {p['nom']}")
+    try:
+        idx = int(input("\n➜ Numéro de la parcelle : ")) - 1
+        parcelle = systeme.config.parcelles[idx]['nom']
+        date = input("Date du traitement (YYYY-MM-DD) ou [Entrée]=aujourd'hui : ").strip()
+        if not date: date = datetime.now().strftime('%Y-%m-%d')
+        print("\nProduits disponibles :")
+        produits = list(systeme.traitements.FONGICIDES.keys())
+        for i, p in enumerate(produits, 1): print(f"   {i}. {systeme.traitements.FONGICIDES[p]['nom']}")
+        prod_idx = int(input("\n➜ Numéro du produit : ")) - 1
+        produit = produits[prod_idx]
+        dose = input(f"Dose (kg/ha) ou [Entrée]=dose référence : ").strip()
+        dose = float(dose) if dose else None
+        systeme.traitements.ajouter_traitement(parcelle, date, produit, dose)
+    except (ValueError, IndexError): print("❌ Entrée invalide")
+
+
+def _menu_graphique(systeme):
+    """Option 4 : graphique d'évolution risque/protection"""
+    if not GRAPHIQUES_DISPONIBLES: print("\n❌ matplotlib non installé"); print("   Installation : pip install matplotlib"); return False
+    print("\n📈 GÉNÉRATION DE GRAPHIQUE"); print("-"*70); print("\nParcelles disponibles :")
+    for i, p in enumerate(systeme.config.parcelles, 1): print(f"   {i}. {p['nom']}")
+    try:
+        idx = int(input("\n➜ Numéro de la parcelle : ")) - 1
+        parcelle = systeme.config.parcelles[idx]['nom']
+        nb_jours = input("Nombre de jours (défaut=30) : ").strip()
+        nb_jours = int(nb_jours) if nb_jours else 30
+        fichier = f"evolution_{parcelle.replace(' ', '_')}.png"
+        systeme.generer_graphique_evolution(parcelle, nb_jours, fichier)
+    except (ValueError, IndexError): print("❌ Entrée invalide")
+
+
+def _menu_ift(systeme):
+    """Option 6 : IFT sur une période"""
+    print("\n📊 CALCUL IFT"); print("-"*70)
+    date_debut = input("Date début (YYYY-MM-DD) : ").strip()
+    date_fin = input("Date fin (YYYY-MM-DD) : ").strip()
+    if date_debut and date_fin:
+        ift = systeme.traitements.calculer_ift_periode(date_debut, date_fin, systeme.config.surface_totale)
+        print(f"\n{'='*70}"); print(f"IFT PÉRIODE : {ift['periode']}"); print(f"{'='*70}")
+        print(f"IFT total : {ift['ift_total']}"); print(f"IFT moyen/ha : {ift['ift_total']/systeme.config.surface_totale:.2f}"); print(f"Nombre de traitements : {ift['nb_traitements']}")
+        if ift['details']:
+            print(f"\nDétail :");
+            for d in ift['details']: print(f"  {d['date']} - {d['parcelle']} - {d['produit']} (IFT: {d['ift']})")
+
+
+def _menu_synthese(systeme):
+    """Option 7 : synthèse annuelle"""
+    print("\n📑 SYNTHÈSE ANNUELLE"); print("-"*70)
+    annee = input(f"Année (défaut={datetime.now().year}) : ").strip()
+    annee = int(annee) if annee else datetime.now().year
+    systeme.generer_synthese_annuelle(annee)
+
+
+def _menu_fongicides(systeme):
+    """Option 8 : liste des fongicides"""
+    print("\n💊 FONGICIDES DISPONIBLES"); print("="*70)
+    for code, info in systeme.traitements.FONGICIDES.items():
+        print(f"\n🔹 {info['nom']}"); print(f"   Code : {code}"); print(f"   Type : {info['type']}")
+        print(f"   Persistance : {info['persistance_jours']} jours"); print(f"   Seuil lessivage : {info['lessivage_seuil_mm']} mm"); print(f"   Dose référence : {info['dose_reference_kg_ha']} kg/ha")
+
+
+# Choix du menu → action (une action qui retourne False saute la pause « Entrée »)
+ACTIONS_MENU = {
+    '1': _menu_analyser_tout,
+    '2': _menu_analyser_parcelle,
+    '3': _menu_enregistrer_traitement,
+    '4': _menu_graphique,
+    '5': menu_maj_stade_et_date,
+    '6': _menu_ift,
+    '7': _menu_synthese,
+    '8': _menu_fongicides,
+}
+
+
 def menu_principal():
     """Menu interactif principal"""
     systeme = SystemeDecision()
     while True:
-        print("\n" + "="*70); print("🍇 SYSTÈME DE PRÉVISION MILDIOU & OÏDIUM - MENU PRINCIPAL"); print("="*70)
-        print("\n1️⃣  Analyser toutes les parcelles")
-        print("2️⃣  Analyser une parcelle spécifique")
-        print("3️⃣  Enregistrer un traitement")
-        print("4️⃣  Générer graphique d'évolution")
-        print("5️⃣  Mettre à jour stade / Date Débourrement (Biofix)") # NOUVEAU
-        print("6️⃣  Calculer IFT d'une période") # Ancien 5
-        print("7️⃣  Générer synthèse annuelle") # Ancien 6
-        print("8️⃣  Liste des fongicides disponibles") # Ancien 8
-        print("9️⃣  Quitter") # Ancien 9 (CSV 7 supprimé du menu)
+        print(MENU_TEXTE)
 
         choix = input("\n➜ Votre choix (1-9) : ").strip()
 
-        if choix == '1':
-            print("\n" + "="*70); print("📊 ANALYSE DE TOUTES LES PARCELLES"); print("="*70)
-            for parcelle in systeme.config.parcelles:
-                analyse = systeme.analyser_parcelle(parcelle['nom'], utiliser_ipi=True)
-                if 'erreur' not in analyse: systeme.afficher_rapport(analyse)
-                else: print(f"❌ {analyse['erreur']}")
-        elif choix == '2':
-            print("\n📍 Parcelles disponibles :")
-            for i, p in enumerate(systeme.config.parcelles, 1): print(f"   {i}. {p['nom']}")
-            try:
-                idx = int(input("\n➜ Numéro de la parcelle : ")) - 1
-                parcelle = systeme.config.parcelles[idx]
-                debug = input("Mode debug ? (o/n) : ").lower() == 'o'
-                analyse = systeme.analyser_parcelle(parcelle['nom'], utiliser_ipi=True, debug=debug)
-                if 'erreur' not in analyse: systeme.afficher_rapport(analyse)
-                else: print(f"❌ {analyse['erreur']}")
-            except (ValueError, IndexError): print("❌ Choix invalide")
-        elif choix == '3':
-            print("\n💊 ENREGISTREMENT D'UN TRAITEMENT"); print("-"*70); print("\nParcelles disponibles :")
-            for i, p in enumerate(systeme.config.parcelles, 1): print(f"   {i}. {p['nom']}")
-            try:
-                idx = int(input("\n➜ Numéro de la parcelle : ")) - 1
-                parcelle = systeme.config.parcelles[idx]['nom']
-                date = input("Date du traitement (YYYY-MM-DD) ou [Entrée]=aujourd'hui : ").strip()
-                if not date: date = datetime.now().strftime('%Y-%m-%d')
-                print("\nProduits disponibles :")
-                produits = list(systeme.traitements.FONGICIDES.keys())
-                for i, p in enumerate(produits, 1): print(f"   {i}. {systeme.traitements.FONGICIDES[p]['nom']}")
-                prod_idx = int(input("\n➜ Numéro du produit : ")) - 1
-                produit = produits[prod_idx]
-                dose = input(f"Dose (kg/ha) ou [Entrée]=dose référence : ").strip()
-                dose = float(dose) if dose else None
-                systeme.traitements.ajouter_traitement(parcelle, date, produit, dose)
-            except (ValueError, IndexError): print("❌ Entrée invalide")
-        elif choix == '4':
-            if not GRAPHIQUES_DISPONIBLES: print("\n❌ matplotlib non installé"); print("   Installation : pip install matplotlib"); continue
-            print("\n📈 GÉNÉRATION DE GRAPHIQUE"); print("-"*70); print("\nParcelles disponibles :")
-            for i, p in enumerate(systeme.config.parcelles, 1): print(f"   {i}. {p['nom']}")
-            try:
-                idx = int(input("\n➜ Numéro de la parcelle : ")) - 1
-                parcelle = systeme.config.parcelles[idx]['nom']
-                nb_jours = input("Nombre de jours (défaut=30) : ").strip()
-                nb_jours = int(nb_jours) if nb_jours else 30
-                fichier = f"evolution_{parcelle.replace(' ', '_')}.png"
-                systeme.generer_graphique_evolution(parcelle, nb_jours, fichier)
-            except (ValueError, IndexError): print("❌ Entrée invalide")
-
-        elif choix == '5':
-            menu_maj_stade_et_date(systeme)
-
-        elif choix == '6':
-            print("\n📊 CALCUL IFT"); print("-"*70)
-            date_debut = input("Date début (YYYY-MM-DD) : ").strip()
-            date_fin = input("Date fin (YYYY-MM-DD) : ").strip()
-            if date_debut and date_fin:
-                ift = systeme.traitements.calculer_ift_periode(date_debut, date_fin, systeme.config.surface_totale)
-                print(f"\n{'='*70}"); print(f"IFT PÉRIODE : {ift['periode']}"); print(f"{'='*70}")
-                print(f"IFT total : {ift['ift_total']}"); print(f"IFT moyen/ha : {ift['ift_total']/systeme.config.surface_totale:.2f}"); print(f"Nombre de traitements : {ift['nb_traitements']}")
-                if ift['details']:
-                    print(f"\nDétail :");
-                    for d in ift['details']: print(f"  {d['date']} - {d['parcelle']} - {d['produit']} (IFT: {d['ift']})")
-
-        elif choix == '7':
-            print("\n📑 SYNTHÈSE ANNUELLE"); print("-"*70)
-            annee = input(f"Année (défaut={datetime.now().year}) : ").strip()
-            annee = int(annee) if annee else datetime.now().year
-            systeme.generer_synthese_annuelle(annee)
-
-        elif choix == '8':
-            print("\n💊 FONGICIDES DISPONIBLES"); print("="*70)
-            for code, info in systeme.traitements.FONGICIDES.items():
-                print(f"\n🔹 {info['nom']}"); print(f"   Code : {code}"); print(f"   Type : {info['type']}")
-                print(f"   Persistance : {info['persistance_jours']} jours"); print(f"   Seuil lessivage : {info['lessivage_seuil_mm']} mm"); print(f"   Dose référence : {info['dose_reference_kg_ha']} kg/ha")
-
-        elif choix == '9':
+        if choix == '9':
             print("\n👋 Au revoir et bonnes vendanges !"); break
-
-        else:
+        action = ACTIONS_MENU.get(choix)
+        if action is None:
             print("\n❌ Choix invalide")
+        elif action(systeme) is False:
+            continue
 
         input("\n[Appuyez sur Entrée pour continuer]")
 
@@ -9,7 +9,7 @@ import sys
 import os
 from datetime import datetime
 import io
-from contextlib import redirect_stdout
+import traceback
 import pandas as pd
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -73,23 +73,417 @@ def get_urgence_color(urgence):
 def get_alert_class(urgence):
     classes = {'haute': 'alert-high', 'moyenne': 'alert-medium', 'faible': 'alert-low'}
     return classes.get(urgence, 'alert-low')
+
+# Pastilles par score entier 0-10 (seuils 4 et 7) et par niveau
+COULEURS_RISQUE = ("🟢",) * 4 + ("🟠",) * 3 + ("🔴",) * 4
+COULEURS_PROTECTION = COULEURS_RISQUE[::-1]
+COULEURS_RFU = {'STRESS FORT': '🔴', 'SURVEILLANCE': '🟠'}
+COULEURS_DECISION = {'haute': '🔴', 'moyenne': '🟠'}
+
+def couleur_score(couleurs, score):
+    return couleurs[min(max(int(score), 0), 10)]
 # -----------------------------------------------------
 
+# ==============================================================================
+# --- TAB 1 : Synthèse (MODIFIÉ AVEC OÏDIUM ET GDD) ---
+# ==============================================================================
+@st.fragment
+def render_synthese(systeme, analyse, parcelle_selectionnee, utiliser_ipi, cles_analyse):
+    """Onglet Synthèse (fragment : seul cet onglet est réexécuté par ses widgets)"""
+    parcelle_obj = systeme.config.parcelles_par_nom[parcelle_selectionnee]
+    col_info1, col_info2, col_info3 = st.columns(3)
+    with col_info1:
+        st.markdown("### 📍 Parcelle")
+        st.markdown(f"**Nom :** {parcelle_obj['nom']}")
+        st.markdown(f"**Surface :** {parcelle_obj['surface_ha']} ha")
+    with col_info2:
+        st.markdown("### 🍇 Cépages")
+        # Une seule liste markdown (un élément au lieu d'un par cépage)
+        st.markdown("\n".join(f"- {cepage}" for cepage in parcelle_obj['cepages']))
+    with col_info3:
+        st.markdown("### 🌱 Stade Actuel (Manuel)")
+        st.markdown(f"**{parcelle_obj['stade_actuel']}**")
+        coef_stade = systeme.config.COEF_STADES.get(parcelle_obj['stade_actuel'], 0)
+        coef_pousse = systeme.traitements.COEF_POUSSE.get(parcelle_obj['stade_actuel'], 0)
+        st.caption(f"Coef. risque : {coef_stade}")
+        st.caption(f"Coef. pousse : {coef_pousse}")
+        if parcelle_obj.get('date_debourrement'):
+            st.caption(f"Biofix GDD : {parcelle_obj['date_debourrement']}")
+
+    st.markdown("---")
+
+    # --- BLOC GDD ---
+    st.subheader("📈 Suivi Phénologique (GDD)")
+    gdd_info = analyse.get('gdd', {})
+
+    if gdd_info.get('mode_calcul') == 'En dormance (calcul GDD inactif)':
+        st.info("😴 Calcul GDD inactif. Le stade manuel de la parcelle est 'repos'.")
+    else:
+        col_gdd1, col_gdd2, col_gdd3 = st.columns(3)
+        with col_gdd1:
+            st.metric("🌡️ GDD Cumulés (base 10°C)", f"{gdd_info.get('cumul', 0)} GDD",
+                      help=f"Calcul basé sur : {gdd_info.get('mode_calcul')}")
+        with col_gdd2:
+            st.metric("🌱 Stade Estimé (GDD)", gdd_info.get('stade_estime', 'N/A'))
+        with col_gdd3:
+            alerte_stade = gdd_info.get('alerte_stade', '')
+            if "dans" in alerte_stade:
+                 st.info(f"**{alerte_stade}**")
+            else:
+                st.caption(alerte_stade)
+
+    st.markdown("---")
+
+    # Métriques principales
+    st.subheader("📊 Évaluation Actuelle")
+    col_m1, col_m2, col_m3 = st.columns(3)
+    risque_m = analyse['risque_infection']
+    risque_o = analyse['risque_oidium']
+    protection = analyse['protection_actuelle']
+    decision = analyse['decision']
+    bilan_h = analyse['bilan_hydrique'] # <-- NOUVEAU
+
+    with col_m1:
+        risque_m_color = couleur_score(COULEURS_RISQUE, risque_m['score'])
+        st.metric(
+            f"{risque_m_color} Risque Mildiou",
+            f"{risque_m['score']}/10",
+            delta=risque_m['niveau'],
+            help="Basé sur météo 48h + stade + sensibilité"
+        )
+        risque_o_color = couleur_score(COULEURS_RISQUE, risque_o['score'])
+        st.metric(
+            f"{risque_o_color} Risque Oïdium",
+            f"{risque_o['score']}/10",
+            delta=risque_o['niveau'],
+            help="Basé sur météo 7j (T° optimales, T° létales, humidité)"
+        )
+
+    with col_m2:
+        prot_color = couleur_score(COULEURS_PROTECTION, protection['score'])
+        st.metric(
+            f"{prot_color} Protection Résiduelle",
+            f"{protection['score']}/10",
+            delta=f"Limité par : {protection.get('facteur_limitant', 'N/A')}",
+            delta_color="off"
+        )
+
+        # --- NOUVEAU BILAN HYDRIQUE ---
+        rfu_color = COULEURS_RFU.get(bilan_h['niveau'], "🟢")
+        st.metric(
+            f"{rfu_color} Bilan Hydrique (RFU)",
+            f"{bilan_h['rfu_pct']}%",
+            delta=bilan_h['niveau'],
+            delta_color="off"
+        )
+        # ------------------------------
+
+    with col_m3:
+        dec_color = COULEURS_DECISION.get(decision['urgence'], "🟢")
+        st.metric(
+            f"{dec_color} Score Décision (Mildiou)",
+            f"{decision['score']}/10",
+            delta=decision['urgence'].upper(),
+            help="Risque Mildiou - Protection"
+        )
+        if utiliser_ipi and risque_m['ipi'] is not None:
+            st.metric(
+                "IPI (Mildiou)",
+                f"{risque_m['ipi']}/100",
+                delta=risque_m.get('ipi_niveau', 'N/A'),
+                help="Évalue la sévérité si infection Mildiou"
+            )
+
+    # --- MODIFIÉ : Bandeau de Décision Unifié ---
+    st.markdown("---")
+    st.subheader("➜ Recommandation")
+
+    urgence_mildiou = decision['urgence']
+    urgence_oidium = 'faible'
+    if "FORT" in decision['alerte_oidium']: urgence_oidium = 'haute'
+    elif "MOYEN" in decision['alerte_oidium']: urgence_oidium = 'moyenne'
+
+    urgence_hydrique = 'faible'
+    if "STRESS FORT" in bilan_h['niveau']: urgence_hydrique = 'haute'
+    elif "SURVEILLANCE" in bilan_h['niveau']: urgence_hydrique = 'moyenne'
+
+    # Urgence la plus haute des trois (à égalité, la première : mildiou, oïdium, hydrique)
+    urgences_map = {'haute': 3, 'moyenne': 2, 'faible': 1}
+    urgence_globale_str = max((urgence_mildiou, urgence_oidium, urgence_hydrique), key=urgences_map.get)
+
+    message_mildiou = decision['action']
+    message_oidium = decision['alerte_oidium'] if decision['alerte_oidium'] else "Risque faible"
+    message_hydrique = f"RFU à {bilan_h['rfu_pct']}% ({bilan_h['niveau']})"
+
+    alert_class = get_alert_class(urgence_globale_str)
+    urgence_icon = get_urgence_color(urgence_globale_str)
+
+    st.markdown(f"""
+    <div class="{alert_class} unified-decision">
+        <strong>{urgence_icon} Décision Unifiée</strong>
+        <ul>
+            <li><strong>Mildiou :</strong> {message_mildiou}</li>
+            <li><strong>Oïdium :</strong> {message_oidium}</li>
+            <li><strong>Hydrique :</strong> {message_hydrique}</li>
+        </ul>
+    </div>
+    """, unsafe_allow_html=True)
+
+    # --- NOUVEAU BLOC : GRAPHIQUE BILAN HYDRIQUE ---
+    st.markdown("---")
+    st.subheader("💧 Évolution du Bilan Hydrique (RFU)")
+
+    df_rfu = _cached_df_rfu(cles_analyse) if bilan_h.get('historique_pct') else None
+    if df_rfu is not None:
+        st.line_chart(df_rfu, color=['#0068C9', '#FF4B4B', '#FFA500']) # Bleu, Rouge, Orange
+    else:
+        st.info("Historique du bilan hydrique non disponible (calcul inactif en dormance).")
+    # ---------------------------------------------
+
+    # Météo actuelle
+    st.markdown("---")
+    st.subheader("🌤️ Conditions Météorologiques")
+    meteo = analyse['meteo_actuelle']
+    temp_moy, temp_min, temp_max, pluie, humidite, etp = (
+        meteo.get(k, 0) for k in ('temp_moy', 'temp_min', 'temp_max', 'precipitation', 'humidite', 'etp'))
+    col_w1, col_w2, col_w3, col_w4 = st.columns(4) # Ajout ETP
+    with col_w1:
+        st.metric("Température",
+                 f"{temp_moy:.1f}°C",
+                 delta=f"Min: {temp_min:.1f}°C | Max: {temp_max:.1f}°C")
+    with col_w2:
+        st.metric("Précipitations", f"{pluie:.1f} mm")
+    with col_w3:
+        st.metric("Humidité", f"{humidite:.0f}%")
+    with col_w4:
+        st.metric("ETP (Évaporation)", f"{etp:.1f} mm")
+
+    # Prévisions
+    if analyse['previsions_3j']:
+        st.markdown("---")
+        st.subheader("📅 Prévisions 3 Jours")
+        prev = analyse['previsions_3j']
+        st.info(f"💧 Pluie prévue : **{prev['pluie_totale']} mm**")
+        if prev['details']:
+            cols_prev = st.columns(len(prev['details']))
+            for col, (date, meteo_prev) in zip(cols_prev, prev['details'].items()):
+                temp_prev, pluie_prev, etp_prev = (meteo_prev.get(k, 'N/A') for k in ('temp_moy', 'precipitation', 'etp'))
+                # Une légende par jour, lignes séparées par un saut de ligne markdown
+                col.caption(f"**{date}**  \n🌡️ {temp_prev:.1f}°C  \n💧 {pluie_prev:.1f}mm  \n☀️ ETP: {etp_prev:.1f}mm")
+
+
+# ==============================================================================
+# --- TAB 2 : Détails Techniques (MODIFIÉ POUR ALIGNEMENT) ---
+# ==============================================================================
+@st.fragment
+def render_details(systeme, analyse, parcelle_selectionnee, utiliser_ipi, mode_debug):
+    """Onglet Détails Techniques (fragment)"""
+    risque_m = analyse['risque_infection']
+    risque_o = analyse['risque_oidium']
+    protection = analyse['protection_actuelle']
+    bilan_h = analyse['bilan_hydrique']
+    coef_stade = systeme.config.COEF_STADES.get(systeme.config.parcelles_par_nom[parcelle_selectionnee]['stade_actuel'], 0)
+
+    st.subheader("🔬 Détails des Calculs")
+
+    col_tech1, col_tech2 = st.columns(2)
+
+    with col_tech1:
+        st.markdown("### 🦠 Modèle Mildiou (Simple)")
+        st.markdown(f"""
+        **Score calculé :** {risque_m['score']}/10
+        **Facteurs pris en compte :**
+        - Pluie 48h
+        - Température (optimum 20-25°C)
+        - Humidité relative
+        - Coefficient stade : {coef_stade}
+        - Sensibilité cépages
+        **Résultat :** {risque_m['niveau']}
+        """)
+
+        st.markdown("---")
+
+        st.markdown("### 🍄 Modèle Oïdium")
+        st.markdown(f"""
+        **Score calculé :** {risque_o['score']}/10
+        **Facteurs pris en compte (7 jours) :**
+        - T° optimales (20-28°C) avec Humidité > 60%
+        - T° favorables (15-30°C) avec Humidité > 50%
+        - T° létales (> 33°C) (score négatif)
+        - Pluie > 5mm (effet lessivant, score négatif)
+        **Résultat :** {risque_o['niveau']}
+        """)
+
+    with col_tech2:
+        st.markdown("### 📊 Modèle Mildiou (IPI)")
+        if utiliser_ipi and risque_m['ipi'] is not None:
+            st.markdown(f"""
+            **IPI calculé :** {risque_m['ipi']}/100
+            **Méthode :**
+            - Interpolation bilinéaire
+            - Température vs Durée humectation
+            - Table Lalancette et al.
+            **Niveau :** {risque_m.get('ipi_niveau', 'N/A')}
+
+            💡 *L'IPI évalue la sévérité potentielle si infection.*
+            """)
+        elif utiliser_ipi:
+            st.info("IPI non calculé (voir conditions Mildiou Simple).")
+        else:
+            st.info("Le modèle IPI n'est pas activé (voir options dans la barre latérale).")
+
+        st.markdown("---")
+
+        # --- NOUVEAU BLOC BILAN HYDRIQUE ---
+        st.markdown("### 💧 Modèle Bilan Hydrique")
+        st.markdown(f"""
+        **RFU Max (Réglage) :** {bilan_h['rfu_max_mm']} mm
+        **Calcul (simplifié) :**
+        - `RFU_jour = RFU_veille + Pluie_jour - ETP_jour`
+        - Plafonnée entre 0 et {bilan_h['rfu_max_mm']} mm.
+        - **ETP :** *et0_fao_evapotranspiration* (Penman-Monteith)
+        **Résultat :** {bilan_h['rfu_pct']}% ({bilan_h['niveau']})
+        """)
+        # ------------------------------------
+
+    st.markdown("---")
+
+    # Protection détaillée
+    st.markdown("### 🛡️ Analyse de la Protection")
+    if protection['dernier_traitement']:
+        dt = protection['dernier_traitement']
+        carac = dt['caracteristiques']
+        col_prot1, col_prot2 = st.columns(2)
+        with col_prot1:
+            st.markdown(f"""
+            **Traitement actif :**
+            - Date : {dt['date']}
+            - Produit : {carac.get('nom', 'N/A')}
+            - Type : {carac.get('type', 'N/A')}
+            """)
+        with col_prot2:
+            st.markdown(f"""
+            **Caractéristiques :**
+            - Persistance : {carac.get('persistance_jours', 0)} jours
+            - Seuil lessivage : {carac.get('lessivage_seuil_mm', 0)} mm
+            - Dose appliquée : {dt.get('dose_kg_ha', 'N/A')} kg/ha
+            """)
+
+        facteur = protection.get('facteur_limitant', 'Inconnu')
+        if 'Pousse' in facteur:
+            st.warning(f"⚠️ **Facteur limitant : {facteur}**\n\nLa croissance végétale dilue la protection.")
+        elif 'Lessivage' in facteur:
+            st.error(f"🌧️ **Facteur limitant : {facteur}**\n\nProtection lessivée. Traitement nécessaire.")
+        else:
+            st.info(f"ℹ️ **Facteur limitant : {facteur}**")
+
+    # Mode debug
+    if mode_debug:
+        st.markdown("---")
+        st.subheader("🐛 Mode Debug")
+        st.markdown("Affichage des calculs internes (GDD, Mildiou, Oïdium) :")
+        # Trace conservée par parcelle/option : un changement d'onglet ne relance pas le calcul
+        cle_debug = f"debug_{parcelle_selectionnee}_{utiliser_ipi}"
+        if st.button("🐛 Générer la trace debug"):
+            with st.spinner("Recalcul avec traces debug..."):
+                f = io.StringIO()
+                systeme.analyser_parcelle(
+                    parcelle_selectionnee,
+                    utiliser_ipi=utiliser_ipi,
+                    sortie_debug=f
+                )
+                st.session_state[cle_debug] = f.getvalue()
+        if cle_debug in st.session_state:
+            st.markdown('<div class="debug-box">', unsafe_allow_html=True)
+            st.code(st.session_state[cle_debug], language="text")
+            st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            st.caption("Cliquez sur le bouton pour recalculer l'analyse avec les traces.")
+
+
+# ==============================================================================
+# --- TAB 3 : Historique (INCHANGÉ) ---
+# ==============================================================================
+@st.fragment
+def render_historique(systeme, parcelle_selectionnee):
+    """Onglet Historique des traitements (fragment)"""
+    st.subheader("📅 Historique des Traitements")
+
+    # Index par parcelle (déjà trié par date) : pas de parcours de tout l'historique
+    traitements_parcelle = systeme.traitements.traitements_periode('0000-01-01', '9999-12-31', parcelle_selectionnee)[::-1]
+
+    if traitements_parcelle:
+        df = pd.DataFrame.from_records(
+            ((t['date'], t['caracteristiques'].get('nom', t['produit']), t['caracteristiques'].get('type', 'N/A'),
+              t.get('dose_kg_ha', 'N/A'), t['caracteristiques'].get('persistance_jours', 0))
+             for t in traitements_parcelle),
+            columns=['Date', 'Produit', 'Type', 'Dose (kg/ha)', 'Persistance (j)']
+        )
+        # Dates parsées une fois pour toute la colonne (affichage et calcul du dernier traitement)
+        df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d')
+        st.dataframe(df, use_container_width=True, hide_index=True,
+                     column_config={'Date': st.column_config.DateColumn('Date', format='YYYY-MM-DD')})
+
+        st.markdown("---")
+        col_stat1, col_stat2, col_stat3 = st.columns(3)
+        with col_stat1:
+            st.metric("Total traitements", len(traitements_parcelle))
+        with col_stat2:
+            jours_depuis = (pd.Timestamp.now().normalize() - df['Date'].max()).days
+            st.metric("Dernier traitement", f"Il y a {jours_depuis}j")
+        with col_stat3:
+            # Comptage vectorisé sur la colonne du tableau affiché (déjà construit)
+            st.metric("Produit principal", df['Produit'].value_counts().index[0])
+    else:
+        st.info("📝 Aucun traitement enregistré pour cette parcelle")
+        st.markdown("Utilisez la page **Gestion Traitements** pour ajouter un traitement.")
+
+
 # Header
 st.title("🔍 Analyse Détaillée d'une Parcelle")
 
-# Initialiser le système
-@st.cache_resource
-def init_systeme():
+def _mtime(chemin):
+    """Date de modification d'un fichier (0 s'il n'existe pas), pour les clés de cache"""
+    return os.path.getmtime(chemin) if os.path.exists(chemin) else 0
+
+TRAITEMENTS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'traitements.json')
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config_vignoble.json')
+
+# Initialiser le système (reconstruit si les traitements ou la config ont changé sur disque,
+# et chaque jour : la météo n'est récupérée qu'à la construction ou via actualiser_meteo())
+@st.cache_resource(max_entries=1)
+def init_systeme(mtime_traitements=0, mtime_config=0, date_jour=None):
     return SystemeDecision()
 
+# Analyse mise en cache entre les reruns : invalidée par le jour, les traitements, la config
+# et la version de la session (bouton Actualiser, sans vider les caches des autres utilisateurs)
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_analyse(parcelle, utiliser_ipi, date_jour, mtime_traitements, mtime_config, version_session=0):
+    return init_systeme(mtime_traitements, mtime_config, date_jour).analyser_parcelle(parcelle, utiliser_ipi=utiliser_ipi, debug=False)
+
+# DataFrame du graphique RFU, construit une fois par analyse (mêmes clés) et non à chaque rerun
+@st.cache_data(ttl=600, show_spinner=False)
+def _cached_df_rfu(cles_analyse):
+    historique = _cached_analyse(*cles_analyse)['bilan_hydrique'].get('historique_pct')
+    if not historique:
+        return None
+    df_rfu = pd.DataFrame.from_dict(historique, orient='index', columns=['RFU (%)'])
+    df_rfu.index = pd.to_datetime(df_rfu.index)
+
+    # Ajouter les seuils pour le contexte
+    df_rfu['Seuil Stress (30%)'] = 30.0
+    df_rfu['Seuil Surveillance (60%)'] = 60.0
+    return df_rfu
+
 try:
-    systeme = init_systeme()
+    date_jour = datetime.now().strftime('%Y-%m-%d')
+    systeme = init_systeme(_mtime(TRAITEMENTS_FILE), _mtime(CONFIG_FILE), date_jour)
+    st.session_state.setdefault('version_analyse', 0)
 
     # Sidebar
     with st.sidebar:
         st.subheader("📍 Sélection Parcelle")
-        parcelle_names = [p['nom'] for p in systeme.config.parcelles]
+        parcelle_names = systeme.config.noms_parcelles
         parcelle_selectionnee = st.selectbox(
             "Choisir une parcelle",
             parcelle_names,
@@ -102,7 +496,9 @@ try:
                                 help="Affiche les calculs détaillés")
         st.markdown("---")
         if st.button("🔄 Actualiser l'analyse", type="primary"):
-            st.cache_resource.clear()
+            # Météo rechargée dans le système partagé, puis nouvelle analyse pour cette session seulement
+            systeme.actualiser_meteo()
+            st.session_state['version_analyse'] += 1
             st.rerun()
 
     # Analyse
@@ -110,379 +506,29 @@ try:
         # Onglets principaux
         tab1, tab2, tab3 = st.tabs(["📊 Synthèse", "🔬 Détails Techniques", "📅 Historique"])
 
-        # Récupérer l'analyse (en capturant le debug si besoin)
-        debug_output = ""
-        if mode_debug:
-            with st.spinner("Recalcul avec traces debug..."):
-                f = io.StringIO()
-                with redirect_stdout(f):
-                    analyse = systeme.analyser_parcelle(
-                        parcelle_selectionnee,
-                        utiliser_ipi=utiliser_ipi,
-                        debug=True
-                    )
-                debug_output = f.getvalue()
-        else:
-            analyse = systeme.analyser_parcelle(
-                parcelle_selectionnee,
-                utiliser_ipi=utiliser_ipi,
-                debug=False
-            )
+        # Récupérer l'analyse (la trace debug est générée à la demande dans l'onglet Détails)
+        cles_analyse = (
+            parcelle_selectionnee,
+            utiliser_ipi,
+            date_jour,
+            _mtime(TRAITEMENTS_FILE),
+            _mtime(CONFIG_FILE),
+            st.session_state['version_analyse']
+        )
+        analyse = _cached_analyse(*cles_analyse)
 
         if 'erreur' in analyse:
             st.error(f"❌ {analyse['erreur']}")
             st.stop()
 
-        # ==============================================================================
-        # --- TAB 1 : Synthèse (MODIFIÉ AVEC OÏDIUM ET GDD) ---
-        # ==============================================================================
         with tab1:
-            parcelle_obj = next(p for p in systeme.config.parcelles if p['nom'] == parcelle_selectionnee)
-            col_info1, col_info2, col_info3 = st.columns(3)
-            with col_info1:
-                st.markdown("### 📍 Parcelle")
-                st.markdown(f"**Nom :** {parcelle_obj['nom']}")
-                st.markdown(f"**Surface :** {parcelle_obj['surface_ha']} ha")
-            with col_info2:
-                st.markdown("### 🍇 Cépages")
-                for cepage in parcelle_obj['cepages']:
-                    st.markdown(f"- {cepage}")
-            with col_info3:
-                st.markdown("### 🌱 Stade Actuel (Manuel)")
-                st.markdown(f"**{parcelle_obj['stade_actuel']}**")
-                coef_stade = systeme.config.COEF_STADES.get(parcelle_obj['stade_actuel'], 0)
-                coef_pousse = systeme.traitements.COEF_POUSSE.get(parcelle_obj['stade_actuel'], 0)
-                st.caption(f"Coef. risque : {coef_stade}")
-                st.caption(f"Coef. pousse : {coef_pousse}")
-                if parcelle_obj.get('date_debourrement'):
-                    st.caption(f"Biofix GDD : {parcelle_obj['date_debourrement']}")
-
-            st.markdown("---")
-
-            # --- BLOC GDD ---
-            st.subheader("📈 Suivi Phénologique (GDD)")
-            gdd_info = analyse.get('gdd', {})
-
-            if gdd_info.get('mode_calcul') == 'En dormance (calcul GDD inactif)':
-                st.info("😴 Calcul GDD inactif. Le stade manuel de la parcelle est 'repos'.")
-            else:
-                col_gdd1, col_gdd2, col_gdd3 = st.columns(3)
-                with col_gdd1:
-                    st.metric("🌡️ GDD Cumulés (base 10°C)", f"{gdd_info.get('cumul', 0)} GDD",
-                              help=f"Calcul basé sur : {gdd_info.get('mode_calcul')}")
-                with col_gdd2:
-                    st.metric("🌱 Stade Estimé (GDD)", gdd_info.get('stade_estime', 'N/A'))
-                with col_gdd3:
-                    alerte_stade = gdd_info.get('alerte_stade', '')
-                    if "dans" in alerte_stade:
-                         st.info(f"**{alerte_stade}**")
-                    else:
-                        st.caption(alerte_stade)
-
-            st.markdown("---")
-
-            # Métriques principales
-            st.subheader("📊 Évaluation Actuelle")
-            col_m1, col_m2, col_m3 = st.columns(3)
-            risque_m = analyse['risque_infection']
-            risque_o = analyse['risque_oidium']
-            protection = analyse['protection_actuelle']
-            decision = analyse['decision']
-            bilan_h = analyse['bilan_hydrique'] # <-- NOUVEAU
-
-            with col_m1:
-                risque_m_color = "🔴" if risque_m['score'] >= 7 else ("🟠" if risque_m['score'] >= 4 else "🟢")
-                st.metric(
-                    f"{risque_m_color} Risque Mildiou",
-                    f"{risque_m['score']}/10",
-                    delta=risque_m['niveau'],
-                    help="Basé sur météo 48h + stade + sensibilité"
-                )
-                risque_o_color = "🔴" if risque_o['score'] >= 7 else ("🟠" if risque_o['score'] >= 4 else "🟢")
-                st.metric(
-                    f"{risque_o_color} Risque Oïdium",
-                    f"{risque_o['score']}/10",
-                    delta=risque_o['niveau'],
-                    help="Basé sur météo 7j (T° optimales, T° létales, humidité)"
-                )
-
-            with col_m2:
-                prot_color = "🟢" if protection['score'] >= 7 else ("🟠" if protection['score'] >= 4 else "🔴")
-                st.metric(
-                    f"{prot_color} Protection Résiduelle",
-                    f"{protection['score']}/10",
-                    delta=f"Limité par : {protection.get('facteur_limitant', 'N/A')}",
-                    delta_color="off"
-                )
-
-                # --- NOUVEAU BILAN HYDRIQUE ---
-                rfu_color = "🔴" if bilan_h['niveau'] == "STRESS FORT" else ("🟠" if bilan_h['niveau'] == "SURVEILLANCE" else "🟢")
-                st.metric(
-                    f"{rfu_color} Bilan Hydrique (RFU)",
-                    f"{bilan_h['rfu_pct']}%",
-                    delta=bilan_h['niveau'],
-                    delta_color="off"
-                )
-                # ------------------------------
-
-            with col_m3:
-                dec_color = "🔴" if decision['urgence'] == 'haute' else ("🟠" if decision['urgence'] == 'moyenne' else "🟢")
-                st.metric(
-                    f"{dec_color} Score Décision (Mildiou)",
-                    f"{decision['score']}/10",
-                    delta=decision['urgence'].upper(),
-                    help="Risque Mildiou - Protection"
-                )
-                if utiliser_ipi and risque_m['ipi'] is not None:
-                    st.metric(
-                        "IPI (Mildiou)",
-                        f"{risque_m['ipi']}/100",
-                        delta=risque_m.get('ipi_niveau', 'N/A'),
-                        help="Évalue la sévérité si infection Mildiou"
-                    )
-
-            # --- MODIFIÉ : Bandeau de Décision Unifié ---
-            st.markdown("---")
-            st.subheader("➜ Recommandation")
-
-            urgence_mildiou = decision['urgence']
-            urgence_oidium = 'faible'
-            if "FORT" in decision['alerte_oidium']: urgence_oidium = 'haute'
-            elif "MOYEN" in decision['alerte_oidium']: urgence_oidium = 'moyenne'
-
-            urgence_hydrique = 'faible'
-            if "STRESS FORT" in bilan_h['niveau']: urgence_hydrique = 'haute'
-            elif "SURVEILLANCE" in bilan_h['niveau']: urgence_hydrique = 'moyenne'
-
-            urgences_map = {'haute': 3, 'moyenne': 2, 'faible': 1}
-            urgence_globale_str = 'faible'
-
-            if urgences_map[urgence_mildiou] > urgences_map[urgence_globale_str]:
-                urgence_globale_str = urgence_mildiou
-            if urgences_map[urgence_oidium] > urgences_map[urgence_globale_str]:
-                urgence_globale_str = urgence_oidium
-            if urgences_map[urgence_hydrique] > urgences_map[urgence_globale_str]:
-                urgence_globale_str = urgence_hydrique
-
-            message_mildiou = decision['action']
-            message_oidium = decision['alerte_oidium'] if decision['alerte_oidium'] else "Risque faible"
-            message_hydrique = f"RFU à {bilan_h['rfu_pct']}% ({bilan_h['niveau']})"
-
-            alert_class = get_alert_class(urgence_globale_str)
-            urgence_icon = get_urgence_color(urgence_globale_str)
-
-            st.markdown(f"""
-            <div class="{alert_class} unified-decision">
-                <strong>{urgence_icon} Décision Unifiée</strong>
-                <ul>
-                    <li><strong>Mildiou :</strong> {message_mildiou}</li>
-                    <li><strong>Oïdium :</strong> {message_oidium}</li>
-                    <li><strong>Hydrique :</strong> {message_hydrique}</li>
-                </ul>
-            </div>
-            """, unsafe_allow_html=True)
-
-            # --- NOUVEAU BLOC : GRAPHIQUE BILAN HYDRIQUE ---
-            st.markdown("---")
-            st.subheader("💧 Évolution du Bilan Hydrique (RFU)")
-
-            if bilan_h.get('historique_pct'):
-                df_rfu = pd.DataFrame.from_dict(bilan_h['historique_pct'], orient='index', columns=['RFU (%)'])
-                df_rfu.index = pd.to_datetime(df_rfu.index)
-
-                # Ajouter les seuils pour le contexte
-                df_rfu['Seuil Stress (30%)'] = 30.0
-                df_rfu['Seuil Surveillance (60%)'] = 60.0
-
-                st.line_chart(df_rfu, color=['#0068C9', '#FF4B4B', '#FFA500']) # Bleu, Rouge, Orange
-            else:
-                st.info("Historique du bilan hydrique non disponible (calcul inactif en dormance).")
-            # ---------------------------------------------
-
-            # Météo actuelle
-            st.markdown("---")
-            st.subheader("🌤️ Conditions Météorologiques")
-            meteo = analyse['meteo_actuelle']
-            col_w1, col_w2, col_w3, col_w4 = st.columns(4) # Ajout ETP
-            with col_w1:
-                st.metric("Température",
-                         f"{meteo.get('temp_moy', 0):.1f}°C",
-                         delta=f"Min: {meteo.get('temp_min', 0):.1f}°C | Max: {meteo.get('temp_max', 0):.1f}°C")
-            with col_w2:
-                st.metric("Précipitations", f"{meteo.get('precipitation', 0):.1f} mm")
-            with col_w3:
-                st.metric("Humidité", f"{meteo.get('humidite', 0):.0f}%")
-            with col_w4:
-                st.metric("ETP (Évaporation)", f"{meteo.get('etp', 0):.1f} mm")
-
-            # Prévisions
-            if analyse['previsions_3j']:
-                st.markdown("---")
-                st.subheader("📅 Prévisions 3 Jours")
-                prev = analyse['previsions_3j']
-                st.info(f"💧 Pluie prévue : **{prev['pluie_totale']} mm**")
-                if prev['details']:
-                    cols_prev = st.columns(len(prev['details']))
-                    for idx, (date, meteo_prev) in enumerate(prev['details'].items()):
-                        with cols_prev[idx]:
-                            st.caption(f"**{date}**")
-                            st.caption(f"🌡️ {meteo_prev.get('temp_moy', 'N/A'):.1f}°C")
-                            st.caption(f"💧 {meteo_prev.get('precipitation', 'N/A'):.1f}mm")
-                            st.caption(f"☀️ ETP: {meteo_prev.get('etp', 'N/A'):.1f}mm")
-
-        # ==============================================================================
-        # --- TAB 2 : Détails Techniques (MODIFIÉ POUR ALIGNEMENT) ---
-        # ==============================================================================
+            render_synthese(systeme, analyse, parcelle_selectionnee, utiliser_ipi, cles_analyse)
         with tab2:
-            st.subheader("🔬 Détails des Calculs")
-
-            col_tech1, col_tech2 = st.columns(2)
-
-            with col_tech1:
-                st.markdown("### 🦠 Modèle Mildiou (Simple)")
-                st.markdown(f"""
-                **Score calculé :** {risque_m['score']}/10
-                **Facteurs pris en compte :**
-                - Pluie 48h
-                - Température (optimum 20-25°C)
-                - Humidité relative
-                - Coefficient stade : {coef_stade}
-                - Sensibilité cépages
-                **Résultat :** {risque_m['niveau']}
-                """)
-
-                st.markdown("---")
-
-                st.markdown("### 🍄 Modèle Oïdium")
-                st.markdown(f"""
-                **Score calculé :** {risque_o['score']}/10
-                **Facteurs pris en compte (7 jours) :**
-                - T° optimales (20-28°C) avec Humidité > 60%
-                - T° favorables (15-30°C) avec Humidité > 50%
-                - T° létales (> 33°C) (score négatif)
-                - Pluie > 5mm (effet lessivant, score négatif)
-                **Résultat :** {risque_o['niveau']}
-                """)
-
-            with col_tech2:
-                st.markdown("### 📊 Modèle Mildiou (IPI)")
-                if utiliser_ipi and risque_m['ipi'] is not None:
-                    st.markdown(f"""
-                    **IPI calculé :** {risque_m['ipi']}/100
-                    **Méthode :**
-                    - Interpolation bilinéaire
-                    - Température vs Durée humectation
-                    - Table Lalancette et al.
-                    **Niveau :** {risque_m.get('ipi_niveau', 'N/A')}
-                    
-                    💡 *L'IPI évalue la sévérité potentielle si infection.*
-                    """)
-                elif utiliser_ipi:
-                    st.info("IPI non calculé (voir conditions Mildiou Simple).")
-                else:
-                    st.info("Le modèle IPI n'est pas activé (voir options dans la barre latérale).")
-
-                st.markdown("---")
-
-                # --- NOUVEAU BLOC BILAN HYDRIQUE ---
-                st.markdown("### 💧 Modèle Bilan Hydrique")
-                st.markdown(f"""
-                **RFU Max (Réglage) :** {bilan_h['rfu_max_mm']} mm
-                **Calcul (simplifié) :**
-                - `RFU_jour = RFU_veille + Pluie_jour - ETP_jour`
-                - Plafonnée entre 0 et {bilan_h['rfu_max_mm']} mm.
-                - **ETP :** *et0_fao_evapotranspiration* (Penman-Monteith)
-                **Résultat :** {bilan_h['rfu_pct']}% ({bilan_h['niveau']})
-                """)
-                # ------------------------------------
-
-            st.markdown("---")
-
-            # Protection détaillée
-            st.markdown("### 🛡️ Analyse de la Protection")
-            if protection['dernier_traitement']:
-                dt = protection['dernier_traitement']
-                carac = dt['caracteristiques']
-                col_prot1, col_prot2 = st.columns(2)
-                with col_prot1:
-                    st.markdown(f"""
-                    **Traitement actif :**
-                    - Date : {dt['date']}
-                    - Produit : {carac.get('nom', 'N/A')}
-                    - Type : {carac.get('type', 'N/A')}
-                    """)
-                with col_prot2:
-                    st.markdown(f"""
-                    **Caractéristiques :**
-                    - Persistance : {carac.get('persistance_jours', 0)} jours
-                    - Seuil lessivage : {carac.get('lessivage_seuil_mm', 0)} mm
-                    - Dose appliquée : {dt.get('dose_kg_ha', 'N/A')} kg/ha
-                    """)
-
-                facteur = protection.get('facteur_limitant', 'Inconnu')
-                if 'Pousse' in facteur:
-                    st.warning(f"⚠️ **Facteur limitant : {facteur}**\n\nLa croissance végétale dilue la protection.")
-                elif 'Lessivage' in facteur:
-                    st.error(f"🌧️ **Facteur limitant : {facteur}**\n\nProtection lessivée. Traitement nécessaire.")
-                else:
-                    st.info(f"ℹ️ **Facteur limitant : {facteur}**")
-
-            # Mode debug
-            if mode_debug:
-                st.markdown("---")
-                st.subheader("🐛 Mode Debug")
-                st.markdown("Affichage des calculs internes (GDD, Mildiou, Oïdium) :")
-                st.markdown('<div class="debug-box">', unsafe_allow_html=True)
-                st.code(debug_output, language="text")
-                st.markdown('</div>', unsafe_allow_html=True)
-
-        # ==============================================================================
-        # --- TAB 3 : Historique (INCHANGÉ) ---
-        # ==============================================================================
+            render_details(systeme, analyse, parcelle_selectionnee, utiliser_ipi, mode_debug)
         with tab3:
-            st.subheader("📅 Historique des Traitements")
-
-            traitements_parcelle = [
-                t for t in systeme.traitements.historique.get('traitements', [])
-                if t['parcelle'] == parcelle_selectionnee
-            ]
-
-            if traitements_parcelle:
-                traitements_parcelle.sort(key=lambda x: x['date'], reverse=True)
-
-                df_data = []
-                for t in traitements_parcelle:
-                    df_data.append({
-                        'Date': t['date'],
-                        'Produit': t['caracteristiques'].get('nom', t['produit']),
-                        'Type': t['caracteristiques'].get('type', 'N/A'),
-                        'Dose (kg/ha)': t.get('dose_kg_ha', 'N/A'),
-                        'Persistance (j)': t['caracteristiques'].get('persistance_jours', 0)
-                    })
-                df = pd.DataFrame(df_data)
-                st.dataframe(df, use_container_width=True, hide_index=True)
-
-                st.markdown("---")
-                col_stat1, col_stat2, col_stat3 = st.columns(3)
-                with col_stat1:
-                    st.metric("Total traitements", len(traitements_parcelle))
-                with col_stat2:
-                    dernier = traitements_parcelle[0]
-                    jours_depuis = (datetime.now() - datetime.strptime(dernier['date'], '%Y-%m-%d')).days
-                    st.metric("Dernier traitement", f"Il y a {jours_depuis}j")
-                with col_stat3:
-                    produits = [t['caracteristiques'].get('nom', 'N/A') for t in traitements_parcelle]
-                    if produits:
-                        produit_freq = max(set(produits), key=produits.count)
-                        st.metric("Produit principal", produit_freq)
-                    else:
-                        st.metric("Produit principal", "N/A")
-            else:
-                st.info("📝 Aucun traitement enregistré pour cette parcelle")
-                st.markdown("Utilisez la page **Gestion Traitements** pour ajouter un traitement.")
+            render_historique(systeme, parcelle_selectionnee)
 
 except Exception as e:
     st.error(f"❌ Erreur : {str(e)}")
-    import traceback
     with st.expander("Détails de l'erreur"):
         st.code(traceback.format_exc())
\ No newline at end of file
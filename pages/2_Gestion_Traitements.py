@@ -7,11 +7,12 @@ Fichier : pages/2_Gestion_Traitements.py
 import streamlit as st
 import sys
 import os
+import traceback
 from datetime import datetime, timedelta
 import pandas as pd
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from mildiou_prevention import SystemeDecision
+from mildiou_prevention import SystemeDecision, GestionTraitements
 
 st.set_page_config(page_title="Gestion Traitements", page_icon="💊", layout="wide")
 
@@ -22,6 +23,14 @@ st.title("💊 Gestion des Traitements")
 def init_systeme():
     return SystemeDecision()
 
+# {nom du produit: clé FONGICIDES} (constante de classe, construite au chargement de la page)
+FONGICIDES_PAR_NOM = {f['nom']: cle for cle, f in GestionTraitements.FONGICIDES.items()}
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _csv_bytes(df):
+    """Export CSV du tableau filtré, réencodé seulement quand son contenu change"""
+    return df.to_csv(index=False, float_format='%.2f').encode('utf-8')
+
 try:
     systeme = init_systeme()
 
@@ -38,7 +47,7 @@ try:
             # SANS st.form() pour permettre la mise à jour dynamique
 
             # Sélection parcelle
-            parcelle_names = [p['nom'] for p in systeme.config.parcelles]
+            parcelle_names = systeme.config.noms_parcelles
             parcelle = st.selectbox(
                 "📍 Parcelle *",
                 parcelle_names,
@@ -56,18 +65,17 @@ try:
             )
 
             # Produit - MISE À JOUR DYNAMIQUE
-            produits = list(systeme.traitements.FONGICIDES.keys())
-            produits_noms = [systeme.traitements.FONGICIDES[p]['nom'] for p in produits]
+            produits_par_nom = FONGICIDES_PAR_NOM
 
             produit_selectionne = st.selectbox(
                 "💊 Produit *",
-                produits_noms,
+                tuple(produits_par_nom),
                 help="Fongicide utilisé",
                 key="select_produit"
             )
 
             # Retrouver la clé du produit
-            produit_key = produits[produits_noms.index(produit_selectionne)]
+            produit_key = produits_par_nom[produit_selectionne]
             produit_info = systeme.traitements.FONGICIDES[produit_key]
 
             # Afficher infos produit - SE MET À JOUR AUTOMATIQUEMENT
@@ -117,8 +125,9 @@ try:
                     - Dose : {dose} kg/ha
                     """)
 
-                    # Rafraîchir le cache
-                    st.cache_resource.clear()
+                    # Le système en cache est déjà à jour (historique modifié en place) et les autres pages
+                    # suivent la date de modification de traitements.json : seul le cache de cette page est vidé
+                    _csv_bytes.clear()
 
                     # Recharger pour afficher dans l'historique
                     st.rerun()
@@ -163,7 +172,7 @@ try:
 
             with col_filter1:
                 # Filtre parcelle
-                parcelles_filtre = ["Toutes"] + [p['nom'] for p in systeme.config.parcelles]
+                parcelles_filtre = ("Toutes",) + systeme.config.noms_parcelles
                 parcelle_filtre = st.selectbox("Filtrer par parcelle", parcelles_filtre)
 
             with col_filter2:
@@ -181,34 +190,23 @@ try:
                     max_value=datetime.now()
                 )
 
-            # Appliquer filtres
-            traitements_filtres = traitements.copy()
-
-            if parcelle_filtre != "Toutes":
-                traitements_filtres = [t for t in traitements_filtres if t['parcelle'] == parcelle_filtre]
-
-            traitements_filtres = [
-                t for t in traitements_filtres
-                if date_debut.strftime('%Y-%m-%d') <= t['date'] <= date_fin.strftime('%Y-%m-%d')
-            ]
-
-            # Tri
-            traitements_filtres.sort(key=lambda x: x['date'], reverse=True)
+            # Appliquer filtres (index par parcelle trié par date), du plus récent au plus ancien
+            traitements_filtres = systeme.traitements.traitements_periode(
+                date_debut.strftime('%Y-%m-%d'),
+                date_fin.strftime('%Y-%m-%d'),
+                None if parcelle_filtre == "Toutes" else parcelle_filtre
+            )[::-1]
 
             if traitements_filtres:
-                # Créer DataFrame
-                df_data = []
-                for t in traitements_filtres:
-                    df_data.append({
-                        'Date': t['date'],
-                        'Parcelle': t['parcelle'],
-                        'Produit': t['caracteristiques'].get('nom', t['produit']),
-                        'Type': t['caracteristiques'].get('type', 'N/A'),
-                        'Dose (kg/ha)': f"{t.get('dose_kg_ha', 0):.2f}",
-                        'Persistance': f"{t['caracteristiques'].get('persistance_jours', 0)}j"
-                    })
-
-                df = pd.DataFrame(df_data)
+                # Créer DataFrame (colonnes typées : le formatage est fait par column_config)
+                df = pd.DataFrame.from_records(
+                    ((t['date'], t['parcelle'], t['caracteristiques'].get('nom', t['produit']),
+                      t['caracteristiques'].get('type', 'N/A'), float(t.get('dose_kg_ha', 0)),
+                      int(t['caracteristiques'].get('persistance_jours', 0)))
+                     for t in traitements_filtres),
+                    columns=['Date', 'Parcelle', 'Produit', 'Type', 'Dose (kg/ha)', 'Persistance']
+                )
+                df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d')
 
                 # Affichage
                 st.dataframe(
@@ -219,6 +217,8 @@ try:
                         "Date": st.column_config.DateColumn("Date", format="DD/MM/YYYY"),
                         "Parcelle": st.column_config.TextColumn("Parcelle", width="medium"),
                         "Produit": st.column_config.TextColumn("Produit", width="large"),
+                        "Dose (kg/ha)": st.column_config.NumberColumn("Dose (kg/ha)", format="%.2f"),
+                        "Persistance": st.column_config.NumberColumn("Persistance", format="%dj"),
                     }
                 )
 
@@ -226,7 +226,7 @@ try:
 
                 # Export CSV
                 st.markdown("---")
-                csv = df.to_csv(index=False).encode('utf-8')
+                csv = _csv_bytes(df)
                 st.download_button(
                     label="📥 Télécharger en CSV",
                     data=csv,
@@ -281,19 +281,16 @@ try:
                 with col_custom2:
                     date_fin = st.date_input("Date fin", value=datetime.now()).strftime('%Y-%m-%d')
 
-            # Filtrer traitements
-            traitements_periode = [
-                t for t in traitements
-                if date_debut <= t['date'] <= date_fin
-            ]
+            # Filtrer traitements (vue colonnes pandas : masque booléen sur dates typées)
+            df_periode = systeme.traitements.colonnes_periode(date_debut, date_fin)
 
-            if traitements_periode:
+            if not df_periode.empty:
                 # Métriques principales
                 st.markdown("---")
                 col_stat1, col_stat2, col_stat3, col_stat4 = st.columns(4)
 
                 with col_stat1:
-                    st.metric("Total Traitements", len(traitements_periode))
+                    st.metric("Total Traitements", len(df_periode))
 
                 with col_stat2:
                     # IFT
@@ -309,8 +306,7 @@ try:
 
                 with col_stat4:
                     # Coût estimé (si on avait les prix)
-                    st.metric("Parcelles traitées",
-                             len(set(t['parcelle'] for t in traitements_periode)))
+                    st.metric("Parcelles traitées", df_periode['parcelle'].nunique())
 
                 st.markdown("---")
 
@@ -321,44 +317,23 @@ try:
                     st.subheader("Répartition par Parcelle")
 
                     # Compter traitements par parcelle
-                    parcelles_count = {}
-                    for t in traitements_periode:
-                        parcelles_count[t['parcelle']] = parcelles_count.get(t['parcelle'], 0) + 1
-
-                    df_parcelles = pd.DataFrame(list(parcelles_count.items()),
-                                               columns=['Parcelle', 'Traitements'])
-                    st.bar_chart(df_parcelles.set_index('Parcelle'))
+                    st.bar_chart(df_periode.groupby('parcelle').size().rename('Traitements').rename_axis('Parcelle'))
 
                 with col_graph2:
                     st.subheader("Répartition par Produit")
 
                     # Compter par produit
-                    produits_count = {}
-                    for t in traitements_periode:
-                        prod = t['caracteristiques'].get('nom', t['produit'])
-                        produits_count[prod] = produits_count.get(prod, 0) + 1
-
-                    df_produits = pd.DataFrame(list(produits_count.items()),
-                                              columns=['Produit', 'Utilisations'])
-                    st.bar_chart(df_produits.set_index('Produit'))
+                    st.bar_chart(df_periode.groupby('produit').size().rename('Utilisations').rename_axis('Produit'))
 
                 # Timeline
                 st.markdown("---")
                 st.subheader("📅 Timeline des Traitements")
 
                 # Créer un graphique timeline
-                df_timeline = pd.DataFrame([{
-                    'Date': datetime.strptime(t['date'], '%Y-%m-%d'),
-                    'Parcelle': t['parcelle'],
-                    'Produit': t['caracteristiques'].get('nom', t['produit'])[:20]
-                } for t in traitements_periode])
-
-                if not df_timeline.empty:
-                    df_timeline['Mois'] = df_timeline['Date'].dt.strftime('%Y-%m')
-                    timeline_count = df_timeline.groupby('Mois').size()
+                timeline_count = df_periode.groupby(df_periode['jour'].dt.strftime('%Y-%m').rename('Mois')).size()
 
-                    st.line_chart(timeline_count)
-                    st.caption("Nombre de traitements par mois")
+                st.line_chart(timeline_count)
+                st.caption("Nombre de traitements par mois")
 
                 # Tableau récapitulatif IFT
                 st.markdown("---")
@@ -375,6 +350,5 @@ try:
 
 except Exception as e:
     st.error(f"❌ Erreur : {str(e)}")
-    import traceback
     with st.expander("Détails de l'erreur"):
         st.code(traceback.format_exc())
\ No newline at end of file
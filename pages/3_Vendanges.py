@@ -9,13 +9,19 @@ import sys
 import os
 from datetime import datetime, date
 import pandas as pd
+import numpy as np
+import altair as alt
+import io
 import json
+import contextlib
 import traceback
+import bisect
+import time
 
 # --- Initialisation des chemins et Imports ---
 try:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    from mildiou_prevention import SystemeDecision, ConfigVignoble
+    from mildiou_prevention import SystemeDecision, ConfigVignoble, _dumps_json
 except ImportError:
     st.error("❌ Erreur d'importation : Le fichier 'mildiou_prevention.py' n'est pas trouvé.")
     st.stop()
@@ -30,6 +36,18 @@ class GestionVendanges:
         script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.fichier = os.path.join(script_dir, fichier)
         self.donnees = self.charger_donnees()
+        self._memo = {}  # Calculs mémorisés entre les reruns, vidés à chaque sauvegarde
+        # Version des données, clé des st.cache_data : unique par instance, incrémentée à chaque sauvegarde
+        self._version = time.monotonic_ns()
+        self._dirty = False
+        self._bulk = 0
+        self._indexer_campagnes()
+
+    def _indexer_campagnes(self):
+        """Index {année: campagne} (la première campagne d'une année, comme le parcours de la liste)"""
+        self._par_annee = {}
+        for c in self.donnees['campagnes']:
+            self._par_annee.setdefault(c['annee'], c)
 
     def charger_donnees(self):
         """Charge les données vendanges"""
@@ -39,6 +57,8 @@ class GestionVendanges:
                 # Migration : supprimer campagne_courante si elle existe
                 if 'campagne_courante' in data:
                     del data['campagne_courante']
+                # Campagnes gardées triées par année (tri stable, puis insertions ordonnées)
+                data['campagnes'].sort(key=lambda x: x['annee'])
                 return data
         except FileNotFoundError:
             return self.creer_structure_defaut()
@@ -48,16 +68,32 @@ class GestionVendanges:
         return {'campagnes': []}
 
     def sauvegarder(self):
-        """Sauvegarde les données"""
-        with open(self.fichier, 'w', encoding='utf-8') as f:
-            json.dump(self.donnees, f, indent=2, ensure_ascii=False)
+        """Sauvegarde les données (toute modification passe par ici : invalide les calculs mémorisés)"""
+        self.invalider_cache()
+        if self._bulk > 0:
+            self._dirty = True
+            return
+        # Écriture atomique : un fichier temporaire remplace l'ancien une fois complet
+        tmp = self.fichier + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_dumps_json(self.donnees))
+        os.replace(tmp, self.fichier)
+
+    @contextlib.contextmanager
+    def bulk(self):
+        """Diffère l'écriture disque jusqu'à la sortie du bloc (modifications en série)"""
+        self._bulk += 1
+        try:
+            yield self
+        finally:
+            self._bulk -= 1
+            if not self._bulk and self._dirty:
+                self._dirty = False
+                self.sauvegarder()
 
     def get_campagne(self, annee):
         """Récupère une campagne par année"""
-        for c in self.donnees['campagnes']:
-            if c['annee'] == annee:
-                return c
-        return None
+        return self._par_annee.get(annee)
 
     def get_campagne_active(self):
         """Retourne la campagne active (dernière non-validée ou année en cours)"""
@@ -80,9 +116,29 @@ class GestionVendanges:
 
         return campagne
 
+    @property
+    def version(self):
+        """Version des données, à passer en clé aux st.cache_data qui en dépendent"""
+        return self._version
+
+    def memoriser(self, cle, calcul):
+        """Résultat mémorisé de calcul() jusqu'à la prochaine sauvegarde"""
+        if cle not in self._memo:
+            self._memo[cle] = calcul()
+        return self._memo[cle]
+
+    def invalider_cache(self):
+        """Oublie les calculs mémorisés et change de version (nouvelles clés pour les st.cache_data)"""
+        self._memo.clear()
+        self._version += 1
+
+    def _inserer_campagne(self, campagne):
+        """Insère une campagne en gardant la liste triée par année"""
+        bisect.insort(self.donnees['campagnes'], campagne, key=lambda x: x['annee'])
+
     def get_toutes_campagnes_triees(self):
-        """Retourne toutes les campagnes triées par année décroissante"""
-        return sorted(self.donnees['campagnes'], key=lambda x: x['annee'], reverse=True)
+        """Retourne toutes les campagnes triées par année décroissante (liste déjà triée : simple inversion)"""
+        return self.donnees['campagnes'][::-1]
 
     def creer_campagne(self, annee):
         """Crée une nouvelle campagne"""
@@ -108,28 +164,34 @@ class GestionVendanges:
                 'prime_reelle': None,
                 'date_validation': None
             },
-            'parcelles_vendangees': []
+            'parcelles_vendangees': [],
+            'next_id': 1
         }
-        self.donnees['campagnes'].append(campagne)
+        self._inserer_campagne(campagne)
+        self._par_annee.setdefault(annee, campagne)
         self.sauvegarder()
         return campagne
 
     def ajouter_ticket(self, date_ticket, ticket):
-        """Ajoute un ticket de vendange (crée la campagne si nécessaire)"""
+        """Ajoute un ticket de vendange (crée la campagne si nécessaire) ; date_ticket : date ou 'AAAA-MM-JJ'"""
         # Extraire l'année de la date du ticket
-        annee = datetime.strptime(date_ticket, '%Y-%m-%d').year
+        annee = date_ticket.year if isinstance(date_ticket, date) else int(date_ticket[:4])
 
-        campagne = self.get_campagne(annee)
-        if not campagne:
-            campagne = self.creer_campagne(annee)
+        with self.bulk():  # création éventuelle de la campagne + ticket : une seule écriture
+            campagne = self.get_campagne(annee)
+            if not campagne:
+                campagne = self.creer_campagne(annee)
 
-        # Vérifier si la campagne est validée
-        if campagne['validation']['validee']:
-            return False, f"❌ La campagne {annee} est validée. Impossible d'ajouter des tickets."
+            # Vérifier si la campagne est validée
+            if campagne['validation']['validee']:
+                return False, f"❌ La campagne {annee} est validée. Impossible d'ajouter des tickets."
 
-        ticket['id'] = len(campagne['tickets']) + 1
-        campagne['tickets'].append(ticket)
-        self.sauvegarder()
+            # Compteur monotone : un id n'est jamais réattribué après une suppression
+            # (campagnes antérieures au compteur : reprise après le plus grand id existant)
+            ticket['id'] = campagne.get('next_id') or max((t['id'] for t in campagne['tickets']), default=0) + 1
+            campagne['next_id'] = ticket['id'] + 1
+            campagne['tickets'].append(ticket)
+            self.sauvegarder()
         return True, f"✅ Ticket enregistré pour la campagne {annee}"
 
     def supprimer_ticket(self, annee, ticket_id):
@@ -139,20 +201,35 @@ class GestionVendanges:
             campagne['tickets'] = [t for t in campagne['tickets'] if t['id'] != ticket_id]
             self.sauvegarder()
 
+    @staticmethod
+    def _poids_degre(tickets):
+        """(poids total, somme poids × degré) des tickets, en un passage NumPy"""
+        poids = np.fromiter((t['poids_kg'] for t in tickets), dtype=np.float64, count=len(tickets))
+        degre = np.fromiter((t['degre'] for t in tickets), dtype=np.float64, count=len(tickets))
+        return float(poids.sum()), float(poids @ degre)
+
     def calculer_totaux(self, annee):
-        """Calcule les totaux d'une campagne"""
+        """Calcule les totaux d'une campagne (mémorisés jusqu'à la prochaine sauvegarde)"""
+        return self.memoriser(('totaux', annee), lambda: self._calculer_totaux(annee))
+
+    def _calculer_totaux(self, annee):
         campagne = self.get_campagne(annee)
         if not campagne or not campagne['tickets']:
             return None
 
         tickets = campagne['tickets']
-        poids_total = sum(t['poids_kg'] for t in tickets)
-
-        # Degré moyen pondéré
-        if poids_total > 0:
-            degre_moyen = sum(t['poids_kg'] * t['degre'] for t in tickets) / poids_total
+        historique = campagne.get('donnees_historiques', {})
+        if campagne['validation']['validee'] and 'degre_moyen' in historique:
+            # Campagne validée : tickets figés, agrégats déjà enregistrés par valider_campagne
+            poids_total, degre_moyen = historique['poids_kg'], historique['degre_moyen']
         else:
-            degre_moyen = 0
+            poids_total, poids_degre = self._poids_degre(tickets)
+
+            # Degré moyen pondéré
+            if poids_total > 0:
+                degre_moyen = poids_degre / poids_total
+            else:
+                degre_moyen = 0
 
         # Calculs
         rdt = campagne['parametres']['rendement_theorique'] / 100
@@ -206,8 +283,8 @@ class GestionVendanges:
             # Calculer données historiques pour dashboard
             tickets = campagne['tickets']
             if tickets:
-                poids_total = sum(t['poids_kg'] for t in tickets)
-                degre_moyen = sum(t['poids_kg'] * t['degre'] for t in tickets) / poids_total if poids_total > 0 else 0
+                poids_total, poids_degre = self._poids_degre(tickets)
+                degre_moyen = poids_degre / poids_total if poids_total > 0 else 0
 
                 hl_reel = donnees_validation['hl_reel']
                 prix_u_reel = donnees_validation['prix_u_reel']
@@ -253,6 +330,7 @@ class GestionVendanges:
     def vider_historique(self):
         """Vide tout l'historique (DANGER)"""
         self.donnees['campagnes'] = []
+        self._par_annee = {}
         self.sauvegarder()
 
     def devalider_campagne(self, annee):
@@ -269,53 +347,200 @@ class GestionVendanges:
     def supprimer_campagne(self, annee):
         """Supprime une campagne spécifique"""
         self.donnees['campagnes'] = [c for c in self.donnees['campagnes'] if c['annee'] != annee]
+        self._par_annee.pop(annee, None)
         self.sauvegarder()
 
     def importer_historique(self, df):
-        """Importe l'historique depuis un DataFrame"""
-        for _, row in df.iterrows():
-            annee = int(row['Année'])
-
-            if self.get_campagne(annee):
-                continue
-
+        """Importe l'historique depuis un DataFrame (colonnes converties en bloc, années déjà présentes ignorées)"""
+        def colonne(nom, defaut):
+            return df[nom].astype(float) if nom in df else pd.Series(float(defaut), index=df.index)
+
+        annees = df['Année'].astype(int)
+        prix_u = colonne('Prix U', 100)
+        revenus = colonne('Revenus €', 0)
+        hl_reel = (revenus / prix_u).astype(object).where(('Revenus €' in df) & (prix_u != 0), None)
+        lignes = pd.DataFrame({
+            'annee': annees, 'rendement': colonne('rendement jus', 73), 'prix_u': prix_u,
+            'frais_u': colonne('Frais U', 15.73), 'prime_u': colonne('Prime U', 0), 'hl_reel': hl_reel,
+            'prime': colonne('Prime €', 0), 'poids': colonne('Poids Kg', 0), 'hl': colonne('H°', 0),
+            'ca_brut': revenus, 'ca_net': colonne('Chiffre Affaire Net €', 0), 'total_ha': colonne('Total Ha', 0),
+            'ca_ha': colonne('CA / Ha (€)', 0), 'euro_hl': colonne('€/hl (72% rdt)', 0), 'poids_ha': colonne('Poids/Ha', 0)
+        })[~annees.isin(list(self._par_annee)) & ~annees.duplicated()]
+
+        for r in lignes.to_dict('records'):
             campagne = {
-                'annee': annee,
+                'annee': r['annee'],
                 'status': 'validee',
                 'tickets': [],
                 'parametres': {
-                    'rendement_theorique': float(row.get('rendement jus', 73)),
-                    'prix_u': float(row.get('Prix U', 100)),
-                    'frais_vinif_u': float(row.get('Frais U', 15.73)),
-                    'prime_u': float(row.get('Prime U', 0))
+                    'rendement_theorique': r['rendement'],
+                    'prix_u': r['prix_u'],
+                    'frais_vinif_u': r['frais_u'],
+                    'prime_u': r['prime_u']
                 },
                 'validation': {
                     'validee': True,
-                    'hl_reel': float(row.get('Revenus €', 0)) / float(row.get('Prix U', 100)) if 'Revenus €' in row and float(row.get('Prix U', 100)) != 0 else None,
-                    'prix_u_reel': float(row.get('Prix U', 100)),
+                    'hl_reel': r['hl_reel'],
+                    'prix_u_reel': r['prix_u'],
                     'frais_reels': None,
-                    'prime_reelle': float(row.get('Prime €', 0)),
-                    'date_validation': f"{annee}-12-31"
+                    'prime_reelle': r['prime'],
+                    'date_validation': f"{r['annee']}-12-31"
                 },
                 'donnees_historiques': {
-                    'poids_kg': float(row.get('Poids Kg', 0)),
-                    'hl': float(row.get('H°', 0)) if 'H°' in row else None,
-                    'ca_brut': float(row.get('Revenus €', 0)),
-                    'ca_net': float(row.get('Chiffre Affaire Net €', 0)),
-                    'total_ha': float(row.get('Total Ha', 0)),
-                    'ca_ha': float(row.get('CA / Ha (€)', 0)),
-                    'euro_hl': float(row.get('€/hl (72% rdt)', 0)),
-                    'poids_ha': float(row.get('Poids/Ha', 0)),
-                    'rendement_reel': float(row.get('rendement jus', 73))
+                    'poids_kg': r['poids'],
+                    'hl': r['hl'] if 'H°' in df else None,
+                    'ca_brut': r['ca_brut'],
+                    'ca_net': r['ca_net'],
+                    'total_ha': r['total_ha'],
+                    'ca_ha': r['ca_ha'],
+                    'euro_hl': r['euro_hl'],
+                    'poids_ha': r['poids_ha'],
+                    'rendement_reel': r['rendement']
                 },
                 'parcelles_vendangees': []
             }
 
-            self.donnees['campagnes'].append(campagne)
+            self._inserer_campagne(campagne)
+            self._par_annee[campagne['annee']] = campagne
 
         self.sauvegarder()
 
 
+# Indicateurs du dashboard : {colonne: titre}, les valeurs nulles de CA Net et rendement sont masquées
+GRAPHIQUES_BARRES = {'Poids_kg': 'Poids Kg par Année', 'Poids_Ha': 'Poids/Ha (tonnes/ha)', 'CA_Net': "Chiffre d'Affaire Net (€)"}
+GRAPHIQUES_COURBES = {'CA_Ha': 'CA/Ha (€)', 'Euro_Hl': '€/Hl', 'Rendement_Reel': 'Rendement Réel (%)'}
+INDICATEURS_POSITIFS = ('CA_Net', 'Rendement_Reel')
+
+
+def _graphique_facettes(df, indicateurs, marque):
+    """Un graphique Altair à une facette par indicateur (format long, échelles Y indépendantes)"""
+    long = df.melt(id_vars='Année_str', value_vars=list(indicateurs), var_name='indicateur', value_name='valeur')
+    long = long[(long['valeur'] > 0) | ~long['indicateur'].isin(INDICATEURS_POSITIFS)]
+    long['indicateur'] = long['indicateur'].map(indicateurs)
+    base = alt.Chart(long).mark_bar() if marque == 'bar' else alt.Chart(long).mark_line(point=True)
+    return base.encode(
+        x=alt.X('Année_str:O', title=None),
+        y=alt.Y('valeur:Q', title=None),
+        tooltip=['Année_str', 'valeur']
+    ).properties(width=220, height=200).facet(
+        facet=alt.Facet('indicateur:N', title=None, sort=list(indicateurs.values())), columns=3
+    ).resolve_scale(y='independent')
+
+
+# Types des colonnes lues par importer_historique (pas d'inférence ; float64 : montants et prix gardés exacts)
+IMPORT_DTYPES = {
+    'Année': 'Int64', 'Poids Kg': 'float64', 'H°': 'float64', 'Prix U': 'float64', 'Revenus €': 'float64',
+    'Chiffre Affaire Net €': 'float64', 'Total Ha': 'float64', 'CA / Ha (€)': 'float64', '€/hl (72% rdt)': 'float64',
+    'Poids/Ha': 'float64', 'Frais U': 'float64', 'Prime U': 'float64', 'Prime €': 'float64', 'rendement jus': 'float64'
+}
+
+
+# Signatures des fichiers Excel : .xlsx (archive zip) et .xls (conteneur OLE2)
+SIGNATURES_EXCEL = (b'PK\x03\x04', b'\xd0\xcf\x11\xe0')
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _lire_fichier_import(contenu, nrows=None):
+    """Lit un fichier d'import (CSV ou Excel) une seule fois par contenu, pas à chaque rerun.
+    Le lecteur est choisi sur les premiers octets, pas sur l'extension (fichier mal nommé).
+    nrows : aperçu, seules les premières lignes sont lues."""
+    if not contenu.startswith(SIGNATURES_EXCEL):
+        # Lecteur pyarrow (multithread, pyarrow est déjà requis par Streamlit) ; il ne gère pas nrows
+        return pd.read_csv(io.BytesIO(contenu), dtype=IMPORT_DTYPES, nrows=nrows, engine='c' if nrows else 'pyarrow')
+    # pandas ouvre déjà les .xlsx avec openpyxl en mode read_only
+    return pd.read_excel(io.BytesIO(contenu), dtype=IMPORT_DTYPES, nrows=nrows)
+
+
+def _libelles_campagnes(campagnes):
+    """{année: libellé} des campagnes pour le sélecteur"""
+    options_campagnes = {}
+    for c in campagnes:
+        statut = "✅ Validée" if c['validation']['validee'] else "🟡 En cours"
+        nb_tickets = len(c['tickets'])
+        options_campagnes[c['annee']] = f"{c['annee']} - {statut} ({nb_tickets} tickets)"
+    return options_campagnes
+
+
+def _tableau_tickets(tickets):
+    """DataFrame d'affichage des tickets d'une campagne"""
+    df_tickets = pd.DataFrame(tickets)
+    df_tickets['date'] = pd.to_datetime(df_tickets['date']).dt.strftime('%d/%m/%Y')
+
+    cols = ['date', 'num_ticket', 'poids_kg', 'degre', 'notes', 'id']
+    df_display = df_tickets[[c for c in cols if c in df_tickets.columns]]
+    df_display.columns = ['Date', 'N° Ticket', 'Poids (kg)', 'Degré (°)', 'Notes', 'ID']
+    return df_display
+
+
+# Colonnes du tableau historique {clé donnees_historiques: libellé} et leur format d'affichage
+COLONNES_HISTORIQUE = {
+    'poids_kg': 'Poids (kg)', 'hl': 'Hl°', 'ca_brut': 'CA Brut (€)', 'ca_net': 'CA Net (€)', 'total_ha': 'Total Ha',
+    'ca_ha': 'CA/Ha (€)', 'poids_ha': 'Poids/Ha (t)', 'rendement_reel': 'Rdt Réel (%)', 'euro_hl': '€/Hl'
+}
+# Milliers séparés (locale du navigateur) sans décimale, sinon format printf
+_ENTIER_LOCALISE = st.column_config.NumberColumn(format='localized', step=1)
+CONFIG_HISTORIQUE = {
+    'Année': st.column_config.NumberColumn(format='%d'),
+    'Poids (kg)': _ENTIER_LOCALISE, 'Hl°': st.column_config.NumberColumn(format='%.1f'),
+    'CA Brut (€)': _ENTIER_LOCALISE, 'CA Net (€)': _ENTIER_LOCALISE, 'Total Ha': st.column_config.NumberColumn(format='%.2f'),
+    'CA/Ha (€)': _ENTIER_LOCALISE, 'Poids/Ha (t)': st.column_config.NumberColumn(format='%.2f'),
+    'Rdt Réel (%)': st.column_config.NumberColumn(format='%.1f'), '€/Hl': st.column_config.NumberColumn(format='%.2f')
+}
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _campagnes_normalisees(version, _campagnes):
+    """Données historiques de toutes les campagnes (déjà triées par année) en un DataFrame float64, €/Hl corrigé.
+    Construit une seule fois par version des données pour le dashboard et le tableau historique."""
+    lignes = []
+    for c in _campagnes:
+        hist = c.get('donnees_historiques')
+        ligne = {'annee': c['annee'], 'nb_tickets': len(c.get('tickets', [])), 'validee': hist is not None}
+        if hist is not None:
+            # Valeurs par défaut des clés absentes seulement (une valeur NaN enregistrée reste NaN)
+            ligne.update({cle: hist.get(cle, 0) for cle in COLONNES_HISTORIQUE})
+        lignes.append(ligne)
+
+    df = pd.DataFrame.from_records(lignes, columns=['annee', 'nb_tickets', 'validee', *COLONNES_HISTORIQUE])
+    df = df.astype(dict.fromkeys(COLONNES_HISTORIQUE, 'float64'))
+
+    # CORRECTION : €/Hl 100x trop grand (ancienne version) si > 1000 (devrait être < 200)
+    df.loc[df['euro_hl'] > 1000, 'euro_hl'] /= 100
+    return df
+
+
+def _tableau_dashboard(df_campagnes):
+    """DataFrame du dashboard : une ligne par campagne ayant des données historiques, triée par année"""
+    colonnes = {'annee': 'Année', 'poids_kg': 'Poids_kg', 'poids_ha': 'Poids_Ha', 'ca_ha': 'CA_Ha',
+                'euro_hl': 'Euro_Hl', 'ca_net': 'CA_Net', 'rendement_reel': 'Rendement_Reel'}
+    df = df_campagnes.loc[df_campagnes['validee'], list(colonnes)].rename(columns=colonnes)
+    if df.empty:
+        return pd.DataFrame()
+
+    # Forcer l'année en string pour affichage correct
+    df['Année_str'] = df['Année'].astype(str)
+    return df
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _tableau_historique(version, _campagnes):
+    """Tableau historique numérique (années décroissantes), formaté seulement à l'affichage"""
+    df = _campagnes_normalisees(version, _campagnes).iloc[::-1].reset_index(drop=True)
+    # Afficher aussi les campagnes non validées (nombre de tickets dans le statut)
+    statut = np.where(df['validee'], '✅ Validé', '🟡 En cours (' + df['nb_tickets'].astype(str) + ' tickets)')
+    df = df[['annee', *COLONNES_HISTORIQUE]].rename(columns={'annee': 'Année', **COLONNES_HISTORIQUE})
+    df['Status'] = statut
+    return df
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _csv_historique(version, _campagnes):
+    """CSV des campagnes validées, sérialisé une fois par version des données et non à chaque rerun"""
+    df_table = _tableau_historique(version, _campagnes)
+    df_validees = df_table[df_table['Status'] == '✅ Validé']
+    return df_validees.to_csv(index=False).encode('utf-8') if len(df_validees) > 0 else None
+
+
 # Initialiser
 @st.cache_resource
 def init_vendanges():
@@ -323,14 +548,22 @@ def init_vendanges():
 
 vendanges = init_vendanges()
 
-# Charger config vignoble pour surface totale
-try:
-    config = ConfigVignoble()
-    surface_totale = sum(p.get('surface_ha', 0) for p in config.parcelles)
-    if surface_totale == 0:
-        surface_totale = 2.05
-except:
-    surface_totale = 2.05
+def _mtime(chemin):
+    """Date de modification d'un fichier (0 s'il n'existe pas), pour les clés de cache"""
+    return os.path.getmtime(chemin) if os.path.exists(chemin) else 0
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config_vignoble.json')
+
+# Surface totale du vignoble : config relue seulement quand le fichier change
+@st.cache_data(show_spinner=False)
+def _surface_totale(mtime_config):
+    try:
+        surface = sum(p.get('surface_ha', 0) for p in ConfigVignoble().parcelles)
+    except Exception:
+        surface = 0
+    return surface or 2.05
+
+surface_totale = _surface_totale(_mtime(CONFIG_FILE))
 
 # Récupérer la campagne active
 campagne_active = vendanges.get_campagne_active()
@@ -413,7 +646,7 @@ with tab1:
                         'notes': notes
                     }
 
-                    success, message = vendanges.ajouter_ticket(date_vendange.strftime('%Y-%m-%d'), ticket)
+                    success, message = vendanges.ajouter_ticket(date_vendange, ticket)
 
                     if success:
                         st.success(f"{message} : {poids} kg à {degre}°")
@@ -442,12 +675,8 @@ with tab1:
     st.subheader(f"🎫 Tickets de la Campagne {annee_active}")
 
     if campagne_active['tickets']:
-        df_tickets = pd.DataFrame(campagne_active['tickets'])
-        df_tickets['date'] = pd.to_datetime(df_tickets['date']).dt.strftime('%d/%m/%Y')
-
-        cols = ['date', 'num_ticket', 'poids_kg', 'degre', 'notes', 'id']
-        df_display = df_tickets[[c for c in cols if c in df_tickets.columns]]
-        df_display.columns = ['Date', 'N° Ticket', 'Poids (kg)', 'Degré (°)', 'Notes', 'ID']
+        # Tableau mémorisé jusqu'à la prochaine sauvegarde (pas reconstruit à chaque saisie)
+        df_display = vendanges.memoriser(('tickets_df', annee_active), lambda: _tableau_tickets(campagne_active['tickets']))
 
         st.dataframe(
             df_display.drop(columns=['ID']),
@@ -458,16 +687,18 @@ with tab1:
         # Supprimer un ticket
         if not campagne_active['validation']['validee']:
             with st.expander("🗑️ Supprimer un ticket"):
-                options_suppr = [f"ID {t['id']} - {t['num_ticket']} - {t['date']} - {t['poids_kg']}kg" for t in campagne_active['tickets']]
+                id_par_libelle = vendanges.memoriser(('options_suppr', annee_active), lambda: {
+                    f"ID {t['id']} - {t['num_ticket']} - {t['date']} - {t['poids_kg']}kg": t['id'] for t in campagne_active['tickets']
+                })
 
                 ticket_a_supprimer_str = st.selectbox(
                     "Sélectionner le ticket à supprimer",
-                    options=options_suppr,
+                    options=list(id_par_libelle),
                     key="ticket_suppr"
                 )
 
                 if st.button("🗑️ Confirmer Suppression", type="secondary"):
-                    ticket_id = int(ticket_a_supprimer_str.split(' ')[1])
+                    ticket_id = id_par_libelle[ticket_a_supprimer_str]
                     vendanges.supprimer_ticket(annee_active, ticket_id)
                     st.success("✅ Ticket supprimé")
                     st.rerun()
@@ -488,12 +719,8 @@ with tab2:
     if not campagnes_disponibles:
         st.info("📝 Aucune campagne disponible. Commencez par saisir des tickets dans l'onglet 'Saisie Tickets'.")
     else:
-        # Créer un dict pour le selectbox
-        options_campagnes = {}
-        for c in campagnes_disponibles:
-            statut = "✅ Validée" if c['validation']['validee'] else "🟡 En cours"
-            nb_tickets = len(c['tickets'])
-            options_campagnes[c['annee']] = f"{c['annee']} - {statut} ({nb_tickets} tickets)"
+        # Dict du selectbox, mémorisé jusqu'à la prochaine sauvegarde
+        options_campagnes = vendanges.memoriser('options_campagnes', lambda: _libelles_campagnes(campagnes_disponibles))
 
         annee_selectionnee = st.selectbox(
             "Choisir la campagne à afficher",
@@ -544,58 +771,61 @@ with tab2:
             with col_param1:
                 st.markdown("**Paramètres**")
 
-                rdt_theo = st.number_input(
-                    "Rendement théorique (%)",
-                    min_value=60.0,
-                    max_value=80.0,
-                    value=campagne['parametres']['rendement_theorique'],
-                    step=0.1,
-                    format="%.1f",
-                    key=f"rdt_theo_{annee_selectionnee}",
-                    disabled=campagne['validation']['validee']
-                )
-
-                prix_u = st.number_input(
-                    "Prix U (€/Hl°)",
-                    min_value=0.0,
-                    value=campagne['parametres']['prix_u'],
-                    step=0.0001,
-                    format="%.4f",
-                    key=f"prix_u_{annee_selectionnee}",
-                    disabled=campagne['validation']['validee']
-                )
-
-                prime_u = st.number_input(
-                    "Prime U (€/kg)",
-                    min_value=0.0,
-                    value=campagne['parametres'].get('prime_u', 0.0),
-                    step=0.0001,
-                    format="%.4f",
-                    help="Prime par kilogramme de raisin",
-                    key=f"prime_u_{annee_selectionnee}",
-                    disabled=campagne['validation']['validee']
-                )
-
-                frais_u = st.number_input(
-                    "Frais vinification U (€/kg)",
-                    min_value=0.0,
-                    value=campagne['parametres']['frais_vinif_u'],
-                    step=0.0001,
-                    format="%.4f",
-                    help="Frais par kilogramme de raisin",
-                    key=f"frais_u_{annee_selectionnee}",
-                    disabled=campagne['validation']['validee']
-                )
-
-                if not campagne['validation']['validee']:
-                    if st.button("💾 Sauvegarder Paramètres"):
-                        campagne['parametres']['rendement_theorique'] = rdt_theo
-                        campagne['parametres']['prix_u'] = prix_u
-                        campagne['parametres']['prime_u'] = prime_u
-                        campagne['parametres']['frais_vinif_u'] = frais_u
-                        vendanges.sauvegarder()
-                        st.success("✅ Paramètres sauvegardés")
-                        st.rerun()
+                # Formulaire : la page n'est recalculée qu'à la sauvegarde, pas à chaque frappe
+                with st.form(f"params_{annee_selectionnee}"):
+                    rdt_theo = st.number_input(
+                        "Rendement théorique (%)",
+                        min_value=60.0,
+                        max_value=80.0,
+                        value=campagne['parametres']['rendement_theorique'],
+                        step=0.1,
+                        format="%.1f",
+                        key=f"rdt_theo_{annee_selectionnee}",
+                        disabled=campagne['validation']['validee']
+                    )
+
+                    prix_u = st.number_input(
+                        "Prix U (€/Hl°)",
+                        min_value=0.0,
+                        value=campagne['parametres']['prix_u'],
+                        step=0.0001,
+                        format="%.4f",
+                        key=f"prix_u_{annee_selectionnee}",
+                        disabled=campagne['validation']['validee']
+                    )
+
+                    prime_u = st.number_input(
+                        "Prime U (€/kg)",
+                        min_value=0.0,
+                        value=campagne['parametres'].get('prime_u', 0.0),
+                        step=0.0001,
+                        format="%.4f",
+                        help="Prime par kilogramme de raisin",
+                        key=f"prime_u_{annee_selectionnee}",
+                        disabled=campagne['validation']['validee']
+                    )
+
+                    frais_u = st.number_input(
+                        "Frais vinification U (€/kg)",
+                        min_value=0.0,
+                        value=campagne['parametres']['frais_vinif_u'],
+                        step=0.0001,
+                        format="%.4f",
+                        help="Frais par kilogramme de raisin",
+                        key=f"frais_u_{annee_selectionnee}",
+                        disabled=campagne['validation']['validee']
+                    )
+
+                    params_soumis = st.form_submit_button("💾 Sauvegarder Paramètres", disabled=campagne['validation']['validee'])
+
+                if params_soumis:
+                    campagne['parametres']['rendement_theorique'] = rdt_theo
+                    campagne['parametres']['prix_u'] = prix_u
+                    campagne['parametres']['prime_u'] = prime_u
+                    campagne['parametres']['frais_vinif_u'] = frais_u
+                    vendanges.sauvegarder()
+                    st.success("✅ Paramètres sauvegardés")
+                    st.rerun()
 
             with col_param2:
                 st.markdown("**Résultats Financiers (Estimation)**")
@@ -633,39 +863,41 @@ with tab2:
             st.markdown("---")
             st.subheader("📏 Surface Vendangée")
 
-            col_surf1, col_surf2 = st.columns([1, 2])
-
-            with col_surf1:
-                surface_vend = st.number_input(
-                    "Surface vendangée (ha)",
-                    min_value=0.0,
-                    max_value=10.0,
-                    value=campagne.get('surface_vendangee', {}).get('total_ha', surface_totale),
-                    step=0.01,
-                    format="%.2f",
-                    key=f"surface_vend_{annee_selectionnee}",
-                    disabled=campagne['validation']['validee']
-                )
-
-            with col_surf2:
-                notes_surface = st.text_area(
-                    "Notes surface (optionnel)",
-                    value=campagne.get('surface_vendangee', {}).get('notes', ''),
-                    placeholder="Ex: Gel sur Parcelle 2 (0.5 ha), Grêle Parcelle 1...",
-                    height=80,
-                    key=f"notes_surf_{annee_selectionnee}",
-                    disabled=campagne['validation']['validee']
-                )
-
-            if not campagne['validation']['validee']:
-                if st.button("💾 Sauvegarder Surface", key=f"save_surface_{annee_selectionnee}"):
-                    campagne['surface_vendangee'] = {
-                        'total_ha': surface_vend,
-                        'notes': notes_surface
-                    }
-                    vendanges.sauvegarder()
-                    st.success("✅ Surface sauvegardée")
-                    st.rerun()
+            with st.form(f"surface_{annee_selectionnee}"):
+                col_surf1, col_surf2 = st.columns([1, 2])
+
+                with col_surf1:
+                    surface_vend = st.number_input(
+                        "Surface vendangée (ha)",
+                        min_value=0.0,
+                        max_value=10.0,
+                        value=campagne.get('surface_vendangee', {}).get('total_ha', surface_totale),
+                        step=0.01,
+                        format="%.2f",
+                        key=f"surface_vend_{annee_selectionnee}",
+                        disabled=campagne['validation']['validee']
+                    )
+
+                with col_surf2:
+                    notes_surface = st.text_area(
+                        "Notes surface (optionnel)",
+                        value=campagne.get('surface_vendangee', {}).get('notes', ''),
+                        placeholder="Ex: Gel sur Parcelle 2 (0.5 ha), Grêle Parcelle 1...",
+                        height=80,
+                        key=f"notes_surf_{annee_selectionnee}",
+                        disabled=campagne['validation']['validee']
+                    )
+
+                surface_soumise = st.form_submit_button("💾 Sauvegarder Surface", disabled=campagne['validation']['validee'])
+
+            if surface_soumise:
+                campagne['surface_vendangee'] = {
+                    'total_ha': surface_vend,
+                    'notes': notes_surface
+                }
+                vendanges.sauvegarder()
+                st.success("✅ Surface sauvegardée")
+                st.rerun()
 
             # Validation campagne
             st.markdown("---")
@@ -750,82 +982,33 @@ with tab2:
 # ========================================
 # TAB 3 : DASHBOARD GRAPHIQUES
 # ========================================
-with tab3:
+@st.fragment
+def render_dashboard(vendanges):
+    """Onglet Dashboard (fragment : ses interactions ne relancent pas toute la page)"""
     st.subheader("📈 Dashboard Historique")
 
-    # Bouton rafraîchir
+    # Bouton rafraîchir (le clic relance déjà le fragment : le tableau est reconstruit juste en dessous)
     if st.button("🔄 Actualiser Dashboard"):
-        st.cache_data.clear()
-        st.rerun()
+        vendanges.invalider_cache()
 
-    campagnes = [c for c in vendanges.donnees['campagnes'] if c.get('donnees_historiques')]
+    # Tableau mémorisé jusqu'à la prochaine sauvegarde (pas reconstruit à chaque interaction)
+    df = vendanges.memoriser('dashboard_df', lambda: _tableau_dashboard(_campagnes_normalisees(vendanges.version, vendanges.donnees['campagnes'])))
 
-    if not campagnes:
+    if df.empty:
         st.info("📊 Aucune donnée historique. Importez vos données Excel dans l'onglet 'Historique & Import' ou validez une campagne.")
     else:
-        data = []
-        for c in campagnes:
-            hist = c.get('donnees_historiques', {})
-
-            # CORRECTION : Si euro_hl semble être 100x trop grand (ancienne version), on corrige
-            euro_hl_value = hist.get('euro_hl', 0)
-            if euro_hl_value > 1000:  # Si > 1000, c'est probablement une erreur (devrait être < 200)
-                euro_hl_value = euro_hl_value / 100
-
-            data.append({
-                'Année': c['annee'],
-                'Poids_kg': hist.get('poids_kg', 0),
-                'Total_Ha': hist.get('total_ha', surface_totale),
-                'Poids_Ha': hist.get('poids_ha', 0),
-                'CA_Ha': hist.get('ca_ha', 0),
-                'Euro_Hl': euro_hl_value,
-                'CA_Net': hist.get('ca_net', 0),
-                'Rendement_Reel': hist.get('rendement_reel', 0)
-            })
-
-        df = pd.DataFrame(data).sort_values('Année')
-
-        # Forcer l'année en string pour affichage correct
-        df['Année_str'] = df['Année'].astype(str)
-
         if len(df) > 0:
-            col_g1, col_g2 = st.columns(2)
-
-            with col_g1:
-                st.markdown("**Poids Kg par Année**")
-                st.bar_chart(df.set_index('Année_str')['Poids_kg'])
-
-            with col_g2:
-                st.markdown("**CA/Ha (€)**")
-                st.line_chart(df.set_index('Année_str')['CA_Ha'])
-
-            col_g3, col_g4 = st.columns(2)
-
-            with col_g3:
-                st.markdown("**Poids/Ha (tonnes/ha)**")
-                st.bar_chart(df.set_index('Année_str')['Poids_Ha'])
-
-            with col_g4:
-                st.markdown("**€/Hl**")
-                st.line_chart(df.set_index('Année_str')['Euro_Hl'])
+            # Deux graphiques à facettes (barres / courbes) au lieu de six composants séparés
+            st.altair_chart(_graphique_facettes(df, GRAPHIQUES_BARRES, 'bar'), use_container_width=True)
+            st.altair_chart(_graphique_facettes(df, GRAPHIQUES_COURBES, 'line'), use_container_width=True)
 
-            col_g5, col_g6 = st.columns(2)
+            if not (df['CA_Net'] > 0).any():
+                st.info("Aucune donnée CA Net disponible")
+            if not (df['Rendement_Reel'] > 0).any():
+                st.info("Aucune donnée rendement disponible")
 
-            with col_g5:
-                st.markdown("**Chiffre d'Affaire Net (€)**")
-                df_ca_net = df[df['CA_Net'] > 0]
-                if len(df_ca_net) > 0:
-                    st.bar_chart(df_ca_net.set_index('Année_str')['CA_Net'])
-                else:
-                    st.info("Aucune donnée CA Net disponible")
-
-            with col_g6:
-                st.markdown("**Rendement Réel (%)**")
-                df_rdt = df[df['Rendement_Reel'] > 0]
-                if len(df_rdt) > 0:
-                    st.line_chart(df_rdt.set_index('Année_str')['Rendement_Reel'])
-                else:
-                    st.info("Aucune donnée rendement disponible")
+with tab3:
+    render_dashboard(vendanges)
 
 # ========================================
 # TAB 4 : HISTORIQUE & IMPORT
@@ -890,18 +1073,17 @@ with tab4:
 
     if uploaded_file:
         try:
-            if uploaded_file.name.endswith('.csv'):
-                df_import = pd.read_csv(uploaded_file)
-            else:
-                df_import = pd.read_excel(uploaded_file)
+            # Aperçu : seules les premières lignes sont lues, le fichier complet l'est à l'import
+            apercu = _lire_fichier_import(uploaded_file.getvalue(), nrows=5)
 
-            st.success(f"✅ Fichier chargé : {len(df_import)} lignes")
+            st.success("✅ Fichier chargé : aperçu des premières lignes")
 
-            st.dataframe(df_import.head(), use_container_width=True)
+            st.dataframe(apercu, use_container_width=True)
 
             if st.button("📥 Importer ces Données", type="primary"):
+                df_import = _lire_fichier_import(uploaded_file.getvalue())
                 vendanges.importer_historique(df_import)
-                st.success("✅ Données importées avec succès !")
+                st.success(f"✅ {len(df_import)} lignes lues, données importées avec succès !")
                 st.rerun()
 
         except Exception as e:
@@ -914,55 +1096,15 @@ with tab4:
     st.markdown("### 📊 Tableau Historique Complet")
 
     if vendanges.donnees['campagnes']:
-        data_table = []
-
-        for c in sorted(vendanges.donnees['campagnes'], key=lambda x: x['annee'], reverse=True):
-            if 'donnees_historiques' in c:
-                hist = c['donnees_historiques']
-
-                # CORRECTION : Si euro_hl semble être 100x trop grand, on corrige
-                euro_hl_value = hist.get('euro_hl', 0)
-                if euro_hl_value > 1000:
-                    euro_hl_value = euro_hl_value / 100
-
-                data_table.append({
-                    'Année': c['annee'],
-                    'Poids (kg)': f"{hist.get('poids_kg', 0):,.0f}",
-                    'Hl°': f"{hist.get('hl', 0):.1f}",
-                    'CA Brut (€)': f"{hist.get('ca_brut', 0):,.0f}",
-                    'CA Net (€)': f"{hist.get('ca_net', 0):,.0f}",
-                    'Total Ha': f"{hist.get('total_ha', 0):.2f}",
-                    'CA/Ha (€)': f"{hist.get('ca_ha', 0):,.0f}",
-                    'Poids/Ha (t)': f"{hist.get('poids_ha', 0):.2f}",
-                    'Rdt Réel (%)': f"{hist.get('rendement_reel', 0):.1f}",
-                    '€/Hl': f"{euro_hl_value:.2f}",
-                    'Status': '✅ Validé'
-                })
-            else:
-                # Afficher aussi les campagnes non validées
-                nb_tickets = len(c.get('tickets', []))
-                data_table.append({
-                    'Année': c['annee'],
-                    'Poids (kg)': f"{nb_tickets} tickets",
-                    'Hl°': '-',
-                    'CA Brut (€)': '-',
-                    'CA Net (€)': '-',
-                    'Total Ha': '-',
-                    'CA/Ha (€)': '-',
-                    'Poids/Ha (t)': '-',
-                    'Rdt Réel (%)': '-',
-                    '€/Hl': '-',
-                    'Status': '🟡 En cours'
-                })
+        df_table = _tableau_historique(vendanges.version, vendanges.donnees['campagnes'])
 
-        if data_table:
-            df_table = pd.DataFrame(data_table)
-            st.dataframe(df_table, use_container_width=True, hide_index=True)
+        if not df_table.empty:
+            # Colonnes numériques (tri/filtre corrects), formatées par le navigateur
+            st.dataframe(df_table, column_config=CONFIG_HISTORIQUE, use_container_width=True, hide_index=True)
 
             # Export CSV (seulement campagnes validées)
-            df_validees = df_table[df_table['Status'] == '✅ Validé']
-            if len(df_validees) > 0:
-                csv = df_validees.to_csv(index=False).encode('utf-8')
+            csv = _csv_historique(vendanges.version, vendanges.donnees['campagnes'])
+            if csv is not None:
                 st.download_button(
                     label="📥 Télécharger en CSV (campagnes validées)",
                     data=csv,
@@ -1,4 +1,6 @@
 import streamlit as st
+import streamlit.components.v1 as components
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import geemap.foliumap as geemap
 import ee
 import geopandas as gpd
@@ -7,6 +9,9 @@ import pandas as pd
 import json
 import sys
 import os
+import glob
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Tuple
 
 # ==============================================================================
@@ -36,6 +41,9 @@ REFERENCE_TABLE = {
     11: {'Stade': 'dormance', 'NDVI_min': 0.10, 'NDVI_moy': 0.15, 'NDMI_min': -0.05, 'NDMI_moy': 0.00},
     12: {'Stade': 'dormance', 'NDVI_min': 0.05, 'NDVI_moy': 0.10, 'NDMI_min': -0.05, 'NDMI_moy': 0.00}
 }
+# Seuils en float32 comme les mesures satellite : comparaisons des alertes dans la même précision
+REFERENCE_DF = pd.DataFrame.from_dict(REFERENCE_TABLE, orient='index').astype(
+    dict.fromkeys(['NDVI_min', 'NDVI_moy', 'NDMI_min', 'NDMI_moy'], 'float32'))
 
 # ==============================================================================
 # --- Earth Engine Setup and Helper Functions ---
@@ -43,6 +51,8 @@ REFERENCE_TABLE = {
 
 # ⚠️ REMPLACER CECI par votre ID de projet Google Cloud/Earth Engine
 EE_PROJECT_ID = 'phenologie-477519'  # Mettez votre ID de projet ici
+# Point d'accès haut débit d'Earth Engine, prévu pour de nombreuses requêtes synchrones en parallèle
+EE_API_URL = 'https://earthengine-highvolume.googleapis.com'
 
 
 if "ee_initialized" not in st.session_state:
@@ -64,7 +74,7 @@ if "ee_initialized" not in st.session_state:
             key_data=key_json_str
         )
 
-        ee.Initialize(credentials, project=EE_PROJECT_ID)
+        ee.Initialize(credentials, project=EE_PROJECT_ID, opt_url=EE_API_URL)
 
         st.session_state["ee_initialized"] = True
         st.success("✅ Earth Engine initialisé avec succès !")
@@ -77,20 +87,55 @@ if "ee_initialized" not in st.session_state:
 @st.cache_data
 def get_reference_df(year=2025):
     """Crée un DataFrame de référence pour l'année, avec une date au 15 de chaque mois."""
+    # Point de départ au 1er janvier (valeurs de janvier), puis le 15 de chaque mois ;
+    # pd.Timestamp pour correspondre au type des données satellite (pd.to_datetime)
+    mois = [1, *range(1, 13)]
+    dates = pd.DatetimeIndex([pd.Timestamp(year, 1, 1)] + [pd.Timestamp(year, m, 15) for m in range(1, 13)])
+    return REFERENCE_DF.loc[mois].set_axis(dates)
 
-    # --- CORRECTION ICI ---
-    # Remplacer datetime.date par pd.Timestamp pour correspondre au type
-    # des données satellite (pd.to_datetime)
-    dates = [pd.Timestamp(year, month, 15) for month in range(1, 13)]
-    data = [REFERENCE_TABLE[month] for month in range(1, 13)]
-    df = pd.DataFrame(data, index=dates)
 
-    # --- CORRECTION ICI AUSSI ---
-    # Assurer que le point de départ utilise aussi pd.Timestamp
-    df_start = pd.DataFrame([REFERENCE_TABLE[1]], index=[pd.Timestamp(year, 1, 1)])
+def _ajouter_alertes(df_series):
+    """Ajoute à chaque mesure les seuils de son mois et les alertes vigueur/sécheresse (toutes parcelles d'un coup)."""
+    colonnes = ['Stade', 'NDVI_min', 'NDMI_min']
+    df_series[colonnes] = REFERENCE_DF[colonnes].reindex(df_series['date'].dt.month).set_axis(df_series.index)
+    hors_dormance = df_series['Stade'] != 'dormance'
+    df_series['alert_ndvi'] = (df_series['NDVI'] < df_series['NDVI_min']) & hors_dormance
+    df_series['alert_ndmi'] = (df_series['NDMI'] < df_series['NDMI_min']) & hors_dormance
+    return df_series
 
-    df = pd.concat([df_start, df])
-    return df
+
+def _fusionner_geojson(geojson_path, df_config):
+    """Lit le GeoJSON (EPSG:4326) et le fusionne avec les stades de ConfigVignoble ; None si géométrie invalide."""
+    gdf = gpd.read_file(geojson_path)
+    gdf = gdf.to_crs(epsg=4326)
+
+    if 'name' in gdf.columns and 'Nom' not in gdf.columns:
+        gdf.rename(columns={'name': 'Nom'}, inplace=True)
+    elif 'Nom' not in gdf.columns:
+        gdf['Nom'] = gdf.iloc[:, 0].astype(str)
+        st.warning("⚠️ Colonne 'Nom' ou 'name' non trouvée. La première colonne du GeoJSON est utilisée comme nom.")
+
+    geom_types = gdf.geometry.geom_type.unique()
+    if not all(gtype in ['Polygon', 'MultiPolygon'] for gtype in geom_types):
+        st.error(f"❌ Erreur de Géométrie : Votre GeoJSON contient des types non-valides ({geom_types}).")
+        return None
+
+    gdf_merged = gdf.merge(df_config[['nom', 'stade_actuel']],
+                           left_on='Nom', right_on='nom', how='left').drop(columns=['nom']).rename(
+        columns={'stade_actuel': 'Stade'})
+
+    gdf_merged['Stade'] = gdf_merged['Stade'].fillna('repos')
+    return gdf_merged
+
+
+def _ecrire_cache_carte(gdf_merged, cache_path):
+    """Écrit le cache Parquet de la carte et supprime les anciens (échec sans conséquence : recalcul au prochain démarrage)"""
+    try:
+        for ancien in glob.glob(os.path.join(os.path.dirname(cache_path), 'map.cache-*.parquet')):
+            os.remove(ancien)
+        gdf_merged.to_parquet(cache_path)
+    except Exception:
+        pass
 
 
 @st.cache_data
@@ -101,60 +146,73 @@ def load_and_prepare_data():
         df_config = pd.DataFrame(config.parcelles)
     except Exception as e:
         st.error(f"Erreur de chargement ConfigVignoble : {e}")
-        return None, None, None
+        return None, None, None, None, None
 
     current_dir = os.path.dirname(os.path.abspath(__file__))
     geojson_path = os.path.join(current_dir, '..', 'map.geojson')
 
     if not os.path.exists(geojson_path):
         st.error(f"❌ Fichier GeoJSON non trouvé au chemin calculé : {geojson_path}. Vérifiez l'emplacement.")
-        return None, None, None
+        return None, None, None, None, None
 
     try:
-        gdf = gpd.read_file(geojson_path)
-        gdf = gdf.to_crs(epsg=4326)
-
-        if 'name' in gdf.columns and 'Nom' not in gdf.columns:
-            gdf.rename(columns={'name': 'Nom'}, inplace=True)
-        elif 'Nom' not in gdf.columns:
-            gdf['Nom'] = gdf.iloc[:, 0].astype(str)
-            st.warning("⚠️ Colonne 'Nom' ou 'name' non trouvée. La première colonne du GeoJSON est utilisée comme nom.")
-
-        geom_types = gdf.geometry.geom_type.unique()
-        if not all(gtype in ['Polygon', 'MultiPolygon'] for gtype in geom_types):
-            st.error(f"❌ Erreur de Géométrie : Votre GeoJSON contient des types non-valides ({geom_types}).")
-            return None, None, None
-
-        gdf_merged = gdf.merge(df_config[['nom', 'stade_actuel']],
-                               left_on='Nom', right_on='nom', how='left').drop(columns=['nom']).rename(
-            columns={'stade_actuel': 'Stade'})
-
-        gdf_merged['Stade'] = gdf_merged['Stade'].fillna('repos')
+        # Cache Parquet à côté du GeoJSON, nommé d'après le contenu du GeoJSON et des parcelles :
+        # relu au démarrage d'un nouveau processus au lieu de reparser et refusionner le GeoJSON
+        empreinte = hashlib.sha1()
+        with open(geojson_path, 'rb') as f:
+            empreinte.update(f.read())
+        empreinte.update(json.dumps(config.parcelles, sort_keys=True).encode('utf-8'))
+        cache_path = os.path.join(current_dir, '..', f'map.cache-{empreinte.hexdigest()[:16]}.parquet')
+
+        if os.path.exists(cache_path):
+            gdf_merged = gpd.read_parquet(cache_path)
+        else:
+            gdf_merged = _fusionner_geojson(geojson_path, df_config)
+            if gdf_merged is None:
+                return None, None, None, None, None
+            _ecrire_cache_carte(gdf_merged, cache_path)
 
-        ee_features = []
-        for index, row in gdf_merged.iterrows():
-            geom = ee.Geometry(row.geometry.__geo_interface__)
-            ee_features.append(ee.Feature(geom, {'Nom': row['Nom'], 'Stade': row['Stade']}))
+        # Colonnes parcourues directement (pas de Series construite par ligne comme avec iterrows)
+        ee_features = [
+            ee.Feature(ee.Geometry(geom.__geo_interface__), {'Nom': nom, 'Stade': stade})
+            for geom, nom, stade in zip(gdf_merged.geometry, gdf_merged['Nom'], gdf_merged['Stade'])
+        ]
 
         ee_feature_collection = ee.FeatureCollection(ee_features)
         geom_envelope = ee_feature_collection.geometry().bounds()
 
-        return gdf_merged, ee_feature_collection, geom_envelope
+        # Centre de la carte calculé une fois, centroïdes en projection métrique (exacts et sans avertissement)
+        centroides = gdf_merged.geometry.to_crs(epsg=3857).centroid.to_crs(epsg=4326)
+        centre_carte = (centroides.y.mean(), centroides.x.mean())
+
+        # Empreinte des géométries, clé des caches EE (les objets EE ne sont pas hachables), calculée une fois
+        cle_carte = hashlib.sha1(gdf_merged[['Nom', 'geometry']].to_json().encode('utf-8')).hexdigest()
+
+        return gdf_merged, ee_feature_collection, geom_envelope, centre_carte, cle_carte
 
     except Exception as e:
         st.error(f"Erreur lors du traitement du GeoJSON ou de la fusion : {e}")
         st.exception(e)
-        return None, None, None
+        return None, None, None, None, None
+
+
+# Classes SCL (Scene Classification) masquées : ombres (3), nuages probables (8) et certains (9), cirrus (10)
+CLASSES_SCL_MASQUEES = [3, 8, 9, 10]
 
 
 def add_indices(image):
+    # Pixels nuageux masqués avant le calcul : ni réduits par parcelle, ni dans la médiane de la carte
+    image = image.updateMask(image.select("SCL").remap(CLASSES_SCL_MASQUEES, [0] * len(CLASSES_SCL_MASQUEES), 1))
     ndvi = image.normalizedDifference(["B8", "B4"]).rename("NDVI")
     ndmi = image.normalizedDifference(["B8A", "B11"]).rename("NDMI")
-    return image.addBands([ndvi, ndmi]).set("date", image.date().format("YYYY-MM-dd"))
+    # Seuls NDVI et NDMI sont réduits par parcelle : les bandes brutes ne sont ni calculées ni renvoyées par getInfo()
+    return image.addBands([ndvi, ndmi]).select(["NDVI", "NDMI"]).set("date", image.date().format("YYYY-MM-dd"))
 
 
 def get_mean_value_zonal(image, ee_feature_collection):
-    mean_stats = image.reduceRegions(
+    # Une seule réduction pour les deux bandes (propriétés NDVI et NDMI), à 10 m : NDMI (B8A/B11, 20 m)
+    # est rééchantillonné, mais deux passes par image doubleraient le travail Earth Engine
+    mean_stats = image.select(['NDVI', 'NDMI']).reduceRegions(
         collection=ee_feature_collection,
         reducer=ee.Reducer.mean(),
         scale=10
@@ -162,6 +220,119 @@ def get_mean_value_zonal(image, ee_feature_collection):
     return mean_stats.map(lambda f: f.set('date', image.get('date')))
 
 
+def _blocs_periode(debut, fin, jours=30):
+    """Découpe la période [debut, fin[ (bornes de filterDate) en blocs consécutifs de `jours` jours, en ISO"""
+    blocs = []
+    while True:
+        fin_bloc = min(fin, debut + datetime.timedelta(days=jours))
+        blocs.append((str(debut), str(fin_bloc)))
+        if fin_bloc >= fin:
+            return blocs
+        debut = fin_bloc
+
+
+SEUIL_NUAGES = 15  # CLOUDY_PIXEL_PERCENTAGE maximal des images retenues
+CACHE_SERIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache')
+DELAI_SERIES_DEFINITIVES = datetime.timedelta(days=5)  # images Sentinel-2 encore publiées après ce délai
+
+
+def _chemin_cache_series(start_iso, end_iso, cle_carte):
+    """Fichier Parquet d'un bloc, nommé d'après les géométries, la période et le filtrage des nuages"""
+    cle = hashlib.sha1(f"{cle_carte}|{start_iso}|{end_iso}|{SEUIL_NUAGES}|{CLASSES_SCL_MASQUEES}".encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_SERIES_DIR, f'series-{cle}.parquet')
+
+
+def _ecrire_cache_series(df_ee, chemin):
+    """Écrit le bloc sur disque (fichier temporaire renommé : jamais de lecture partielle ; échec sans conséquence)"""
+    try:
+        os.makedirs(CACHE_SERIES_DIR, exist_ok=True)
+        df_ee.to_parquet(f'{chemin}.tmp', compression='zstd', index=False)
+        os.replace(f'{chemin}.tmp', chemin)
+    except Exception:
+        pass
+
+
+@st.cache_data(ttl=24 * 60 * 60, max_entries=64, show_spinner=False)  # ~5 ans de blocs de 30 jours
+def fetch_series(start_iso, end_iso, cle_carte, _ee_feature_collection, _geom_envelope):
+    """Séries NDVI/NDMI moyennes par parcelle et par image Sentinel-2, mises en cache 24 h par période et parcellaire.
+    cle_carte identifie les géométries (les objets EE préfixés _ ne sont pas hachés).
+    None si aucune image exploitable ; les résultats mal formés lèvent ValueError (une exception n'est pas
+    mise en cache : le prochain lancement réessaie au lieu de garder un résultat vide pendant 24 h).
+    Les blocs révolus sont aussi conservés sur disque (cache/), partagés entre redémarrages et utilisateurs."""
+    chemin = _chemin_cache_series(start_iso, end_iso, cle_carte)
+    if os.path.exists(chemin):
+        df_ee = pd.read_parquet(chemin)
+        return df_ee if not df_ee.empty else None
+    definitif = datetime.date.fromisoformat(end_iso) <= datetime.date.today() - DELAI_SERIES_DEFINITIVES
+
+    s2 = (
+        ee.ImageCollection("COPERNICUS/S2_SR")
+        .filterBounds(_geom_envelope)
+        .filterDate(start_iso, end_iso)
+        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", SEUIL_NUAGES))
+        .select(["B4", "B8", "B11", "B8A", "SCL"])
+        .sort("system:time_start")
+    )
+
+    s2_indices = s2.map(add_indices)
+
+    # Export CSV des seules propriétés utiles (sans la géométrie ni le JSON imbriqué de getInfo()),
+    # lu en C par read_csv ; échappe aussi à la limite de taille des réponses getInfo().
+    # Indices en float32 : 3 décimales suffisent, moitié moins de mémoire et de données Arrow envoyées aux graphiques
+    colonnes = ['Nom', 'date', 'NDVI', 'NDMI']
+    url = s2_indices.map(
+        lambda img: get_mean_value_zonal(img, _ee_feature_collection)
+    ).flatten().getDownloadURL(filetype='CSV', selectors=colonnes)
+
+    try:
+        df_ee = pd.read_csv(url, usecols=lambda c: c in colonnes, parse_dates=['date'],
+                            dtype={'NDVI': 'float32', 'NDMI': 'float32'})
+    except pd.errors.EmptyDataError:
+        df_ee = pd.DataFrame(columns=colonnes)
+    if len(df_ee.columns) < len(colonnes):
+        raise ValueError(f"colonnes manquantes dans l'export ({start_iso} → {end_iso}) : {sorted(set(colonnes) - set(df_ee.columns))}")
+
+    df_ee = df_ee.dropna(subset=['NDVI', 'NDMI']).drop_duplicates(subset=['Nom', 'date'])
+    if definitif:
+        _ecrire_cache_series(df_ee, chemin)
+    # Aucune ligne : aucune image exploitable (pas de requête size() préalable, un aller-retour EE de moins)
+    return df_ee if not df_ee.empty else None
+
+
+@st.cache_data(ttl=3600, max_entries=8, show_spinner=False)
+def render_median_map_html(start_iso, end_iso, index_type, cle_carte, _gdf_merged, _geom_envelope, _centre_carte):
+    """HTML de la carte de l'image médiane (NDVI ou NDMI), construit une fois par période, indice et parcellaire.
+    Seul le rendu est mis en cache : aucune carte geemap n'est reconstruite ni re-rendue aux re-runs suivants."""
+    s2_collection = (
+        ee.ImageCollection("COPERNICUS/S2_SR")
+        .filterBounds(_geom_envelope)
+        .filterDate(start_iso, end_iso)
+        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", SEUIL_NUAGES))
+        .map(add_indices)
+    )
+
+    median_image = s2_collection.median()
+
+    m = geemap.Map(center=list(_centre_carte), zoom=13)
+
+    if index_type == "NDVI":
+        vis_params = {"bands": ["NDVI"], "min": 0, "max": 0.8, "palette": ["brown", "yellow", "green"]}
+        legend_title = "NDVI Médian"
+        legend_dict = {'0.1': 'brown', '0.3': 'yellow', '0.6': 'green', '0.8': 'green'}
+    else:
+        vis_params = {"bands": ["NDMI"], "min": -0.5, "max": 0.4, "palette": ["red", "yellow", "#00441b"]}
+        legend_title = "NDMI Médian (Humidité)"
+        legend_dict = {'-0.4': 'red', '0.0': 'yellow', '0.4': '#00441b'}
+
+    m.addLayer(median_image.select(index_type), vis_params, f'Image Médiane ({index_type})')
+    m.add_legend(title=legend_title, legend_dict=legend_dict)
+    # Contours simplifiés à 1 m (affichage seul) : bien moins de sommets dans le GeoJSON intégré au HTML
+    gdf_affichage = _gdf_merged.assign(geometry=_gdf_merged.geometry.to_crs(epsg=3857).simplify(1.0).to_crs(epsg=4326))
+    m.add_gdf(gdf_affichage, layer_name="Parcelles Viticoles")
+    m.add_layer_control()
+    return m.to_html()
+
+
 # ==============================================================================
 # --- APPLICATION STREAMLIT PRINCIPALE ---
 # ==============================================================================
@@ -170,7 +341,7 @@ st.title("🛰️ Suivi NDVI/NDMI et Alertes Vigueur des Parcelles Viticoles")
 st.markdown("---")
 
 # Tentative de chargement des données
-gdf_merged, ee_feature_collection, geom_envelope = load_and_prepare_data()
+gdf_merged, ee_feature_collection, geom_envelope, centre_carte, cle_carte = load_and_prepare_data()
 
 if gdf_merged is None:
     st.info("💡 Veuillez vous assurer que le fichier 'map.geojson' et 'config_vignoble.json' existent et sont valides.")
@@ -178,6 +349,15 @@ if gdf_merged is None:
 
 st.success(f"✅ Configuration chargée. {len(gdf_merged)} parcelles détectées.")
 
+with st.sidebar:
+    if st.button("🧹 Vider le cache satellite",
+                 help="Libère les séries et cartes gardées en mémoire (les périodes révolues restent sur disque)"):
+        fetch_series.clear()
+        render_median_map_html.clear()
+        for cle in ('df_series', 'analyse_complete'):
+            st.session_state.pop(cle, None)
+        st.rerun()
+
 # --- 2️⃣ Sélection de la période et Lancement ---
 st.markdown("---")
 col_date1, col_date2 = st.columns(2)
@@ -193,49 +373,38 @@ if st.button("🚀 Lancer l'Analyse Satellite (Sentinel-2)", type="primary"):
     st.session_state['start_date_sat_run'] = start_date
     st.session_state['end_date_sat_run'] = end_date
 
-    with st.spinner("⏳ Récupération et traitement des images Sentinel-2..."):
-
-        try:
-            s2 = (
-                ee.ImageCollection("COPERNICUS/S2_SR")
-                .filterBounds(geom_envelope)
-                .filterDate(str(start_date), str(end_date))
-                .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", 15))
-                .select(["B4", "B8", "B11", "B8A"])
-                .sort("system:time_start")
-            )
-
-            if s2.size().getInfo() == 0:
-                st.error("❌ Aucune image Sentinel-2 exploitable trouvée sur cette période (trop de nuages).")
-                st.session_state['analyse_lancee'] = False
-                st.stop()
-
-            s2_indices = s2.map(add_indices)
-
-            results_dict = s2_indices.map(
-                lambda img: get_mean_value_zonal(img, ee_feature_collection)
-            ).flatten().getInfo()
-
-            if results_dict and 'features' in results_dict:
-
-                actual_feature_list = results_dict['features']
-                df_ee = pd.DataFrame([f['properties'] for f in actual_feature_list])
-                df_ee['date'] = pd.to_datetime(df_ee['date'])
-
-                st.session_state['df_series'] = df_ee.dropna(subset=['NDVI', 'NDMI']).drop_duplicates(
-                    subset=['Nom', 'date'])
-                st.session_state['analyse_complete'] = True
-                st.success("✅ Analyse complétée. Données des séries temporelles extraites.")
-
-            else:
-                st.error("❌ Erreur : Les résultats d'Earth Engine sont vides ou mal formés.")
-                st.session_state['analyse_complete'] = False
-
-        except ee.EEException as e:
-            st.error(f"❌ Erreur Earth Engine lors du traitement : {e}")
-        except Exception as e:
-            st.error(f"❌ Erreur inattendue : {e}")
-            st.exception(e)
+    try:
+        # Période découpée en blocs récupérés en parallèle (requêtes EE réseau, chaque bloc en cache)
+        blocs = _blocs_periode(start_date, end_date)
+        barre = st.progress(0.0, text="⏳ Récupération et traitement des images Sentinel-2...")
+        # Contexte du script transmis aux threads : fetch_series (st.cache_data) y est appelé comme depuis la page
+        with ThreadPoolExecutor(max_workers=min(8, len(blocs)), initializer=add_script_run_ctx,
+                                initargs=(None, get_script_run_ctx())) as executor:
+            futures = [executor.submit(fetch_series, debut, fin, cle_carte, ee_feature_collection, geom_envelope)
+                       for debut, fin in blocs]
+            for n, _ in enumerate(as_completed(futures), 1):
+                barre.progress(n / len(futures), text=f"⏳ Images Sentinel-2 : {n}/{len(futures)} périodes traitées")
+        resultats = [f.result() for f in futures]
+        barre.empty()
+
+        series = [r for r in resultats if r is not None]
+        if not series:
+            st.error("❌ Aucune image Sentinel-2 exploitable trouvée sur cette période (trop de nuages).")
+            st.session_state['analyse_lancee'] = False
+            st.stop()
+
+        st.session_state['df_series'] = _ajouter_alertes(pd.concat(series, ignore_index=True))
+        st.session_state['analyse_complete'] = True
+        st.success("✅ Analyse complétée. Données des séries temporelles extraites.")
+
+    except ValueError as e:
+        st.error(f"❌ Erreur : Les résultats d'Earth Engine sont vides ou mal formés ({e}).")
+        st.session_state['analyse_complete'] = False
+    except ee.EEException as e:
+        st.error(f"❌ Erreur Earth Engine lors du traitement : {e}")
+    except Exception as e:
+        st.error(f"❌ Erreur inattendue : {e}")
+        st.exception(e)
 
 # ==============================================================================
 # --- 5️⃣ Visualisation et Alertes (MODIFIÉ) ---
@@ -245,6 +414,23 @@ if st.session_state.get('analyse_complete', False) and 'df_series' in st.session
 
     df_chart = st.session_state['df_series']
 
+    st.markdown("---")
+    st.subheader("🚦 État Actuel des Parcelles")
+
+    # Dernière mesure de chaque parcelle, alertes déjà calculées pour toutes les parcelles (_ajouter_alertes)
+    df_etat = df_chart.loc[df_chart.groupby('Nom')['date'].idxmax(),
+                           ['Nom', 'date', 'Stade', 'NDVI', 'NDVI_min', 'alert_ndvi', 'NDMI', 'NDMI_min', 'alert_ndmi']]
+    st.dataframe(df_etat, use_container_width=True, hide_index=True, column_config={
+        'Nom': st.column_config.TextColumn('Parcelle'),
+        'date': st.column_config.DateColumn('Dernière image', format='DD/MM/YYYY'),
+        'NDVI': st.column_config.NumberColumn('NDVI', format='%.2f'),
+        'NDVI_min': st.column_config.NumberColumn('NDVI min', format='%.2f'),
+        'alert_ndvi': st.column_config.CheckboxColumn('🚨 Vigueur'),
+        'NDMI': st.column_config.NumberColumn('NDMI', format='%.2f'),
+        'NDMI_min': st.column_config.NumberColumn('NDMI min', format='%.2f'),
+        'alert_ndmi': st.column_config.CheckboxColumn('💧 Sécheresse'),
+    })
+
     st.markdown("---")
     st.subheader("📈 Analyse de Tendance vs Références Phénologiques")
 
@@ -264,8 +450,7 @@ if st.session_state.get('analyse_complete', False) and 'df_series' in st.session
         analysis_year = df_parcelle.index[0].year
         ref_df = get_reference_df(analysis_year)
 
-        last_date = df_parcelle.index[-1]
-        last_month = last_date.month
+        derniere = df_parcelle.iloc[-1]
 
         # --- ALERTE ET GRAPHIQUE NDVI ---
         col_g1, col_g2 = st.columns(2)
@@ -273,22 +458,19 @@ if st.session_state.get('analyse_complete', False) and 'df_series' in st.session
         with col_g1:
             st.markdown("#### Vigueur (NDVI)")
 
-            # Combiner les données mesurées et les références
-            plot_df_ndvi = pd.concat([
-                df_parcelle['NDVI'].rename('NDVI (Mesuré)'),
-                ref_df[['NDVI_min', 'NDVI_moy']]
-            ])
+            # Mesures et références alignées sur les dates (une ligne par date, index trié et unique)
+            plot_df_ndvi = df_parcelle[['NDVI']].rename(columns={'NDVI': 'NDVI (Mesuré)'}).join(
+                ref_df[['NDVI_min', 'NDVI_moy']], how='outer')
 
             st.line_chart(plot_df_ndvi, use_container_width=True, height=250,
                           color=['#1f77b4', '#ff0000', '#ffa500'])  # Mesuré (bleu), Min (rouge), Moy (orange)
 
             # Logique d'alerte basée sur la dernière mesure vs le min du mois
-            last_ndvi = df_parcelle['NDVI'].iloc[-1]
-            ref_min_ndvi = REFERENCE_TABLE[last_month]['NDVI_min']
+            last_ndvi = derniere['NDVI']
 
-            if last_ndvi < ref_min_ndvi and REFERENCE_TABLE[last_month]['Stade'] != 'dormance':
+            if derniere['alert_ndvi']:
                 st.error(
-                    f"🚨 ALERTE VIGUEUR : NDVI récent ({last_ndvi:.2f}) est **sous la normale** ({ref_min_ndvi}) pour ce mois-ci ({REFERENCE_TABLE[last_month]['Stade']}).")
+                    f"🚨 ALERTE VIGUEUR : NDVI récent ({last_ndvi:.2f}) est **sous la normale** ({derniere['NDVI_min']:.2f}) pour ce mois-ci ({derniere['Stade']}).")
             else:
                 st.success(f"✅ Vigueur (NDVI : {last_ndvi:.2f}) conforme pour ce mois-ci.")
 
@@ -296,22 +478,19 @@ if st.session_state.get('analyse_complete', False) and 'df_series' in st.session
         with col_g2:
             st.markdown("#### Humidité Foliaire (NDMI)")
 
-            # Combiner les données mesurées et les références
-            plot_df_ndmi = pd.concat([
-                df_parcelle['NDMI'].rename('NDMI (Mesuré)'),
-                ref_df[['NDMI_min', 'NDMI_moy']]
-            ])
+            # Mesures et références alignées sur les dates (une ligne par date, index trié et unique)
+            plot_df_ndmi = df_parcelle[['NDMI']].rename(columns={'NDMI': 'NDMI (Mesuré)'}).join(
+                ref_df[['NDMI_min', 'NDMI_moy']], how='outer')
 
             st.line_chart(plot_df_ndmi, use_container_width=True, height=250,
                           color=['#ff7f0e', '#008000', '#a6cee3'])  # Mesuré (orange), Min (vert), Moy (bleu clair)
 
             # Logique d'alerte
-            last_ndmi = df_parcelle['NDMI'].iloc[-1]
-            ref_min_ndmi = REFERENCE_TABLE[last_month]['NDMI_min']
+            last_ndmi = derniere['NDMI']
 
-            if last_ndmi < ref_min_ndmi and REFERENCE_TABLE[last_month]['Stade'] != 'dormance':
+            if derniere['alert_ndmi']:
                 st.warning(
-                    f"💧 ALERTE SÉCHERESSE : NDMI récent ({last_ndmi:.2f}) est **sous le seuil de stress** ({ref_min_ndmi}) pour ce mois-ci.")
+                    f"💧 ALERTE SÉCHERESSE : NDMI récent ({last_ndmi:.2f}) est **sous le seuil de stress** ({derniere['NDMI_min']:.2f}) pour ce mois-ci.")
             else:
                 st.success(f"✅ NDMI ({last_ndmi:.2f}) indique une hydratation adéquate.")
 
@@ -332,30 +511,8 @@ if st.session_state.get('analyse_complete', False) and 'df_series' in st.session
         run_start_date = st.session_state.get('start_date_sat_run', start_date)
         run_end_date = st.session_state.get('end_date_sat_run', end_date)
 
-        s2_collection = (
-            ee.ImageCollection("COPERNICUS/S2_SR")
-            .filterBounds(geom_envelope)
-            .filterDate(str(run_start_date), str(run_end_date))
-            .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", 15))
-            .map(add_indices)
-        )
-
-        median_image = s2_collection.median()
-
-        m = geemap.Map(center=[gdf_merged.centroid.y.mean(), gdf_merged.centroid.x.mean()], zoom=13)
-
-        if index_type == "NDVI":
-            vis_params = {"bands": ["NDVI"], "min": 0, "max": 0.8, "palette": ["brown", "yellow", "green"]}
-            legend_title = "NDVI Médian"
-            legend_dict = {'0.1': 'brown', '0.3': 'yellow', '0.6': 'green', '0.8': 'green'}
-        else:
-            vis_params = {"bands": ["NDMI"], "min": -0.5, "max": 0.4, "palette": ["red", "yellow", "#00441b"]}
-            legend_title = "NDMI Médian (Humidité)"
-            legend_dict = {'-0.4': 'red', '0.0': 'yellow', '0.4': '#00441b'}
-
-        m.addLayer(median_image.select(index_type), vis_params, f'Image Médiane ({index_type})')
-        m.add_legend(title=legend_title, legend_dict=legend_dict)
-        m.add_gdf(gdf_merged, layer_name="Parcelles Viticoles")
+        carte_html = render_median_map_html(str(run_start_date), str(run_end_date), index_type, cle_carte,
+                                            gdf_merged, geom_envelope, centre_carte)
 
         with col_map2:
-            m.to_streamlit(height=600)
+            components.html(carte_html, height=600)
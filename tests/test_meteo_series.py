@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mildiou_prevention import MeteoSeries
+
+
+class TestSommesPluie(unittest.TestCase):
+    """Sommes de pluie aux seuils exacts : 3.4 + 8.6 mm doit valoir 12 mm, pas un lessivage à 12 mm"""
+
+    def test_somme_seuil_exact(self):
+        series = MeteoSeries({'2025-06-01': {'precipitation': 3.4}, '2025-06-02': {'precipitation': 8.6}})
+        pluie = series.somme('precipitation', '2025-06-01', '2025-06-02')
+        self.assertEqual(pluie, 12.0)
+        self.assertFalse(pluie > 12)
+
+    def test_somme_apres_cumul_anterieur(self):
+        # Un cumul préalable ne doit pas introduire de bruit d'arrondi dans la différence des sommes préfixes
+        meteo = {f'2025-05-{j:02d}': {'precipitation': 17.3} for j in range(1, 31)}
+        meteo.update({'2025-06-01': {'precipitation': 3.4}, '2025-06-02': {'precipitation': 8.6}})
+        series = MeteoSeries(meteo)
+        self.assertEqual(series.somme('precipitation', '2025-06-01', '2025-06-02'), 12.0)
+        debut, fin = np.array([30]), np.array([32])
+        np.testing.assert_array_equal(series.somme_indices('precipitation', debut, fin), [12.0])
+
+    def test_donnees_manquantes_ignorees(self):
+        series = MeteoSeries({'2025-06-01': {'precipitation': None}, '2025-06-02': {'precipitation': 2.5}, '2025-06-03': {}})
+        self.assertEqual(series.somme('precipitation', '2025-06-01', '2025-06-03'), 2.5)
+
+
+if __name__ == '__main__':
+    unittest.main()